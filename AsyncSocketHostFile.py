@@ -0,0 +1,131 @@
+import asyncio
+import struct
+import time
+
+from HostStatsFile import ClientStats
+
+from GameSchedulerFile import GameScheduler
+from OutboundQueueFile import OutboundQueue, frame_length
+from SocketHostFile import add_user, handle_message, handle_disconnect, simulation_step, send_step, port, \
+    user_dictionary, user_dictionary_lock, simulation_interval, send_interval, start_stats_server, start_recording, \
+    stop_recording, start_datagram_listener, tune_socket
+from SocketMessageIOFile import SocketMessageIO
+
+"""
+An alternative to running SocketHostFile directly: instead of one thread per connection plus a scheduler thread for
+the game loop, everything runs as tasks on a single asyncio event loop. The game itself (and the message format) is
+exactly the same - this file only replaces the parts that talk to the sockets.
+The connections and the game loop all run on the event loop's thread, so an idle connection costs a suspended
+coroutine rather than a thread, and this can hold thousands of connections. A few things still have threads of their
+own - the UDP listener, the stats server and the match recorder's writer - so user_dictionary_lock (and the other
+locks) are still needed, and are held only briefly, as they would block the whole event loop.
+"""
+
+listen_backlog = 1024  # how many not-yet-accepted connections the operating system will queue for us.
+writer_tasks = set()  # the event loop only keeps weak references to tasks, so we hold on to the writers here.
+
+
+class StreamConnection:
+    """
+    Wraps an asyncio StreamWriter so that the rest of the host can treat it like a socket when it needs to cut the
+    connection off (or see how full its send buffer is).
+    """
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    def shutdown(self, how: int) -> None:
+        self.writer.transport.abort()
+
+    def fileno(self) -> int:
+        sock = self.writer.get_extra_info("socket")
+        return -1 if sock is None else sock.fileno()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+async def listen_to_stream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    the asyncio equivalent of SocketHostFile.listen_to_connection: add the new user to the game, then handle each
+    message that comes from it until it disconnects.
+    :param reader: the stream to read messages from
+    :param writer: the stream to send messages to
+    :return: None
+    """
+    tune_socket(writer.get_extra_info("socket"))
+    connection = StreamConnection(writer)
+    connection_id = add_user(connection)
+    user_dictionary_lock.acquire()
+    outbox = user_dictionary[connection_id]["outbox"]
+    stats = user_dictionary[connection_id]["stats"]
+    user_dictionary_lock.release()
+    writer_task = asyncio.create_task(write_to_stream(writer, outbox, stats))
+    writer_tasks.add(writer_task)
+    writer_task.add_done_callback(writer_tasks.discard)
+    name = None
+    manager = SocketMessageIO()
+    while True:
+        try:
+            message_length = struct.unpack('>I', await reader.readexactly(4))[0]
+            message_type, message = manager.parse_message(await reader.readexactly(message_length))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            handle_disconnect(connection_id, name)
+            connection.close()
+            return
+
+        # if we got here, that means that we've received a message.
+        name = handle_message(manager, connection_id, name, message_type, message)
+
+
+async def write_to_stream(writer: asyncio.StreamWriter, outbox: OutboundQueue, stats: ClientStats = None) -> None:
+    """
+    the asyncio equivalent of SocketHostFile.write_to_connection: send whatever is put into the user's outbound queue,
+    until the queue is closed or the connection fails. Waiting for a slow connection to drain only pauses this task.
+    :param writer: the stream to send to
+    :param outbox: the user's outbound queue
+    :param stats: the user's ClientStats, to count what we send (and how long we wait for it to drain) in
+    :return: None
+    """
+    ready = asyncio.Event()
+    outbox.on_ready = ready.set  # (everything runs on the event loop's thread, so this is safe to call directly.)
+    ready.set()
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            frames = outbox.take_frames(block=False)
+            if len(frames) == 0:
+                if outbox.closed:
+                    break
+                continue
+            # all the pieces of all the frames go to the transport in one call.
+            writer.writelines([buffer for frame in frames for buffer in frame])
+            start = time.perf_counter_ns()
+            await writer.drain()
+            outbox.finished_sending()
+            if stats is not None:
+                stats.count_sent(len(frames), sum(frame_length(frame) for frame in frames),
+                                 time.perf_counter_ns() - start)
+    except ConnectionError:
+        pass
+    outbox.close()
+    writer.close()
+
+
+async def main() -> None:
+    server = await asyncio.start_server(listen_to_stream, host='', port=port, backlog=listen_backlog)
+    print("Socket is listening.")
+    async with server:
+        game_loop_scheduler = GameScheduler(simulation_step, send_step, simulation_interval=simulation_interval,
+                                            send_interval=send_interval)
+        start_recording()
+        start_stats_server(game_loop_scheduler)
+        start_datagram_listener()
+        try:
+            await asyncio.gather(server.serve_forever(), game_loop_scheduler.run_async())
+        finally:
+            stop_recording()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,280 @@
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import PlayerShipFile
+import SocketClientFile as client
+import SocketHostFile as host
+from EntityRecordFile import BULLET
+from EntityStoreFile import ShipStore, BulletStore
+from RecordCacheFile import RecordCache
+from SnapshotTrackerFile import SnapshotTracker
+from SocketMessageIOFile import SocketMessageIO, MessageType, Protocol
+from WorldRegistryFile import WorldRegistry
+
+"""
+Benchmarks for the host's game loop and the code that turns the world into messages (and back again on the client).
+Everything runs in this process, on the real functions in SocketHostFile, without any sockets: the host's world is
+filled with the given numbers of players and bullets, and each benchmark calls one function over and over, putting
+the world back the way it was (e.g., replacing bullets that have hit something) between calls, outside the timing.
+The users are a mix of the kinds of client the host supports: text and binary protocol, each with and without delta
+snapshots. Their outbound queues are emptied, and their delta snapshots acknowledged, between calls.
+The results can be saved as JSON, and compared with an earlier run:
+    python BenchmarkFile.py --players 10,50 --bullets 100,1000 --output baseline.json
+    ... change something ...
+    python BenchmarkFile.py --players 10,50 --bullets 100,1000 --baseline baseline.json
+which lists every benchmark that has slowed down by more than the tolerance, and exits with status 1 if there are any.
+"""
+
+memory_iterations = 5  # how many calls to measure peak memory over. (tracemalloc is slow, so it isn't timed.)
+user_kinds = [(Protocol.TEXT, False), (Protocol.BINARY, False), (Protocol.TEXT, True), (Protocol.BINARY, True)]
+
+
+class BenchmarkConnection:
+    """
+    stands in for a user's socket; the host only ever calls shutdown() and close() on it directly.
+    """
+    def shutdown(self, how: int) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def build_world(num_players: int, num_bullets: int) -> None:
+    """
+    empties the host's world and fills it with the given numbers of players and bullets, in the same places every time.
+    The players are moving and turning, but not firing (so the number of bullets stays the same), and the bullets live
+    for ever, unless they hit something.
+    :return: None
+    """
+    random.seed(2022)
+    PlayerShipFile.rng.seed(2022)  # the ships pick their starting places with this one.
+    host.user_dictionary.clear()
+    host.world = WorldRegistry()
+    host.departed_ships.clear()
+    host.items_to_delete = []
+    host.record_cache = RecordCache()
+    host.world_tick = 0
+    host.simulation_steps = 0
+    if host.use_entity_store:
+        host.ship_store = ShipStore()
+        host.bullet_store = BulletStore()
+
+    for index in range(num_players):
+        user_id = host.add_user(BenchmarkConnection())
+        user = host.user_dictionary[user_id]
+        user["name"] = f"player{user_id}"
+        user["protocol"], uses_delta = user_kinds[index % len(user_kinds)]
+        user["outbox"].protocol = user["protocol"]
+        if uses_delta:
+            user["snapshot_tracker"] = SnapshotTracker()
+        ship = user["PlayerShip"]
+        ship.name = user["name"]
+        ship.controls = random.choice([1, 2, 8, 9, 10, 4])
+    top_up_bullets(num_bullets)
+
+
+def top_up_bullets(num_bullets: int) -> None:
+    """
+    adds bullets, heading in random directions from random places, until there are num_bullets of them.
+    :return: None
+    """
+    while host.world.count_of_kind(BULLET) < num_bullets:
+        bullet_id = host.world.allocate_id(host.world_tick)
+        bearing = random.random() * 2 * math.pi
+        bullet = host.make_bullet(x=random.random() * host.world_size, y=random.random() * host.world_size,
+                                  vx=85 * math.cos(bearing), vy=85 * math.sin(bearing), owner_id=0,
+                                  bullet_id=bullet_id, lifetime=1e9)
+        host.world.add(BULLET, bullet_id, bullet)
+
+
+def clear_deletions() -> None:
+    """
+    forgets the objects that have been removed from the world since the last call, the way send_step() would.
+    :return: None
+    """
+    host.release_deleted_items()
+
+
+def drain_outboxes() -> None:
+    """
+    throws away everything waiting to go to the users, and acknowledges the latest snapshot for those who get deltas.
+    :return: None
+    """
+    for user_id, user in host.user_dictionary.items():
+        user["outbox"].take_frames(block=False)
+        if user["snapshot_tracker"] is not None:
+            host.acknowledge_snapshot(user_id, host.world_tick)
+
+
+def measure(operation: Callable, prepare: Callable, iterations: int, repeats: int) -> Dict:
+    """
+    times operation(), calling prepare() (untimed) before each call.
+    :param operation: the code to time
+    :param prepare: puts things back the way they should be for the next call
+    :param iterations: how many calls to time in each repeat
+    :param repeats: how many times to repeat them - the fastest repeat is the one reported, as it is the one least
+    disturbed by whatever else the computer was doing.
+    :return: a dictionary with the nanoseconds per call and the peak memory allocated during a call, in bytes.
+    """
+    best = None
+    for repeat in range(repeats):
+        total = 0
+        for iteration in range(iterations):
+            prepare()
+            start = time.perf_counter_ns()
+            operation()
+            total += time.perf_counter_ns() - start
+        if best is None or total < best:
+            best = total
+
+    peak = 0
+    tracemalloc.start()
+    for iteration in range(memory_iterations):
+        prepare()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        operation()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return {"ns_per_op": best / iterations, "peak_memory_bytes": peak}
+
+
+def run_benchmarks(num_players: int, num_bullets: int, iterations: int, repeats: int) -> List[Dict]:
+    """
+    runs every benchmark on a world of the given size.
+    :return: a list of results, one per benchmark.
+    """
+    def nothing():
+        pass
+
+    def before_tick():
+        top_up_bullets(num_bullets)
+        drain_outboxes()
+        host.last_update = time.time() - host.simulation_interval  # so each game_loop_step is one normal step.
+
+    def before_bullet_step():
+        top_up_bullets(num_bullets)
+        clear_deletions()
+
+    def before_send():
+        host.simulation_step(host.simulation_interval)  # so there's something new to send.
+        top_up_bullets(num_bullets)
+        drain_outboxes()
+
+    benchmarks = [("game_loop_step", host.game_loop_step, before_tick),
+                  ("manage_step_for_users", lambda: host.manage_step_for_users(host.simulation_interval), nothing),
+                  ("manage_step_for_bullets", lambda: host.manage_step_for_bullets(host.simulation_interval),
+                   before_bullet_step),
+                  ("check_for_bullet_player_collisions", host.check_for_bullet_player_collisions,
+                   lambda: top_up_bullets(num_bullets)),
+                  ("send_step", host.send_step, before_send)]
+
+    # the messages for the whole world, as the host would build them, for the framing and client benchmarks.
+    build_world(num_players, num_bullets)
+    manager = SocketMessageIO()
+    world_objects = host.world.all_entities()
+    for protocol in (Protocol.TEXT, Protocol.BINARY):
+        records = host.describe_items(world_objects, protocol)
+        frame = manager.build_frame(records, MessageType.WORLD_UPDATE, protocol)
+        parser = SocketMessageIO(protocol)
+        body = frame[4:]
+        payload = parser.parse_message(body)[1]
+        name = protocol.name.lower()
+        benchmarks.append((f"build_frame_{name}",
+                           lambda records=records, protocol=protocol:
+                           manager.build_frame(records, MessageType.WORLD_UPDATE, protocol), nothing))
+        benchmarks.append((f"parse_message_{name}", lambda parser=parser, body=body: parser.parse_message(body),
+                           nothing))
+        benchmarks.append((f"client_handle_world_update_{name}",
+                           lambda payload=payload: client.handle_world_update(payload), nothing))
+
+    results = []
+    num_entities = max(num_players + num_bullets, 1)
+    for name, operation, prepare in benchmarks:
+        build_world(num_players, num_bullets)
+        result = measure(operation, prepare, iterations, repeats)
+        result.update({"name": name, "players": num_players, "bullets": num_bullets, "iterations": iterations,
+                       "ops_per_second": 1e9 / result["ns_per_op"] if result["ns_per_op"] > 0 else 0.0,
+                       "ns_per_entity": result["ns_per_op"] / num_entities})
+        results.append(result)
+        print(f"{name:40s} {num_players:5d} players {num_bullets:6d} bullets: {result['ns_per_op'] / 1000:10.1f} µs/op "
+              f"{result['ops_per_second']:10.1f} ops/s {result['ns_per_entity']:8.1f} ns/entity "
+              f"{result['peak_memory_bytes'] / 1024:9.1f} KiB peak")
+    return results
+
+
+def result_key(result: Dict) -> str:
+    return f"{result['name']}[players={result['players']},bullets={result['bullets']}]"
+
+
+def compare_with_baseline(results: List[Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """
+    prints how each result compares with the same benchmark in the baseline.
+    :param results: the results of this run
+    :param baseline: the contents of an earlier run's JSON output
+    :param tolerance: how much slower (as a fraction) a benchmark can get before it counts as a regression
+    :return: the keys of the benchmarks that have regressed.
+    """
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    print("\nCompared with the baseline:")
+    for result in results:
+        key = result_key(result)
+        if key not in baseline_results:
+            print(f"{key:75s}      (not in baseline)")
+            continue
+        ratio = result["ns_per_op"] / baseline_results[key]["ns_per_op"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  <-- REGRESSION"
+            regressions.append(key)
+        print(f"{key:75s} {ratio:6.2f}x the time{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the host's game loop and the message code.")
+    parser.add_argument("--players", default="10,50", help="comma-separated numbers of players to try")
+    parser.add_argument("--bullets", default="100,1000", help="comma-separated numbers of bullets to try")
+    parser.add_argument("--iterations", type=int, default=50, help="calls to time per repeat")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--interest-radius", type=float,
+                        help="turn on the host's interest management with this radius, for the whole-tick benchmarks")
+    parser.add_argument("--entity-store", choices=["on", "off"],
+                        help="override the host's use_entity_store (it needs NumPy to be on)")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results with this earlier JSON output")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="how much slower a benchmark may get before it is a regression (0.10 = 10%%)")
+    args = parser.parse_args()
+    if args.interest_radius is not None:
+        host.interest_radius = args.interest_radius
+    if args.entity_store is not None:
+        host.use_entity_store = args.entity_store == "on"
+
+    all_results = []
+    for num_players in [int(value) for value in args.players.split(",")]:
+        for num_bullets in [int(value) for value in args.bullets.split(",")]:
+            all_results.extend(run_benchmarks(num_players, num_bullets, args.iterations, args.repeats))
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "use_entity_store": host.use_entity_store, "interest_radius": host.interest_radius,
+                       "results": all_results}, output_file, indent=2)
+        print(f"Saved the results to {args.output}.")
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            found_regressions = compare_with_baseline(all_results, json.load(baseline_file), args.tolerance)
+        if len(found_regressions) > 0:
+            print(f"{len(found_regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}.")
+            sys.exit(1)
@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import math
+import random
+import struct
+import time
+from typing import List
+
+from SocketMessageIOFile import SocketMessageIO, MessageType, Protocol, DELTA_FEATURE
+from WireFormatFile import PROTOCOL_VERSION
+
+"""
+A headless load tester for the host: it opens more and more bot connections to it, each behaving like a (rather
+twitchy) player - it sends its name, changes which keys it is holding every so often (firing a lot), chats now and
+then, and reads everything the host sends back. After each step of the ramp, it reports how well the host is keeping
+up: how many messages and bytes each bot is receiving per second, how regularly the world snapshots are arriving and
+how many connections have failed. When the snapshots start arriving late or not at all, we have found how many
+players the host can handle.
+Every bot runs as a task on one asyncio event loop, so a single process can run thousands of them.
+Run it with, e.g., "python BotSwarmFile.py --start 10 --step 10 --max-bots 200".
+"""
+
+host_URL = '127.0.0.1'
+port = 3001
+snapshot_interval = 0.02  # how often the host is meant to send the world (its send_interval).
+breakdown_fraction = 0.8  # if bots get fewer than this fraction of the snapshots they should, the host is struggling.
+key_change_interval = (0.1, 1.0)  # each bot changes its keys after a random number of seconds in this range...
+fire_probability = 0.5  # ... holding the fire key this often...
+chat_interval = 5.0  # ... and sends a chat message about this often.
+connect_timeout = 5.0
+
+WORLD_MESSAGE_TYPES = (MessageType.WORLD_UPDATE, MessageType.WORLD_DELTA)
+
+
+class BotStats:
+    """
+    What one bot has seen since the last report. (The report reads and resets the counts with take_window().)
+    """
+    def __init__(self):
+        self.connected = False
+        self.failed = False  # the bot couldn't connect, or the connection broke while the test was running.
+        self.messages = 0
+        self.bytes = 0
+        self.snapshots = 0
+        self.last_snapshot_time = None
+        # the gaps between consecutive snapshots: how many, their total and total of squares, and the longest.
+        self.gap_count = 0
+        self.gap_sum = 0.0
+        self.gap_sum_of_squares = 0.0
+        self.longest_gap = 0.0
+
+    def count_message(self, message_type: MessageType, num_bytes: int, now: float) -> None:
+        """
+        notes that the bot has received a message.
+        :param message_type: the type of the message
+        :param num_bytes: how many bytes it took up on the wire, including its length prefix
+        :param now: when it arrived (by time.monotonic())
+        :return: None
+        """
+        self.messages += 1
+        self.bytes += num_bytes
+        if message_type not in WORLD_MESSAGE_TYPES:
+            return
+        self.snapshots += 1
+        if self.last_snapshot_time is not None:
+            gap = now - self.last_snapshot_time
+            self.gap_count += 1
+            self.gap_sum += gap
+            self.gap_sum_of_squares += gap * gap
+            self.longest_gap = max(self.longest_gap, gap)
+        self.last_snapshot_time = now
+
+    def take_window(self) -> tuple:
+        """
+        :return: (messages, bytes, snapshots, gap count, gap sum, gap sum of squares, longest gap) since the last call,
+        and starts counting again from zero.
+        """
+        window = (self.messages, self.bytes, self.snapshots, self.gap_count, self.gap_sum, self.gap_sum_of_squares,
+                  self.longest_gap)
+        self.messages = self.bytes = self.snapshots = self.gap_count = 0
+        self.gap_sum = self.gap_sum_of_squares = self.longest_gap = 0.0
+        return window
+
+
+async def run_bot(bot_number: int, stats: BotStats, use_binary: bool, use_delta: bool, stop: asyncio.Event) -> None:
+    """
+    connects one bot to the host and plays until stop is set (or the connection fails).
+    :param bot_number: used to give the bot its name
+    :param stats: where to record what the bot receives
+    :param use_binary: ask for the binary protocol
+    :param use_delta: ask for delta snapshots (which the bot acknowledges, like the real client)
+    :param stop: set when the test is over
+    :return: None
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host_URL, port), connect_timeout)
+    except (OSError, asyncio.TimeoutError):
+        stats.failed = True
+        return
+    stats.connected = True
+    manager = SocketMessageIO()
+    sender = None
+    try:
+        if use_binary or use_delta:
+            # like the client, we wait for the host's answer before sending anything else, as the host switches
+            # protocols as soon as it reads the request.
+            features = [DELTA_FEATURE] if use_delta else []
+            requested_protocol = Protocol.BINARY if use_binary else Protocol.TEXT
+            writer.write(manager.build_frame("\t".join([requested_protocol.name, str(PROTOCOL_VERSION)] + features),
+                                             MessageType.PROTOCOL))
+            message_type = None
+            while message_type != MessageType.PROTOCOL:
+                message_length = struct.unpack('>I', await reader.readexactly(4))[0]
+                message_type, message = manager.parse_message(await reader.readexactly(message_length))
+            manager.protocol = Protocol[message.split("\t")[0]]
+        writer.write(manager.build_frame(f"bot{bot_number}"))
+        sender = asyncio.create_task(send_inputs(writer, manager, stop))
+
+        while not stop.is_set():
+            message_length = struct.unpack('>I', await reader.readexactly(4))[0]
+            message_type, message = manager.parse_message(await reader.readexactly(message_length))
+            stats.count_message(message_type, message_length + 4, time.monotonic())
+            if message_type == MessageType.WORLD_DELTA:
+                tick = struct.unpack_from('>I', message)[0] if isinstance(message, bytes) else \
+                    int(message[:message.find("\t")])
+                writer.write(manager.build_frame(tick, MessageType.ACK))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        if not stop.is_set():
+            stats.failed = True
+    stats.connected = False
+    if sender is not None:
+        sender.cancel()
+    writer.close()
+
+
+async def send_inputs(writer: asyncio.StreamWriter, manager: SocketMessageIO, stop: asyncio.Event) -> None:
+    """
+    every so often, hold down a new random set of keys (and sometimes chat), the way the client would send them.
+    :param writer: the bot's connection to the host
+    :param manager: the bot's SocketMessageIO
+    :param stop: set when the test is over
+    :return: None
+    """
+    input_sequence = 0
+    next_chat = time.monotonic() + random.uniform(0, 2 * chat_interval)
+    try:
+        while not stop.is_set():
+            await asyncio.sleep(random.uniform(*key_change_interval))
+            input_sequence += 1
+            key_status = random.randrange(16) | (16 if random.random() < fire_probability else 0)
+            writer.write(manager.build_frame(f"{input_sequence}\t{key_status}", MessageType.KEY_STATUS))
+            if time.monotonic() >= next_chat:
+                writer.write(manager.build_frame(f"message {input_sequence} from a bot"))
+                next_chat += random.uniform(0, 2 * chat_interval)
+            await writer.drain()
+    except ConnectionError:
+        pass
+
+
+def report(bots: List[BotStats], window: float, failures_so_far: int) -> bool:
+    """
+    prints one line summing up what the connected bots have received since the last report.
+    :param bots: the stats of every bot started so far
+    :param window: how many seconds since the last report
+    :param failures_so_far: how many bots had already failed at the last report
+    :return: True if the host looks like it is struggling - the bots are getting too few snapshots, or connections
+    have started failing.
+    """
+    connected = [bot for bot in bots if bot.connected]
+    failures = sum(1 for bot in bots if bot.failed)
+    windows = [bot.take_window() for bot in connected]
+    if len(windows) == 0:
+        print(f"{len(bots):6d} bots:    none connected, {failures} failed")
+        return True
+    messages, num_bytes, snapshots, gap_count, gap_sum, gap_sum_of_squares, _ = [sum(values) for values in zip(*windows)]
+    longest_gap = max(window_values[6] for window_values in windows)
+    slowest_snapshot_rate = min(window_values[2] for window_values in windows) / window
+    mean_gap = gap_sum / gap_count if gap_count > 0 else 0.0
+    jitter = math.sqrt(max(gap_sum_of_squares / gap_count - mean_gap * mean_gap, 0.0)) if gap_count > 0 else 0.0
+    snapshot_rate = snapshots / len(windows) / window
+    print(f"{len(bots):6d} bots: {len(connected):6d} connected {failures:5d} failed | per bot: "
+          f"{messages / len(windows) / window:7.1f} msg/s {num_bytes / len(windows) / window / 1024:8.1f} KiB/s "
+          f"{snapshot_rate:6.1f} snapshots/s (slowest {slowest_snapshot_rate:5.1f}) | snapshot gap "
+          f"{mean_gap * 1000:6.1f} ms, jitter {jitter * 1000:6.1f} ms, worst {longest_gap * 1000:7.1f} ms")
+    return snapshot_rate < breakdown_fraction / snapshot_interval or failures > failures_so_far
+
+
+async def ramp(start: int, step: int, max_bots: int, step_duration: float, use_binary: bool, use_delta: bool) -> None:
+    """
+    starts with the given number of bots and adds more after each step_duration, reporting at the end of each step,
+    until there are max_bots of them (or the host has clearly broken down).
+    :return: None
+    """
+    stop = asyncio.Event()
+    bots: List[BotStats] = []
+    tasks = []
+    struggling_steps = 0
+    while True:
+        target = start if len(bots) == 0 else min(len(bots) + step, max_bots)
+        while len(bots) < target:
+            stats = BotStats()
+            bots.append(stats)
+            tasks.append(asyncio.create_task(run_bot(len(bots), stats, use_binary, use_delta, stop)))
+        await asyncio.sleep(step_duration / 2)  # let the new bots settle in before we start measuring...
+        for bot in bots:
+            bot.take_window()
+        failures = sum(1 for bot in bots if bot.failed)
+        await asyncio.sleep(step_duration / 2)
+        if report(bots, step_duration / 2, failures):
+            struggling_steps += 1
+            if struggling_steps == 1:
+                print(f"The host is falling behind with {len(bots)} bots.")
+        if len(bots) >= max_bots or struggling_steps >= 3:
+            break
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ramp up a swarm of bot players against the host.")
+    parser.add_argument("--host", default=host_URL)
+    parser.add_argument("--port", type=int, default=port)
+    parser.add_argument("--start", type=int, default=10, help="how many bots to start with")
+    parser.add_argument("--step", type=int, default=10, help="how many bots to add at each step")
+    parser.add_argument("--max-bots", type=int, default=200)
+    parser.add_argument("--step-duration", type=float, default=10.0, help="seconds per step")
+    parser.add_argument("--text", action="store_true", help="use the text protocol, rather than binary")
+    parser.add_argument("--no-delta", action="store_true", help="ask for whole snapshots, rather than deltas")
+    args = parser.parse_args()
+    host_URL = args.host
+    port = args.port
+    asyncio.run(ramp(args.start, args.step, args.max_bots, args.step_duration, not args.text, not args.no_delta))
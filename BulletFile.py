@@ -1,7 +1,25 @@
+from WireFormatFile import pack_bullet
+
+
+def bullet_public_info(bullet_id: int, x: float, y: float, owner_id: int) -> str:
+    """
+    :return: the public_info of a bullet with these values. (The host's RecordCache uses this directly for the bullets
+    in the entity store, without going through the bullets themselves.)
+    """
+    return f"BULLET\t{bullet_id}\t{x}\t{y}\t{owner_id}"
+
 
 class Bullet:
+    __slots__ = ("x", "y", "vx", "vy", "owner_id", "bullet_id", "lifetime")
 
     def __init__(self, x:float, y:float, vx:float, vy:float, owner_id:int, bullet_id:int, lifetime:float):
+        self.reset(x, y, vx, vy, owner_id, bullet_id, lifetime)
+
+    def reset(self, x: float, y: float, vx: float, vy: float, owner_id: int, bullet_id: int, lifetime: float) -> None:
+        """
+        (re)starts this bullet as a new shot. (The host reuses bullets that have expired, rather than making new ones.)
+        :return: None
+        """
         self.x = x
         self.y = y
         self.vx = vx
@@ -10,8 +28,17 @@ class Bullet:
         self.bullet_id = bullet_id
         self.lifetime = lifetime
 
+    def public_state(self) -> tuple:
+        """
+        :return: everything that goes into this bullet's public_info, so that we can tell whether it has changed.
+        """
+        return self.x, self.y, self.owner_id
+
     def public_info(self) -> str:
-        return f"BULLET\t{self.bullet_id}\t{self.x}\t{self.y}\t{self.owner_id}"
+        return bullet_public_info(self.bullet_id, self.x, self.y, self.owner_id)
+
+    def binary_info(self) -> bytes:
+        return pack_bullet(self.bullet_id, self.x, self.y, self.owner_id)
 
     def __repr__(self):
         return f"BULLET\t{self.bullet_id=}\t{self.x=}\t{self.y=}\t{self.vx=}\t{self.vy=}\t{self.owner_id=}\t{self.lifetime=}"
@@ -4,7 +4,9 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import simpledialog
 from tkinter.scrolledtext import ScrolledText
-from typing import List
+from typing import Dict, List
+
+from EntityRecordFile import EntityRecord, PLAYER, BULLET
 
 LEFT_MASK = 1
 RIGHT_MASK = 2
@@ -24,10 +26,11 @@ class ClientGUI:
         self.key_status = 0
         self.setup_key_listening()
 
-        # these are two additional methods (yes, really!) that will be set by an external class so that we can call them
-        # from inside this class once they have been set. But for now, they're None.
+        # these are three additional methods (yes, really!) that will be set by an external class so that we can call
+        # them from inside this class once they have been set. But for now, they're None.
         self.shut_down_socket = None
         self.tell_my_client_to_send_message = None
+        self.tell_my_client_key_status_changed = None
 
 
     def setup_key_listening(self) -> None:
@@ -46,35 +49,48 @@ class ClientGUI:
         self.root.bind("<KeyPress-space>", self.space_pressed)
         self.root.bind("<KeyRelease-space>", self.space_released)
 
+    def set_key_status(self, new_key_status: int) -> None:
+        """
+        records which keys are being held and, if that has changed, tells the client right away. (Holding a key down
+        makes the keyboard repeat the "pressed" event, so most of these calls don't change anything.)
+        :param new_key_status: an int with binary flags indicating whether left, right, up, down, fire keys are held.
+        :return: None
+        """
+        if new_key_status == self.key_status:
+            return
+        self.key_status = new_key_status
+        if self.tell_my_client_key_status_changed is not None:
+            self.tell_my_client_key_status_changed(new_key_status)
+
     def a_pressed(self, event_info):
-        self.key_status = self.key_status | LEFT_MASK
+        self.set_key_status(self.key_status | LEFT_MASK)
 
     def a_released(self, event_info):
-        self.key_status = self.key_status & (255 - LEFT_MASK)
+        self.set_key_status(self.key_status & (255 - LEFT_MASK))
 
     def d_pressed(self, event_info):
-        self.key_status = self.key_status | RIGHT_MASK
+        self.set_key_status(self.key_status | RIGHT_MASK)
 
     def d_released(self, event_info):
-        self.key_status = self.key_status & (255 - RIGHT_MASK)
+        self.set_key_status(self.key_status & (255 - RIGHT_MASK))
 
     def s_pressed(self, event_info):
-        self.key_status = self.key_status | BACK_MASK
+        self.set_key_status(self.key_status | BACK_MASK)
 
     def s_released(self, event_info):
-        self.key_status = self.key_status & (255 - BACK_MASK)
+        self.set_key_status(self.key_status & (255 - BACK_MASK))
 
     def w_pressed(self, event_info):
-        self.key_status = self.key_status | FORWARD_MASK
+        self.set_key_status(self.key_status | FORWARD_MASK)
 
     def w_released(self, event_info):
-        self.key_status = self.key_status & (255 - FORWARD_MASK)
+        self.set_key_status(self.key_status & (255 - FORWARD_MASK))
 
     def space_pressed(self, event_info):
-        self.key_status = self.key_status | FIRE_MASK
+        self.set_key_status(self.key_status | FIRE_MASK)
 
     def space_released(self, event_info):
-        self.key_status = self.key_status & (255 - FIRE_MASK)
+        self.set_key_status(self.key_status & (255 - FIRE_MASK))
 
 
     def build_GUI_elements(self) -> None:
@@ -113,6 +129,11 @@ class ClientGUI:
         # This is where the graphics will go...
         self.world_canvas = tk.Canvas(self.root, width = 800, height = 800, background = "black")
         self.world_canvas.grid(column=1, row=0, sticky="nw")
+        # the canvas items for each object on screen, keyed on the object's id number, so we don't have to search the
+        # canvas for them. Bullets that have gone are hidden and kept in free_bullet_items, to be reused.
+        self.player_items: Dict[int, Dict] = {}
+        self.bullet_items: Dict[int, int] = {}
+        self.free_bullet_items: List[int] = []
 
 
     def run_loop(self) -> None:
@@ -178,84 +199,101 @@ class ClientGUI:
             self.tell_my_client_to_send_message(message)
             self.user_entry_string.set("")
 
-    def update_world(self, world_list) -> None:
+    def update_world(self, world_list: List[EntityRecord]) -> None:
         """
         refreshes the screen with the information for each object in the world list.
-        :param world_list: a list of the public_info dictionary for each item on screen.
+        :param world_list: the EntityRecord of each item on screen, with its draw position worked out.
         :return: None
         """
         # self.world_canvas.delete("all")
         for item in world_list:
-            if item["type"] == "PLAYER":
+            if item.kind == PLAYER:
                 self.draw_player(item)
-            elif item["type"] == "BULLET":
+            elif item.kind == BULLET:
                 self.draw_bullet(item)
 
-    def draw_bullet(self, item) -> None:
+    def draw_bullet(self, item: EntityRecord) -> None:
         """
-        creates or updates the information for a bullet on screen.
-        :param item: a dictionary of information about this particular bullet.
+        creates or updates the information for a bullet on screen. A new bullet reuses a canvas item from the
+        free_bullet_items pool, if there is one, rather than creating another.
+        :param item: the record of this particular bullet.
         :return: None
         """
-        tag = f"BULLET{item['id']}"
-        x = int(float(item["x"]))
-        y = int(float(item["y"]))
-        if len(self.world_canvas.find_withtag(tag)) == 0:
-            self.world_canvas.create_oval(x - 2, y - 2, x + 2, y + 2, fill="white", outline="", tag=tag)
+        bullet_id = item.id
+        x = int(item.draw_x)
+        y = int(item.draw_y)
+        canvas_item = self.bullet_items.get(bullet_id)
+        if canvas_item is None:
+            if len(self.free_bullet_items) > 0:
+                canvas_item = self.free_bullet_items.pop()
+                self.world_canvas.coords(canvas_item, x - 2, y - 2, x + 2, y + 2)
+                self.world_canvas.itemconfig(canvas_item, state="normal")
+            else:
+                canvas_item = self.world_canvas.create_oval(x - 2, y - 2, x + 2, y + 2, fill="white", outline="")
+            self.bullet_items[bullet_id] = canvas_item
         else:
-            self.world_canvas.coords(tag, x - 2, y - 2, x + 2, y + 2)
+            self.world_canvas.coords(canvas_item, x - 2, y - 2, x + 2, y + 2)
 
-    def draw_player(self, item) -> None:
+    def draw_player(self, item: EntityRecord) -> None:
         """
         creates or updates the information for a player on screen.
-        :param item: a dictionary of information about this particular player.
+        :param item: the record of this particular player.
         :return: None
         """
-        user_id = int(item["id"])
-        x = int(float(item["x"]))
-        y = int(float(item["y"]))
-        bearing = float(item["bearing"])
-        is_thrusting = item["thrusting"]
+        user_id = item.id
+        x = int(item.draw_x)
+        y = int(item.draw_y)
+        bearing = item.draw_bearing
+        is_thrusting = item.thrusting
 
-        health = int(item["health"])
+        health = item.health
         bar_length = int(health*25/100)
-        # construct tag used to identify the object in the canvas
-        tag = f"PLAYER{user_id}"
-        # find the object, if it exists.
-        my_ship_list = self.world_canvas.find_withtag(tag)
-        if len(my_ship_list) == 0: # if nothing with the tag exists on screen, make it.
-            self.world_canvas.create_line(x, y, int(x - 5*math.cos(bearing)), int(y- 5 * math.sin(bearing)),
-                                          fill="black", width=1, arrow='last', arrowshape=(4, 6, 2),
-                                          tag=tag+"thrust")
+        # find the canvas items for this player, if they exist.
+        player = self.player_items.get(user_id)
+        if player is None: # if this player isn't on screen yet, make it.
+            player = {}
+            player["thrust"] = self.world_canvas.create_line(x, y, int(x - 5*math.cos(bearing)),
+                                                             int(y - 5 * math.sin(bearing)),
+                                                             fill="black", width=1, arrow='last', arrowshape=(4, 6, 2))
             # ship arrow
-            self.world_canvas.create_line(x, y, int(x + 5 * math.cos(bearing)), int(y + 5 * math.sin(bearing)),
-                                          fill=item['color'], width=2, arrow='last', arrowshape=(7, 11, 5),
-                                          tag=tag)
+            player["ship"] = self.world_canvas.create_line(x, y, int(x + 5 * math.cos(bearing)),
+                                                           int(y + 5 * math.sin(bearing)),
+                                                           fill=item.color, width=2, arrow='last',
+                                                           arrowshape=(7, 11, 5))
             # name
-            self.world_canvas.create_text(x, y-15, text=item["name"], justify='center', tag=tag+"name", fill="white")
+            player["name"] = self.world_canvas.create_text(x, y-15, text=item.name, justify='center', fill="white")
             # healthbar
-            self.world_canvas.create_line(x-bar_length/2, y+10, x+bar_length/2, y+10, tag=tag+"health", fill="green")
-        else: # we found the item by its tag, so modify it, instead of recreating it.
-            self.world_canvas.coords(tag+"thrust", x, y,
+            player["health"] = self.world_canvas.create_line(x-bar_length/2, y+10, x+bar_length/2, y+10, fill="green")
+            # the current values of the properties we might need to change, so we only change them when they do.
+            player["thrust_fill"] = "black"
+            player["health_fill"] = "green"
+            player["name_text"] = item.name
+            self.player_items[user_id] = player
+        else: # we found the player's items, so modify them, instead of recreating them.
+            self.world_canvas.coords(player["thrust"], x, y,
                                      int(x - 8 * math.cos(bearing)),
                                      int(y - 8 * math.sin(bearing)))
-            self.world_canvas.coords(my_ship_list[0], x, y,
+            self.world_canvas.coords(player["ship"], x, y,
                                      int(x + 5 * math.cos(bearing)),
                                      int(y + 5 * math.sin(bearing)))
 
-            self.world_canvas.coords(tag+"name", x, y-15)
-            self.world_canvas.coords(tag+"health", x-bar_length/2, y+10, x+bar_length/2, y+10)
+            self.world_canvas.coords(player["name"], x, y-15)
+            self.world_canvas.coords(player["health"], x-bar_length/2, y+10, x+bar_length/2, y+10)
+            if item.name != player["name_text"]:
+                self.world_canvas.itemconfig(player["name"], text=item.name)
+                player["name_text"] = item.name
             # update healthbar color, based on health
-            if health < 20:
-                self.world_canvas.itemconfig(tag+"health", fill="red")
-            else:
-                self.world_canvas.itemconfig(tag + "health", fill="green")
-            # update color of thruster ship, based on whether ship is thrusting.
+            health_fill = "red" if health < 20 else "green"
+            if health_fill != player["health_fill"]:
+                self.world_canvas.itemconfig(player["health"], fill=health_fill)
+                player["health_fill"] = health_fill
+            # update color of thruster ship, based on whether ship is thrusting. (While it is, the flame flickers.)
             if is_thrusting:
-                self.world_canvas.itemconfig(tag+ "thrust", fill= "#" + \
-                    f"FF{random.randrange(64, 255):02X}00")
-            else:
-                self.world_canvas.itemconfig(tag+ "thrust", fill="black")
+                player["thrust_fill"] = "#" + f"FF{random.randrange(64, 255):02X}00"
+                self.world_canvas.itemconfig(player["thrust"], fill=player["thrust_fill"])
+            elif player["thrust_fill"] != "black":
+                self.world_canvas.itemconfig(player["thrust"], fill="black")
+                player["thrust_fill"] = "black"
 
     def delete_item_from_world(self, item_type: str, object_id: int) -> None:
         """
@@ -268,12 +306,13 @@ class ClientGUI:
         if item_type == "PLAYER":
             # the player is actually several things - the ship, the name, the healthbar, the thruster - and we need to
             #  remove them all from the world_canvas
-            tag = f"PLAYER{object_id}"
-            self.world_canvas.delete(tag)
-            self.world_canvas.delete(tag+"name")
-            self.world_canvas.delete(tag+"thrust")
-            self.world_canvas.delete(tag+"health")
+            player = self.player_items.pop(object_id, None)
+            if player is not None:
+                for part in ("ship", "name", "thrust", "health"):
+                    self.world_canvas.delete(player[part])
         if item_type == "BULLET":
-            # a bullet is much simpler to delete.
-            tag = f"BULLET{object_id}"
-            self.world_canvas.delete(tag)
+            # a bullet is much simpler - we just hide it, and keep it to reuse for the next new bullet.
+            canvas_item = self.bullet_items.pop(object_id, None)
+            if canvas_item is not None:
+                self.world_canvas.itemconfig(canvas_item, state="hidden")
+                self.free_bullet_items.append(canvas_item)
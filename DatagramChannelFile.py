@@ -0,0 +1,127 @@
+import random
+import secrets
+import socket
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from OutboundQueueFile import LATEST_WINS_TYPES
+from SocketMessageIOFile import MessageType
+
+"""
+An unreliable (UDP) channel that runs alongside a user's TCP connection, for the messages where only the newest one
+matters: world snapshots from the host, and key status (and ACKs) from the client. Over TCP, one lost segment holds up
+everything behind it until it has been resent, even though by then there is a newer snapshot anyway; over UDP, a lost
+snapshot is simply replaced by the next one.
+Each datagram holds one message, just as it would be framed over TCP but without the length prefix, after a header:
+    session token (8 bytes), sequence number (4 bytes)
+The session token is a random number the host gives the client over TCP (in a DATAGRAM_SESSION message), so nobody else
+can send input for that user. Each type of message is numbered separately, in the order they were sent; a gap in the
+numbers means that datagrams were lost on the way. A receiver throws away a world message that arrives after a newer
+one ("latest wins"), but everything else (key status, ACKs) is always delivered - those are safe to apply late, or
+twice.
+Chat, user lists, deletions and everything else stay on TCP.
+"""
+
+datagram_header_struct = struct.Struct('>QI')
+max_datagram_size = 60 * 1024  # a message bigger than this (header included) is sent over TCP instead.
+simulated_loss = 0.0  # for testing: the fraction of datagrams that are thrown away instead of being sent.
+
+
+def new_session_token() -> int:
+    return secrets.randbits(64)
+
+
+def read_datagram_header(data) -> Tuple[int, int]:
+    """
+    :param data: a datagram that has arrived (at least datagram_header_struct.size bytes long)
+    :return: its session token and sequence number.
+    """
+    return datagram_header_struct.unpack_from(data)
+
+
+class DatagramChannel:
+    """
+    One end of a session: numbers the datagrams going out, and keeps track of the ones coming in.
+    The host shares one UDP socket between all its users' channels, each with the address of its client; a client's
+    channel has a socket of its own, connect()ed to the host, so it has no address.
+    """
+    def __init__(self, datagram_socket: socket.socket, token: int, address: Optional[Tuple] = None):
+        self.socket = datagram_socket
+        self.token = token
+        self.address = address  # where to send to - for the host, this is only known once the client has said hello.
+        self.next_sequences: Dict[MessageType, int] = {}
+        self.send_lock = threading.Lock()  # (the sequence numbers can be taken from more than one thread.)
+        self.latest_received: Dict[MessageType, int] = {}
+        self.sent = 0
+        self.bytes_sent = 0
+        self.too_big = 0  # messages that had to go over TCP instead.
+        self.simulated_drops = 0
+        self.received = 0
+        self.lost = 0  # datagrams that never arrived (or haven't yet), going by the gaps in the sequence numbers.
+        self.stale = 0  # world messages that arrived after a newer one, and were thrown away.
+
+    def send_frame(self, frame: List[bytes], message_type: MessageType) -> bool:
+        """
+        sends a message as one datagram.
+        :param frame: the message, as built by SocketMessageIO.build_frame_buffers (the length prefix is left off)
+        :param message_type: the type of the message, which it is numbered among
+        :return: False if the message is too big for a datagram, so the caller should send it over TCP instead;
+        True otherwise - though, as with any datagram, it may never arrive.
+        """
+        size = datagram_header_struct.size + sum(map(len, frame)) - 4
+        if size > max_datagram_size:
+            self.too_big += 1
+            return False
+        with self.send_lock:
+            sequence = self.next_sequences.get(message_type, 1)
+            self.next_sequences[message_type] = sequence + 1
+            self.sent += 1
+            self.bytes_sent += size
+        if simulated_loss > 0 and random.random() < simulated_loss:
+            self.simulated_drops += 1
+            return True
+        buffers = [datagram_header_struct.pack(self.token, sequence), memoryview(frame[0])[4:]] + frame[1:]
+        try:
+            if not hasattr(self.socket, "sendmsg"):  # (e.g., on Windows.)
+                data = b"".join(buffers)
+                if self.address is None:
+                    self.socket.send(data)
+                else:
+                    self.socket.sendto(data, self.address)
+            elif self.address is None:
+                self.socket.sendmsg(buffers)
+            else:
+                self.socket.sendmsg(buffers, [], 0, self.address)
+        except OSError:
+            pass  # (e.g., the socket's buffer is full, or nobody is listening) - it's just one more lost datagram.
+        return True
+
+    def accept(self, sequence: int, message_type: MessageType) -> bool:
+        """
+        decides whether a datagram that has arrived should be used: a world message only if it is newer than every one
+        before it; anything else, always.
+        :param sequence: the datagram's sequence number
+        :param message_type: the type of the message in it
+        :return: True if it should be used.
+        """
+        latest = self.latest_received.get(message_type, 0)
+        if sequence > latest:
+            if latest > 0:
+                self.lost += sequence - latest - 1
+            self.latest_received[message_type] = sequence
+        elif sequence < latest:
+            self.lost = max(0, self.lost - 1)  # (it's just late - so it filled one of the gaps.)
+        if sequence <= latest and message_type in LATEST_WINS_TYPES:
+            self.stale += 1
+            return False
+        self.received += 1
+        return True
+
+    def summary(self) -> Dict:
+        """
+        :return: the channel's counters, as a dictionary.
+        """
+        return {"sent": self.sent, "bytes_sent": self.bytes_sent, "too_big": self.too_big,
+                "simulated_drops": self.simulated_drops, "received": self.received, "lost": self.lost,
+                "stale": self.stale}
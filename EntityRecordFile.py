@@ -0,0 +1,139 @@
+from typing import Optional
+
+world_size = 800  # the world is a torus, this many pixels across in each direction.
+samples_per_record = 16  # how many of its recent positions each record remembers, for interpolation.
+
+PLAYER = "PLAYER"
+BULLET = "BULLET"
+
+
+def wrapped_offset(a: float, b: float) -> float:
+    """
+    :return: how far it is from a to b along one axis, going whichever way around the world is shorter (so an object
+    that has just wrapped from one edge to the other looks like it has moved a little, not across the whole world).
+    """
+    return (b - a + world_size / 2) % world_size - world_size / 2
+
+
+class EntityRecord:
+    """
+    Everything the client knows about one on-screen object. There is one record per object, for as long as it is in
+    the world: each snapshot from the host updates the record in place, adding the object's new position (and the time
+    it arrived) to a ring of recent samples, rather than building new objects. The render loop then works out where to
+    draw the object from those samples (see position_at), and leaves the answer in draw_x, draw_y and draw_bearing.
+    When the object leaves the world, the record goes back to a pool, to be reused for the next new object.
+    """
+    __slots__ = ("kind", "id", "name", "owner_id", "health", "thrusting", "color", "vx", "vy", "input_sequence",
+                 "input_step", "sample_times", "sample_xs", "sample_ys", "sample_bearings", "newest", "sample_count",
+                 "removed_time", "draw_x", "draw_y", "draw_bearing")
+
+    def __init__(self):
+        self.sample_times = [0.0] * samples_per_record
+        self.sample_xs = [0.0] * samples_per_record
+        self.sample_ys = [0.0] * samples_per_record
+        self.sample_bearings = [0.0] * samples_per_record
+        self.reset(BULLET, 0)
+
+    def reset(self, kind: str, object_id: int) -> None:
+        """
+        (re)starts this record for a new object.
+        :param kind: PLAYER or BULLET
+        :param object_id: the object's unique id number
+        :return: None
+        """
+        self.kind = kind
+        self.id = object_id
+        self.name = ""
+        self.owner_id = 0
+        self.health = 100
+        self.thrusting = False
+        self.color = None
+        self.vx = 0.0
+        self.vy = 0.0
+        self.input_sequence = 0
+        self.input_step = 0
+        self.newest = -1
+        self.sample_count = 0
+        self.removed_time = None
+        self.draw_x = 0.0
+        self.draw_y = 0.0
+        self.draw_bearing = 0.0
+
+    def add_sample(self, arrival_time: float, x: float, y: float, bearing: float) -> None:
+        """
+        records where the object was in a snapshot that arrived at the given time.
+        :return: None
+        """
+        slot = (self.newest + 1) % samples_per_record
+        self.sample_times[slot] = arrival_time
+        self.sample_xs[slot] = x
+        self.sample_ys[slot] = y
+        self.sample_bearings[slot] = bearing
+        # (the render loop may be reading the samples on another thread, so only point at the new one once it's done.)
+        self.newest = slot
+        if self.sample_count < samples_per_record:
+            self.sample_count += 1
+
+    def latest_position(self) -> Optional[tuple]:
+        """
+        :return: (x, y, bearing) from the most recent snapshot, or None if there hasn't been one.
+        """
+        if self.sample_count == 0:
+            return None
+        return self.sample_xs[self.newest], self.sample_ys[self.newest], self.sample_bearings[self.newest]
+
+    def position_at(self, render_time: float, max_extrapolation: float) -> bool:
+        """
+        works out where the object was at render_time - between the two samples on either side of it, or (if the
+        newest sample is older than that) carrying on the way it was going for up to max_extrapolation seconds - and
+        stores the answer in draw_x, draw_y and draw_bearing.
+        :param render_time: the moment to show (by time.monotonic())
+        :param max_extrapolation: how far past the newest sample to keep moving the object, in seconds
+        :return: False if the object hadn't arrived yet at render_time (so it shouldn't be drawn); True otherwise.
+        """
+        newest = self.newest
+        count = self.sample_count
+        if count == 0:
+            return False
+        later = newest
+        for age in range(count):
+            earlier = (newest - age) % samples_per_record
+            if self.sample_times[earlier] <= render_time:
+                break
+            later = earlier
+        else:
+            # even the oldest sample we have is after render_time. If that's the object's first, it isn't here yet.
+            if count < samples_per_record:
+                return False
+            self.set_draw_position(later, later, 0.0)
+            return True
+
+        if earlier != later:  # render_time falls between two samples.
+            span = self.sample_times[later] - self.sample_times[earlier]
+            self.set_draw_position(earlier, later, (render_time - self.sample_times[earlier]) / span if span > 0 else 1)
+            return True
+
+        # render_time is after the newest sample, so extrapolate from the two newest, if there are two.
+        previous = (newest - 1) % samples_per_record
+        span = self.sample_times[newest] - self.sample_times[previous]
+        if count < 2 or span <= 0:
+            self.set_draw_position(newest, newest, 0.0)
+            return True
+        overshoot = min(render_time - self.sample_times[newest], max_extrapolation)
+        self.set_draw_position(previous, newest, 1 + overshoot / span)
+        return True
+
+    def set_draw_position(self, earlier: int, later: int, fraction: float) -> None:
+        """
+        sets draw_x, draw_y and draw_bearing to the given fraction of the way from one sample to another.
+        :param earlier: the slot of the first sample
+        :param later: the slot of the second sample
+        :param fraction: how far to go from the first to the second (more than 1 keeps going past the second)
+        :return: None
+        """
+        x = self.sample_xs[earlier]
+        y = self.sample_ys[earlier]
+        self.draw_x = (x + wrapped_offset(x, self.sample_xs[later]) * fraction) % world_size
+        self.draw_y = (y + wrapped_offset(y, self.sample_ys[later]) * fraction) % world_size
+        bearing = self.sample_bearings[earlier]
+        self.draw_bearing = bearing + (self.sample_bearings[later] - bearing) * fraction
@@ -0,0 +1,231 @@
+from typing import List, Tuple
+
+from BulletFile import Bullet
+from PlayerShipFile import PlayerShip, angular_velocity, acceleration, max_v, max_v_squared
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional - without it, the host just updates each object on its own.
+    np = None
+
+numpy_available = np is not None
+
+"""
+A "structure of arrays" home for the ships and bullets: instead of each object keeping its own x, y, vx, ... the
+store keeps one NumPy array per attribute, with each object in its own slot, so that the whole population can be moved
+with a handful of array operations per tick instead of a Python loop.
+The objects themselves are still PlayerShips and Bullets (so the rest of the host doesn't need to change); they are
+just "views" whose attributes read and write their slot in the arrays. The occupied slots are always 0...count-1: when
+an object is removed, the last one is moved into its place.
+"""
+
+
+def column_property(column: str, cast):
+    """
+    makes a property that reads and writes this object's slot in one of the store's arrays. Once the object has been
+    removed from the store, the property reads and writes the object's own copy of the value, instead.
+    :param column: the name of the array in the store
+    :param cast: converts the array element to a plain Python number
+    :return: the property.
+    """
+    def getter(self):
+        if self.slot is None:
+            return self.detached_values[column]
+        return cast(getattr(self.store, column)[self.slot])
+
+    def setter(self, value):
+        if self.slot is None:
+            self.detached_values[column] = value
+        else:
+            getattr(self.store, column)[self.slot] = value
+
+    return property(getter, setter)
+
+
+class EntityStore:
+    """
+    The slot bookkeeping shared by the ShipStore and the BulletStore.
+    """
+    columns = {"x": float, "y": float, "vx": float, "vy": float}
+
+    def __init__(self, capacity: int = 64):
+        if np is None:
+            raise ImportError("The entity store needs NumPy.")
+        self.count = 0
+        self.views = []
+        for column, cast in self.columns.items():
+            setattr(self, column, np.zeros(capacity, dtype=np.int64 if cast == int else np.float64))
+
+    def capacity(self) -> int:
+        return len(self.x)
+
+    def allocate_slot(self, view) -> int:
+        """
+        finds a slot for a new object, doubling the size of the arrays if they are full.
+        :param view: the object that will live in the slot
+        :return: the slot number.
+        """
+        if self.count == self.capacity():
+            for column in self.columns:
+                old = getattr(self, column)
+                new = np.zeros(2 * len(old), dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, column, new)
+        slot = self.count
+        self.count += 1
+        self.views.append(view)
+        return slot
+
+    def remove(self, view) -> None:
+        """
+        takes the object out of the store. The object keeps a copy of its last values, so it can still be described
+        (e.g., in a DELETE_ITEMS message), but it no longer moves.
+        :param view: the object to remove
+        :return: None
+        """
+        slot = view.slot
+        last = self.count - 1
+        view.detached_values = {column: getattr(view, column) for column in self.columns}
+        view.slot = None
+        if slot != last:  # move the last object into the hole, so the occupied slots stay contiguous.
+            for column in self.columns:
+                array = getattr(self, column)
+                array[slot] = array[last]
+            moved = self.views[last]
+            moved.slot = slot
+            self.views[slot] = moved
+        self.views.pop()
+        self.count -= 1
+
+
+class ShipStore(EntityStore):
+    columns = {"x": float, "y": float, "vx": float, "vy": float, "bearing": float, "controls": int,
+               "input_step": int}
+
+    def add_ship(self, id: int, name: str) -> PlayerShip:
+        """
+        creates a new ship that lives in this store.
+        :param id: the ship's unique id number
+        :param name: the name of the ship's user
+        :return: the new ship.
+        """
+        return ShipView(self, id, name)
+
+    def firing_ships(self) -> List[PlayerShip]:
+        """
+        :return: the ships whose users are holding down the fire button.
+        """
+        return [self.views[slot] for slot in np.flatnonzero(self.controls[:self.count] & 16)]
+
+    def update(self, delta_t: float) -> None:
+        """
+        the array equivalent of PlayerShip.update() for every ship in the store at once.
+        :param delta_t: the time expired (in seconds) since the last step.
+        :return: None
+        """
+        n = self.count
+        x, y, vx, vy = self.x[:n], self.y[:n], self.vx[:n], self.vy[:n]
+        bearing, controls = self.bearing[:n], self.controls[:n]
+
+        x += vx * delta_t
+        y += vy * delta_t
+        np.mod(x + 800, 800, out=x)
+        np.mod(y + 800, 800, out=y)
+
+        angular_thrust = (controls & 2) / 2 - (controls & 1)
+        bearing += angular_velocity * delta_t * angular_thrust
+
+        thrust = ((controls & 8) / 8 - (controls & 4) / 4) * acceleration
+        vx += thrust * np.cos(bearing) * delta_t
+        vy += thrust * np.sin(bearing) * delta_t
+        speed_squared = vx ** 2 + vy ** 2
+        too_fast = speed_squared > max_v_squared
+        if too_fast.any():
+            factor = max_v / np.sqrt(speed_squared[too_fast])
+            vx[too_fast] *= factor
+            vy[too_fast] *= factor
+
+
+class BulletStore(EntityStore):
+    columns = {"x": float, "y": float, "vx": float, "vy": float, "lifetime": float, "owner_id": int}
+
+    def add_bullet(self, x: float, y: float, vx: float, vy: float, owner_id: int, bullet_id: int,
+                   lifetime: float) -> Bullet:
+        """
+        creates a new bullet that lives in this store.
+        :return: the new bullet.
+        """
+        return BulletView(self, x, y, vx, vy, owner_id, bullet_id, lifetime)
+
+    def public_values(self) -> List[Tuple[int, float, float, int]]:
+        """
+        reads what goes into every bullet's record all at once, rather than through each bullet's properties.
+        :return: (bullet id, x, y, owner id) for each bullet, in slot order.
+        """
+        n = self.count
+        return list(zip([view.bullet_id for view in self.views], self.x[:n].tolist(), self.y[:n].tolist(),
+                        self.owner_id[:n].tolist()))
+
+    def expired_bullets(self) -> List[Bullet]:
+        """
+        :return: the bullets whose lifetimes have run out.
+        """
+        return [self.views[slot] for slot in np.flatnonzero(self.lifetime[:self.count] <= 0)]
+
+    def update(self, delta_t: float) -> None:
+        """
+        the array equivalent of Bullet.update() for every bullet in the store at once.
+        :param delta_t: the time expired (in seconds) since the last step.
+        :return: None
+        """
+        n = self.count
+        x, y = self.x[:n], self.y[:n]
+        x += self.vx[:n] * delta_t
+        y += self.vy[:n] * delta_t
+        np.mod(x + 800, 800, out=x)
+        np.mod(y + 800, 800, out=y)
+        self.lifetime[:n] -= delta_t
+
+
+class ShipView(PlayerShip):
+    """
+    A PlayerShip whose position, velocity, bearing, controls and input steps live in a ShipStore.
+    """
+    __slots__ = ("store", "slot", "detached_values")
+    x = column_property("x", float)
+    y = column_property("y", float)
+    vx = column_property("vx", float)
+    vy = column_property("vy", float)
+    bearing = column_property("bearing", float)
+    controls = column_property("controls", int)
+    input_step = column_property("input_step", int)
+
+    def __init__(self, store: ShipStore, id: int, name: str):
+        self.store = store
+        super().__init__(id, name)
+
+    def reset(self, id: int, name: str) -> None:
+        self.slot = self.store.allocate_slot(self)  # (a ship that is being reused was removed from the store.)
+        super().reset(id, name)
+
+
+class BulletView(Bullet):
+    """
+    A Bullet whose position, velocity, lifetime and owner live in a BulletStore.
+    """
+    __slots__ = ("store", "slot", "detached_values")
+    x = column_property("x", float)
+    y = column_property("y", float)
+    vx = column_property("vx", float)
+    vy = column_property("vy", float)
+    lifetime = column_property("lifetime", float)
+    owner_id = column_property("owner_id", int)
+
+    def __init__(self, store: BulletStore, x: float, y: float, vx: float, vy: float, owner_id: int, bullet_id: int,
+                 lifetime: float):
+        self.store = store
+        super().__init__(x, y, vx, vy, owner_id, bullet_id, lifetime)
+
+    def reset(self, x: float, y: float, vx: float, vy: float, owner_id: int, bullet_id: int, lifetime: float) -> None:
+        self.slot = self.store.allocate_slot(self)  # (a bullet that is being reused was removed from the store.)
+        super().reset(x, y, vx, vy, owner_id, bullet_id, lifetime)
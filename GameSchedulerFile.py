@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+from typing import Callable
+
+
+class GameScheduler(threading.Thread):
+    """
+    Runs the game loop at a steady rate, as a replacement for a RepeatTimer (which waits a full interval *after* each
+    step, so the real rate drifts down as the steps get slower).
+    - Time is measured with a monotonic clock, so changes to the system clock can't disturb it.
+    - The simulation always advances in steps of exactly simulation_interval. Real time that has passed goes into an
+      accumulator, and we take as many steps as fit - but no more than max_catch_up_steps at once; if we're further
+      behind than that, the rest is dropped rather than letting the game fall further and further behind.
+    - The world is sent out every send_interval, independently of the simulation rate.
+    - Any pass through the loop that takes longer than simulation_interval is counted as an overrun, and reported
+      every report_interval seconds.
+    It can run as its own thread (start()/cancel(), like a RepeatTimer), or as an asyncio task (run_async()).
+    """
+    def __init__(self, simulation_step: Callable[[float], None], send_step: Callable[[], None],
+                 simulation_interval: float = 0.02, send_interval: float = 0.02, max_catch_up_steps: int = 5,
+                 report_interval: float = 10):
+        super().__init__(daemon=True)
+        self.simulation_step = simulation_step
+        self.send_step = send_step
+        self.simulation_interval = simulation_interval
+        self.send_interval = send_interval
+        self.max_catch_up_steps = max_catch_up_steps
+        self.report_interval = report_interval
+        self.finished = threading.Event()
+
+        self.clock = time.monotonic
+        self.last_time = None
+        self.accumulator = 0.0
+        self.next_send_time = None
+        self.next_report_time = None
+
+        self.overruns = 0  # since the last report
+        self.worst_overrun = 0.0
+        self.dropped_steps = 0
+        self.total_overruns = 0
+        self.total_dropped_steps = 0
+
+    def cancel(self) -> None:
+        """
+        stop the scheduler (when it is running as a thread).
+        :return: None
+        """
+        self.finished.set()
+
+    def run(self) -> None:
+        while not self.finished.is_set():
+            self.finished.wait(self.run_due_work())
+
+    async def run_async(self) -> None:
+        """
+        the asyncio equivalent of run(): perform the game loop forever, on the current event loop.
+        :return: None
+        """
+        while not self.finished.is_set():
+            await asyncio.sleep(self.run_due_work())
+
+    def run_due_work(self) -> float:
+        """
+        perform whatever simulation steps and sending are due by now.
+        :return: how long (in seconds) until more work will be due.
+        """
+        now = self.clock()
+        if self.last_time is None:
+            self.last_time = now
+            self.next_send_time = now
+            self.next_report_time = now + self.report_interval
+
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = 0
+        while self.accumulator >= self.simulation_interval and steps < self.max_catch_up_steps:
+            self.simulation_step(self.simulation_interval)
+            self.accumulator -= self.simulation_interval
+            steps += 1
+        if self.accumulator >= self.simulation_interval:  # we're too far behind to catch up - drop the rest.
+            dropped = int(self.accumulator / self.simulation_interval)
+            self.dropped_steps += dropped
+            self.accumulator -= dropped * self.simulation_interval
+
+        if now >= self.next_send_time:
+            self.send_step()
+            self.next_send_time += self.send_interval
+            if self.next_send_time <= now:  # sends don't catch up; just skip to the next one that's in the future.
+                self.next_send_time = now + self.send_interval
+
+        finish = self.clock()
+        work_time = finish - now
+        if work_time > self.simulation_interval:
+            self.overruns += 1
+            self.worst_overrun = max(self.worst_overrun, work_time)
+        if finish >= self.next_report_time:
+            self.report()
+            self.next_report_time = finish + self.report_interval
+
+        next_step_time = now + self.simulation_interval - self.accumulator
+        return max(0.0, min(next_step_time, self.next_send_time) - finish)
+
+    def report(self) -> None:
+        """
+        print a summary of any overruns and dropped steps since the last report.
+        :return: None
+        """
+        self.total_overruns += self.overruns
+        self.total_dropped_steps += self.dropped_steps
+        if self.overruns > 0 or self.dropped_steps > 0:
+            print(f"{self.overruns} ticks overran their {self.simulation_interval * 1000:.0f} ms budget in the last "
+                  f"{self.report_interval} s (worst: {self.worst_overrun * 1000:.1f} ms); "
+                  f"{self.dropped_steps} simulation steps were dropped.")
+        self.overruns = 0
+        self.worst_overrun = 0.0
+        self.dropped_steps = 0
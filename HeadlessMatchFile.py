@@ -0,0 +1,215 @@
+import argparse
+import hashlib
+import random
+import struct
+import time
+from typing import Callable, Iterable, List, Tuple
+
+import PlayerShipFile
+import SocketHostFile as host
+from EntityRecordFile import BULLET
+from EntityStoreFile import ShipStore, BulletStore
+from RecordCacheFile import RecordCache
+from WorldRegistryFile import WorldRegistry
+
+"""
+Runs the host's simulation with no sockets, no threads and no real time: a virtual clock moves on by exactly
+simulation_interval each step, and the ships' starting places come from a Random with a given seed, so a match can be
+played as fast as the computer can go - and, given the same seed and the same inputs, it comes out exactly the same,
+down to the last bit, every time. (Use it for regression tests, trying out changes to the game's balance, or training
+bots.)
+The ships are controlled by a script: a list of (tick, ship id, key status) in tick order, and/or a function called
+before every step that can set any ship's controls.
+Run it with, e.g., "python HeadlessMatchFile.py --seed 7 --ships 8 --seconds 60 --check", which plays a match with
+randomly scripted players twice and checks that both runs end in the same state.
+"""
+
+state_struct = struct.Struct('>Iddddd')  # the id and the exact position, velocity and bearing (or lifetime) of an object.
+
+
+class VirtualClock:
+    """
+    A clock that only moves when it is told to. (Its now() can stand in for time.time().)
+    """
+    def __init__(self, start: float = 0.0):
+        self.time = start
+
+    def now(self) -> float:
+        return self.time
+
+    def advance(self, delta_t: float) -> None:
+        self.time += delta_t
+
+
+class HeadlessConnection:
+    """
+    stands in for a user's socket; the host only ever calls shutdown() and close() on it directly.
+    """
+    def shutdown(self, how: int) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class HeadlessMatch:
+    """
+    A match played on the host's simulation (SocketHostFile's globals), on a virtual clock. Only one can be played at
+    a time in a process, since they share the host's world. Call close() when it's over (or use it in a with block), to
+    give the ships back the real clock and Random.
+    """
+    def __init__(self, seed: int, use_entity_store: bool = None):
+        """
+        empties the host's world and points the ships at our clock and our seeded Random.
+        :param seed: the seed for everything random in the match
+        :param use_entity_store: whether to use the NumPy entity store; defaults to the host's setting.
+        """
+        self.clock = VirtualClock()
+        self.tick = 0
+        self.saved_settings = (PlayerShipFile.clock, PlayerShipFile.rng, host.use_entity_store)
+        PlayerShipFile.clock = self.clock.now
+        PlayerShipFile.rng = random.Random(seed)
+
+        if use_entity_store is not None:
+            host.use_entity_store = use_entity_store
+        host.user_dictionary.clear()
+        host.world = WorldRegistry()
+        host.departed_ships.clear()
+        host.items_to_delete = []
+        host.record_cache = RecordCache()
+        host.world_tick = 0
+        host.simulation_steps = 0
+        host.match_recorder = None
+        if host.use_entity_store:
+            host.ship_store = ShipStore()
+            host.bullet_store = BulletStore()
+
+    def close(self) -> None:
+        """
+        puts back the clock, Random and entity store setting that were in use before the match started.
+        :return: None
+        """
+        PlayerShipFile.clock, PlayerShipFile.rng, host.use_entity_store = self.saved_settings
+
+    def __enter__(self) -> "HeadlessMatch":
+        return self
+
+    def __exit__(self, *exception_info) -> None:
+        self.close()
+
+    def add_ship(self, name: str) -> int:
+        """
+        adds a player to the match.
+        :param name: the player's name
+        :return: the id number of the player (and its ship).
+        """
+        user_id = host.add_user(HeadlessConnection())
+        host.user_dictionary[user_id]["name"] = name
+        host.user_dictionary[user_id]["PlayerShip"].name = name
+        return user_id
+
+    def step(self) -> None:
+        """
+        advances the match by one simulation_interval. Nothing is sent anywhere, so the objects that were removed are
+        released for reuse straight away.
+        :return: None
+        """
+        self.clock.advance(host.simulation_interval)
+        host.simulation_step(host.simulation_interval)
+        self.tick += 1
+        host.world_tick = self.tick
+        host.release_deleted_items()
+
+    def run(self, num_ticks: int, inputs: Iterable[Tuple[int, int, int]] = (),
+            controller: Callable[["HeadlessMatch"], None] = None) -> None:
+        """
+        plays the given number of steps, applying the scripted inputs as their ticks come up.
+        :param num_ticks: how many steps to play
+        :param inputs: (tick, ship id, key status) for each change of controls, in order of tick. Each one is applied
+        just before the step that starts at that tick.
+        :param controller: if given, called before each step (after the inputs), to set the controls however it likes.
+        :return: None
+        """
+        pending = iter(inputs)
+        next_input = next(pending, None)
+        end_tick = self.tick + num_ticks
+        while self.tick < end_tick:
+            while next_input is not None and next_input[0] <= self.tick:
+                host.update_ship_controls(next_input[1], next_input[2])
+                next_input = next(pending, None)
+            if controller is not None:
+                controller(self)
+            self.step()
+
+    def ships(self) -> List:
+        return [user["PlayerShip"] for user in host.user_dictionary.values() if "PlayerShip" in user]
+
+    def state_digest(self) -> str:
+        """
+        :return: a hash of the exact state of every ship and bullet - two matches are in the same state if (and, to all
+        intents, only if) their digests are the same.
+        """
+        digest = hashlib.sha256()
+        digest.update(struct.pack('>I', self.tick))
+        for ship in self.ships():
+            digest.update(state_struct.pack(ship.my_id, ship.x, ship.y, ship.vx, ship.vy, ship.bearing))
+            digest.update(struct.pack('>ii', int(ship.health), int(ship.controls)))
+        for bullet in host.world.entities_of_kind(BULLET):
+            digest.update(state_struct.pack(bullet.bullet_id, bullet.x, bullet.y, bullet.vx, bullet.vy,
+                                            bullet.lifetime))
+        return digest.hexdigest()
+
+
+def random_inputs(seed: int, ship_ids: List[int], num_ticks: int, mean_ticks_between_changes: int = 25) \
+        -> List[Tuple[int, int, int]]:
+    """
+    writes a script in which each ship changes which keys it is holding at random moments (firing about half the time),
+    like the bots in BotSwarmFile.
+    :param seed: the seed for the script (separate from the match's, so either can be changed on its own)
+    :param ship_ids: the ships to write inputs for
+    :param num_ticks: how long the script should last
+    :param mean_ticks_between_changes: how often, on average, each ship changes keys
+    :return: the script, as (tick, ship id, key status) in order of tick.
+    """
+    script_random = random.Random(seed)
+    script = []
+    for ship_id in ship_ids:
+        tick = 0
+        while tick < num_ticks:
+            script.append((tick, ship_id, script_random.randrange(16) | (16 if script_random.random() < 0.5 else 0)))
+            tick += script_random.randint(1, 2 * mean_ticks_between_changes)
+    script.sort()
+    return script
+
+
+def play(seed: int, num_ships: int, num_ticks: int) -> Tuple[str, float]:
+    """
+    plays a match of randomly scripted ships.
+    :return: the digest of the final state, and how many seconds it took to play.
+    """
+    with HeadlessMatch(seed) as match:
+        ship_ids = [match.add_ship(f"bot{index + 1}") for index in range(num_ships)]
+        script = random_inputs(seed, ship_ids, num_ticks)
+        start = time.perf_counter()
+        match.run(num_ticks, script)
+        return match.state_digest(), time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play a scripted match on the host's simulation, as fast as possible.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ships", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=60.0, help="how long the match lasts, in game time")
+    parser.add_argument("--check", action="store_true", help="play it twice, and check that both runs match")
+    args = parser.parse_args()
+
+    num_ticks = int(args.seconds / host.simulation_interval)
+    final_digest, duration = play(args.seed, args.ships, num_ticks)
+    print(f"{num_ticks} ticks ({args.seconds} s of game time) in {duration:.2f} s - "
+          f"{args.seconds / duration:.1f}x real time. Final state: {final_digest}")
+    if args.check:
+        second_digest = play(args.seed, args.ships, num_ticks)[0]
+        if second_digest != final_digest:
+            print(f"The second run ended differently: {second_digest}")
+            raise SystemExit(1)
+        print("The second run ended in exactly the same state.")
@@ -0,0 +1,250 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Dict, List, Optional
+
+from SocketMessageIOFile import MessageType
+
+histogram_buckets = 24  # bucket i counts durations of less than 2**i microseconds; the last one counts the rest.
+
+# the parts of the game loop that are timed separately.
+PHASES = ("user_step", "bullet_step", "collisions", "world_build", "broadcast", "delete_broadcast")
+
+
+class Histogram:
+    """
+    Counts how long something took, in buckets that double in size (under 1 µs, under 2 µs, under 4 µs...), so that
+    recording a time is just a couple of additions, however many times we record.
+    Only one thread records into a histogram; summary() can be called from another thread, as it only reads.
+    """
+    def __init__(self):
+        self.counts = [0] * histogram_buckets
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, duration_ns: int) -> None:
+        """
+        adds one duration to the histogram.
+        :param duration_ns: how long it took, in nanoseconds
+        :return: None
+        """
+        self.counts[min((duration_ns // 1000).bit_length(), histogram_buckets - 1)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    def percentile(self, counts: List[int], fraction: float) -> float:
+        """
+        :return: the upper edge (in microseconds) of the bucket that holds the given fraction of the counts, which is
+        as close as the buckets let us get to that percentile.
+        """
+        target = fraction * sum(counts)
+        running_total = 0
+        for index, bucket_count in enumerate(counts):
+            running_total += bucket_count
+            if running_total >= target and running_total > 0:
+                return float(2 ** index) if index < histogram_buckets - 1 else self.max_ns / 1000
+        return 0.0
+
+    def summary(self) -> Dict:
+        """
+        :return: the count, mean, maximum and approximate 50th, 90th and 99th percentiles (in microseconds), along
+        with the non-empty buckets, as {upper edge in µs: count}.
+        """
+        counts = list(self.counts)  # (so they can't change while we're reading them.)
+        count = self.count
+        return {"count": count,
+                "mean_us": self.total_ns / count / 1000 if count > 0 else 0.0,
+                "max_us": self.max_ns / 1000,
+                "p50_us": self.percentile(counts, 0.5),
+                "p90_us": self.percentile(counts, 0.9),
+                "p99_us": self.percentile(counts, 0.99),
+                "buckets_us": {("inf" if index == histogram_buckets - 1 else str(2 ** index)): bucket_count
+                               for index, bucket_count in enumerate(counts) if bucket_count > 0}}
+
+
+class ClientStats:
+    """
+    The counters for one user's connection: what its writer has sent (and how long the sends blocked for), and what its
+    listeners have received. Messages can arrive over TCP and UDP at once, each on its own thread, so the counters are
+    only changed (and read) with the lock held.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connected_time = time.monotonic()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.sends = 0
+        self.send_blocked_ns = 0
+        self.messages_received = 0
+        self.messages_received_by_type = {message_type.name: 0 for message_type in MessageType}
+        # the inbound message rate over the last whole second.
+        self.window_start = self.connected_time
+        self.window_messages = 0
+        self.inbound_rate = 0.0
+
+    def count_sent(self, num_frames: int, num_bytes: int, blocked_ns: int) -> None:
+        """
+        notes that the writer has sent some frames.
+        :param num_frames: how many frames went out together
+        :param num_bytes: how many bytes they came to
+        :param blocked_ns: how long the send took, in nanoseconds
+        :return: None
+        """
+        with self.lock:
+            self.frames_sent += num_frames
+            self.bytes_sent += num_bytes
+            self.sends += 1
+            self.send_blocked_ns += blocked_ns
+
+    def count_received(self, message_type: MessageType) -> None:
+        """
+        notes that a message has arrived from the user.
+        :param message_type: the type of the message
+        :return: None
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.messages_received += 1
+            self.messages_received_by_type[message_type.name] += 1
+            self.window_messages += 1
+            if now - self.window_start >= 1.0:
+                self.inbound_rate = self.window_messages / (now - self.window_start)
+                self.window_start = now
+                self.window_messages = 0
+
+    def summary(self) -> Dict:
+        """
+        :return: the counters, as a dictionary.
+        """
+        with self.lock:
+            return {"connected_seconds": time.monotonic() - self.connected_time,
+                    "frames_sent": self.frames_sent,
+                    "bytes_sent": self.bytes_sent,
+                    "sends": self.sends,
+                    "send_blocked_seconds": self.send_blocked_ns / 1e9,
+                    "messages_received": self.messages_received,
+                    "messages_received_by_type": dict(self.messages_received_by_type),
+                    "inbound_messages_per_second": self.inbound_rate}
+
+
+class HostStats:
+    """
+    The timings of each phase of the game loop. The game loop calls record_phase() (or add()) as it goes; anything
+    else can call summary() at any time without stopping it.
+    """
+    def __init__(self):
+        self.phases: Dict[str, Histogram] = {phase: Histogram() for phase in PHASES}
+        self.queue_ns = 0  # the total time spent putting frames into outbound queues, so send_step can separate it out.
+        self.start_time = time.monotonic()
+
+    def record_phase(self, phase: str, start_ns: int) -> int:
+        """
+        records that a phase of the game loop, which started at start_ns, has just finished.
+        :param phase: one of PHASES
+        :param start_ns: when it started, by time.perf_counter_ns()
+        :return: the time now, by time.perf_counter_ns(), so the next phase can start from it.
+        """
+        now = time.perf_counter_ns()
+        self.phases[phase].record(now - start_ns)
+        return now
+
+    def add(self, phase: str, duration_ns: int) -> None:
+        """
+        records how long a phase of the game loop took, when it wasn't one continuous stretch of time.
+        :param phase: one of PHASES
+        :param duration_ns: how long it took, in nanoseconds
+        :return: None
+        """
+        self.phases[phase].record(duration_ns)
+
+    def summary(self) -> Dict:
+        """
+        :return: the uptime and a summary of each phase's histogram.
+        """
+        return {"uptime_seconds": time.monotonic() - self.start_time,
+                "phases": {phase: histogram.summary() for phase, histogram in self.phases.items()}}
+
+
+def metric_value(value) -> Optional[str]:
+    """
+    :param value: one of the numbers in the stats
+    :return: the value as Prometheus would have it (True/False as 1/0), or None if it isn't a number (e.g., a round
+    trip time that hasn't been measured yet), so it should be left out.
+    """
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return str(value)
+    return None
+
+
+def stats_as_text(stats: Dict) -> str:
+    """
+    flattens the stats into "name{labels} value" lines (the Prometheus text format), for tools that would rather scrape
+    that than JSON. Each client's nested dictionaries (e.g., "link") become metrics of their own, like
+    client_link_rtt_ms - except the counts by message type, which are one metric with a type label.
+    :param stats: the dictionary served as JSON
+    :return: the same numbers, one per line.
+    """
+    lines = [f"host_uptime_seconds {stats['uptime_seconds']:.3f}"]
+    for name, value in stats.get("scheduler", {}).items():
+        if metric_value(value) is not None:
+            lines.append(f"host_scheduler_{name} {metric_value(value)}")
+    for phase, summary in stats["phases"].items():
+        for name in ("count", "mean_us", "max_us", "p50_us", "p90_us", "p99_us"):
+            lines.append(f'host_phase_{name}{{phase="{phase}"}} {summary[name]}')
+    for client in stats.get("clients", []):
+        labels = f'id="{client["id"]}"'
+        for name, value in client.items():
+            if name == "messages_received_by_type":
+                for message_type, count in value.items():
+                    lines.append(f'client_{name}{{{labels},type="{message_type}"}} {count}')
+            elif isinstance(value, dict):
+                for inner_name, inner_value in value.items():
+                    if metric_value(inner_value) is not None:
+                        lines.append(f"client_{name}_{inner_name}{{{labels}}} {metric_value(inner_value)}")
+            elif metric_value(value) is not None and name != "id":
+                lines.append(f"client_{name}{{{labels}}} {metric_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET / (or /stats) with the stats as JSON, and GET /metrics with stats_as_text().
+    """
+    def do_GET(self) -> None:
+        stats = self.server.get_stats()
+        if self.path.startswith("/metrics"):
+            body = stats_as_text(stats).encode()
+            content_type = "text/plain; version=0.0.4"
+        else:
+            body = json.dumps(stats).encode()
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass  # don't print a line for every scrape.
+
+
+def serve_stats(get_stats: Callable[[], Dict], port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    starts a small HTTP server, on its own thread, that answers every request with the latest stats. It only listens
+    on the local machine, by default.
+    :param get_stats: called for each request, to gather the stats
+    :param port: the port to listen on
+    :param host: the address to listen on
+    :return: the server (call shutdown() on it to stop it).
+    """
+    server = ThreadingHTTPServer((host, port), StatsRequestHandler)
+    server.daemon_threads = True
+    server.get_stats = get_stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
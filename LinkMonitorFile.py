@@ -0,0 +1,140 @@
+import math
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+"""
+Keeps track of how good one user's connection is, and decides how often (and in how much detail) the host should send
+it the world.
+Every ping_interval, once the tick's messages have been handed to the user's writer, the host sends a PING
+("sequence-->host time-->round trip time in ms-->snapshot interval"); the client answers straight away with a PONG
+("sequence-->host time-->client time"). The host time is time.monotonic(), and since the PONG carries it back, the
+round trip time is just how long ago that was. The client's clock was read about halfway through the round trip, so
+the difference between the clocks is roughly client time - (host's time.time() when the PONG arrived - round trip / 2).
+The round trip is smoothed the way TCP does it; the clock offset is taken from the quickest of the recent pings, as
+that one had the least room for error.
+A user whose round trip is long, or who has a lot of data waiting to go out (in its outbound queue, with its writer,
+or in its socket's send buffer), is sent the world less often - every second tick, then every fourth... up
+to max_send_every - and, from reduced_detail_send_every on, only what is near its own ship. Once the link is healthy
+again, the rate creeps back up one step at a time. (Clients that don't answer PINGs are still paced by their backlog.)
+"""
+
+ping_interval = 1.0  # how often (in seconds) each user is pinged.
+rtt_gain = 0.125  # how much each new round trip moves the smoothed one (as in TCP)...
+rtt_variation_gain = 0.25  # ... and its variation.
+offset_samples = 8  # the clock offset comes from the quickest of this many recent pings.
+min_send_every = 1  # a healthy user is sent the world every this many ticks...
+max_send_every = 6  # ... and a struggling one no less often than this.
+degrade_rtt = 0.25  # a smoothed round trip (in seconds) longer than this means the link is struggling...
+recover_rtt = 0.1  # ... and one shorter than this (with nothing backed up) means it has recovered.
+degrade_backlog_bytes = 32 * 1024  # if more than this is waiting to go to the user, it is struggling...
+recover_backlog_bytes = 4 * 1024  # ... and less than this (on a quick link) means it has recovered.
+adapt_interval = 0.5  # the least time (in seconds) between two changes to a user's send rate.
+reduced_detail_send_every = 3  # users sent the world this rarely (or more rarely) only hear about nearby objects...
+reduced_detail_radius = 250  # ... within this distance of their ship.
+
+
+class LinkMonitor:
+    """
+    One user's round trip time, clock offset and send rate. handle_pong() is called by the user's listener; everything
+    else by the game loop.
+    """
+    def __init__(self):
+        self.pinging = False  # whether the client has said it will answer PINGs.
+        self.next_ping_sequence = 1
+        self.last_ping_time = -math.inf
+        self.pings_sent = 0
+        self.pongs_received = 0
+        self.smoothed_rtt = None
+        self.rtt_variation = 0.0
+        self.recent_samples: Deque[Tuple[float, float]] = deque(maxlen=offset_samples)  # (round trip, offset)
+        self.clock_offset = None  # the client's clock minus ours, in seconds.
+        self.send_every = min_send_every
+        self.ticks_since_send = 0
+        self.last_adapt_time = -math.inf
+        self.rate_changes = 0
+
+    def ping_due(self, now: float) -> bool:
+        return self.pinging and now - self.last_ping_time >= ping_interval
+
+    def build_ping(self, now: float, tick_interval: float) -> str:
+        """
+        makes the body of the next PING, and notes that it is being sent.
+        :param now: the host's time.monotonic()
+        :param tick_interval: how long (in seconds) a world tick lasts, so the client can be told how far apart its
+        snapshots will be
+        :return: "sequence-->host time-->round trip time in ms (or -1 if unknown)-->snapshot interval"
+        """
+        sequence = self.next_ping_sequence
+        self.next_ping_sequence += 1
+        self.last_ping_time = now
+        self.pings_sent += 1
+        rtt_ms = -1 if self.smoothed_rtt is None else round(self.smoothed_rtt * 1000, 1)
+        return f"{sequence}\t{now!r}\t{rtt_ms}\t{self.send_every * tick_interval!r}"
+
+    def handle_pong(self, message: str, now: float, wall_time: float) -> None:
+        """
+        takes a new round trip time and clock offset from the client's answer to one of our PINGs.
+        :param message: "sequence-->host time-->client time"
+        :param now: the host's time.monotonic()
+        :param wall_time: the host's time.time(), to compare with the client's clock
+        :return: None
+        """
+        parts = message.split("\t")
+        host_time, client_time = float(parts[1]), float(parts[2])
+        rtt = max(0.0, now - host_time)
+        self.pongs_received += 1
+        if self.smoothed_rtt is None:
+            self.smoothed_rtt = rtt
+            self.rtt_variation = rtt / 2
+        else:
+            self.rtt_variation += rtt_variation_gain * (abs(rtt - self.smoothed_rtt) - self.rtt_variation)
+            self.smoothed_rtt += rtt_gain * (rtt - self.smoothed_rtt)
+        self.recent_samples.append((rtt, client_time - (wall_time - rtt / 2)))
+        self.clock_offset = min(self.recent_samples)[1]
+
+    def adapt(self, backlog_bytes: int, now: float) -> None:
+        """
+        halves the user's send rate if its link is struggling, or moves it one step back up if the link is healthy -
+        but no more often than adapt_interval.
+        :param backlog_bytes: how much is waiting to go to the user (see SocketHostFile.pace_users)
+        :param now: the host's time.monotonic()
+        :return: None
+        """
+        if now - self.last_adapt_time < adapt_interval:
+            return
+        struggling = backlog_bytes > degrade_backlog_bytes or \
+            (self.smoothed_rtt is not None and self.smoothed_rtt > degrade_rtt)
+        healthy = backlog_bytes < recover_backlog_bytes and (self.smoothed_rtt is None or self.smoothed_rtt < recover_rtt)
+        if struggling and self.send_every < max_send_every:
+            self.send_every = min(max_send_every, self.send_every * 2)
+        elif healthy and self.send_every > min_send_every:
+            self.send_every -= 1
+        else:
+            return
+        self.last_adapt_time = now
+        self.rate_changes += 1
+
+    def take_turn(self) -> bool:
+        """
+        called once per world tick.
+        :return: whether the user should be sent the world on this tick.
+        """
+        self.ticks_since_send += 1
+        if self.ticks_since_send < self.send_every:
+            return False
+        self.ticks_since_send = 0
+        return True
+
+    @property
+    def reduced_detail(self) -> bool:
+        return self.send_every >= reduced_detail_send_every
+
+    def summary(self) -> Dict:
+        """
+        :return: the link's measurements and send rate, as a dictionary.
+        """
+        return {"rtt_ms": None if self.smoothed_rtt is None else self.smoothed_rtt * 1000,
+                "rtt_variation_ms": self.rtt_variation * 1000,
+                "clock_offset_ms": None if self.clock_offset is None else self.clock_offset * 1000,
+                "pings_sent": self.pings_sent, "pongs_received": self.pongs_received, "send_every": self.send_every,
+                "reduced_detail": self.reduced_detail, "rate_changes": self.rate_changes}
@@ -0,0 +1,251 @@
+import multiprocessing
+import socket
+import threading
+import time
+from multiprocessing import reduction
+from multiprocessing.connection import Connection, wait
+from typing import Dict, Optional, Set
+
+"""
+Runs many games at once: the lobby listens on the usual port and hands each new connection to a game room. Each room is
+a separate worker process running SocketHostFile - its own world, user_dictionary, game loop and all - so the rooms
+don't share the GIL, and the operating system spreads them over all the cores.
+The lobby never reads or writes any messages: it passes the connected socket itself to the room's process (over a
+pipe), and the room talks to the client exactly as a single SocketHostFile would. So clients don't need to change.
+New players go into the fullest room that still has space, so that people have somebody to play with; when every room
+is full, a new one is started. A room that has been empty for a while is shut down, and its number (and so its ports)
+goes to the next room that is started.
+"""
+
+port = 3001
+max_players_per_room = 16
+max_rooms = None  # None means as many as it takes.
+room_idle_timeout = 30.0  # shut down a room after it has had nobody in it for this many seconds...
+min_rooms = 1  # ... unless that would leave fewer than this many rooms waiting for players.
+report_interval = 0.5  # how often each room tells the lobby how many players it has.
+room_stats_port = 3100  # room n serves its stats on room_stats_port + n. None for none.
+room_datagram_port = 3200  # room n takes datagrams (see SocketHostFile.datagram_port) on room_datagram_port + n. None
+                           # for TCP only.
+# (so there can't be more rooms at once than fit between those two, and below 65536 - see max_room_number.)
+
+
+def max_room_number() -> int:
+    """
+    :return: the highest room number whose stats and datagram ports are all valid, and can't be the same as another
+    room's.
+    """
+    bases = sorted(base for base in (room_stats_port, room_datagram_port) if base is not None)
+    if len(bases) == 0:
+        return 65535  # no ports to run out of.
+    limit = 65535 - bases[-1]
+    if len(bases) == 2:
+        limit = min(limit, bases[1] - bases[0])
+    return limit
+
+
+def run_room(room_number: int, pipe: Connection, stats_port: Optional[int], datagram_port: Optional[int]) -> None:
+    """
+    the main function of a room's worker process: run SocketHostFile's game loop, add each connection the lobby sends
+    us to the game, and tell the lobby how many players we have every report_interval.
+    :param room_number: which room this is (for the log, and the stats port)
+    :param pipe: our end of the pipe to the lobby
+    :param stats_port: the port to serve this room's stats on, or None
+    :param datagram_port: the UDP port for this room's datagrams, or None
+    :return: None
+    """
+    import SocketHostFile as host  # (each worker process gets its own copy of the game's globals.)
+    from GameSchedulerFile import GameScheduler
+
+    host.stats_port = stats_port
+    host.datagram_port = datagram_port
+    host.start_recording()
+    game_loop_scheduler = GameScheduler(host.simulation_step, host.send_step,
+                                        simulation_interval=host.simulation_interval,
+                                        send_interval=host.send_interval)
+    game_loop_scheduler.start()
+    host.start_stats_server(game_loop_scheduler)
+    host.start_datagram_listener()
+    print(f"Room {room_number} is open.")
+
+    def report_players():
+        # (every time, not just when it changes: the lobby guesses at the count when it hands us a player, so it needs
+        # to hear the real one even if that player has already gone again.)
+        while True:
+            host.user_dictionary_lock.acquire()
+            num_players = len(host.user_dictionary)
+            host.user_dictionary_lock.release()
+            try:
+                pipe.send(("players", num_players))
+            except OSError:
+                return  # the lobby has gone.
+            time.sleep(report_interval)
+
+    threading.Thread(target=report_players, daemon=True).start()
+
+    while True:
+        try:
+            command, address = pipe.recv()
+        except EOFError:
+            break
+        if command == "connection":
+            connection = socket.socket(fileno=reduction.recv_handle(pipe))
+            host.start_user(connection, address)
+        elif command == "stop":
+            break
+    game_loop_scheduler.cancel()
+    host.stop_recording()
+    print(f"Room {room_number} is closed.")
+
+
+class Room:
+    """
+    The lobby's view of one room: its worker process, the pipe to it, and how many players it has.
+    """
+    def __init__(self, room_number: int, context):
+        self.room_number = room_number
+        self.pipe, worker_pipe = context.Pipe()
+        stats_port = room_stats_port + room_number if room_stats_port is not None else None
+        datagram_port = room_datagram_port + room_number if room_datagram_port is not None else None
+        self.process = context.Process(target=run_room, args=(room_number, worker_pipe, stats_port, datagram_port),
+                                       daemon=True)
+        self.process.start()
+        worker_pipe.close()  # (only the worker uses that end.)
+        self.players = 0
+        self.empty_since = time.monotonic()
+
+    def hand_over(self, connection: socket.socket, address) -> None:
+        """
+        passes a new connection to this room's process. The lobby's copy of the socket is closed afterwards.
+        :param connection: the client's socket
+        :param address: the client's address
+        :return: None
+        """
+        self.pipe.send(("connection", address))
+        reduction.send_handle(self.pipe, connection.fileno(), self.process.pid)
+        connection.close()
+        self.players += 1  # (until the room tells us otherwise.)
+        self.empty_since = None
+
+    def stop(self) -> None:
+        """
+        tells the room's process to finish, and waits for it.
+        :return: None
+        """
+        try:
+            self.pipe.send(("stop", None))
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        self.pipe.close()
+
+
+class Lobby:
+    """
+    Accepts connections and decides which room each one goes to, starting and stopping rooms as needed.
+    """
+    def __init__(self):
+        # "spawn" starts each worker with a fresh interpreter, so it never inherits the lobby's threads or sockets.
+        self.context = multiprocessing.get_context("spawn")
+        self.rooms: Dict[int, Room] = {}
+        self.closing_room_numbers: Set[int] = set()  # rooms that are still shutting down (and using their ports).
+        self.lock = threading.Lock()  # the accepting thread and the monitoring thread both use self.rooms.
+
+    def choose_room(self) -> Optional[Room]:
+        """
+        finds the fullest room that still has space, starting a new one if there isn't one (and we're allowed to).
+        Call this with the lock held.
+        :return: the room, or None if every room is full and we can't start another.
+        """
+        open_rooms = [room for room in self.rooms.values() if room.players < max_players_per_room]
+        if len(open_rooms) > 0:
+            return max(open_rooms, key=lambda room: room.players)
+        if max_rooms is not None and len(self.rooms) >= max_rooms:
+            return None
+        return self.open_room()
+
+    def open_room(self) -> Optional[Room]:
+        """
+        starts a new room, with the lowest room number that isn't in use. Call this with the lock held.
+        :return: the new room, or None if every room number up to max_room_number() is taken.
+        """
+        room_number = 1
+        while room_number in self.rooms or room_number in self.closing_room_numbers:
+            room_number += 1
+        if room_number > max_room_number():
+            return None
+        room = Room(room_number, self.context)
+        self.rooms[room_number] = room
+        return room
+
+    def monitor_rooms(self) -> None:
+        """
+        a loop intended for a Thread: listen for each room's player count, and shut down rooms that have been empty for
+        room_idle_timeout seconds (keeping at least min_rooms). A room whose process has died is forgotten.
+        :return: None
+        """
+        while True:
+            with self.lock:
+                pipes = {room.pipe: room for room in self.rooms.values()}
+            for pipe in wait(list(pipes.keys()), timeout=report_interval):
+                room = pipes[pipe]
+                try:
+                    message, num_players = pipe.recv()
+                except (EOFError, OSError):
+                    print(f"Room {room.room_number} has stopped unexpectedly.")
+                    with self.lock:
+                        self.rooms.pop(room.room_number, None)
+                    continue
+                with self.lock:
+                    room.players = num_players
+                    if num_players > 0:
+                        room.empty_since = None
+                    elif room.empty_since is None:
+                        room.empty_since = time.monotonic()
+
+            now = time.monotonic()
+            with self.lock:
+                idle_rooms = [room for room in self.rooms.values()
+                              if room.empty_since is not None and now - room.empty_since > room_idle_timeout]
+                idle_rooms = idle_rooms[:max(len(self.rooms) - min_rooms, 0)]
+                for room in idle_rooms:
+                    del self.rooms[room.room_number]
+                    self.closing_room_numbers.add(room.room_number)
+            for room in idle_rooms:
+                room.stop()
+                with self.lock:
+                    self.closing_room_numbers.discard(room.room_number)
+                print(f"Room {room.room_number} has been idle for {room_idle_timeout} s, so it has been shut down.")
+            if len(pipes) == 0:
+                time.sleep(report_interval)
+
+    def run(self) -> None:
+        """
+        listen on the lobby's port, and send each new connection to a room.
+        :return: None
+        """
+        lobby_socket = socket.socket()
+        lobby_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        lobby_socket.bind(('', port))
+        lobby_socket.listen(128)
+        with self.lock:
+            for i in range(min_rooms):
+                self.open_room()
+        threading.Thread(target=self.monitor_rooms, daemon=True).start()
+        print(f"The lobby is listening on port {port}.")
+
+        while True:
+            connection, address = lobby_socket.accept()
+            with self.lock:
+                room = self.choose_room()
+                if room is None:
+                    print(f"Every room is full; turning away {address}.")
+                    connection.close()
+                    continue
+                try:
+                    room.hand_over(connection, address)
+                except OSError:  # the room's process has gone; the monitor will forget it.
+                    connection.close()
+
+
+if __name__ == '__main__':
+    Lobby().run()
@@ -0,0 +1,243 @@
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+"""
+The format of a match recording, and the classes that write and read one.
+
+A recording is an append-only log file, starting with a header:
+    magic (b"SWR1"), the length of a tick in seconds (double), and the wall-clock time the match started (double)
+followed by records, each of which is a header (kind, tick, payload length) and then the payload:
+    INPUT:    ship id, input sequence, controls - a key status that the host applied to a ship.
+    SPAWN:    the binary entity record (see WireFormatFile) of an object that has just been created.
+    DELETE:   the ids of objects that have just been removed from the world.
+    SNAPSHOT: the binary entity records of everything in the world.
+Alongside it is an index file (the same name + ".idx") of (tick, offset) pairs, one for each SNAPSHOT, in order, so a
+reader can jump straight to the last snapshot before any tick, without reading everything before it.
+"""
+
+MAGIC = b"SWR1"
+INPUT = 1
+SPAWN = 2
+DELETE = 3
+SNAPSHOT = 4
+KIND_NAMES = {INPUT: "INPUT", SPAWN: "SPAWN", DELETE: "DELETE", SNAPSHOT: "SNAPSHOT"}
+
+file_header_struct = struct.Struct('>4sdd')
+record_header_struct = struct.Struct('>BII')
+input_struct = struct.Struct('>IIB')
+index_entry_struct = struct.Struct('>IQ')
+
+
+def index_path_for(path: str) -> str:
+    return path + ".idx"
+
+
+class MatchRecorder:
+    """
+    Writes a match recording. The record_... methods are called from the game loop (and the listener threads), so all
+    they do is put what they were given on a queue; a background thread packs it and writes it to the file. Call
+    close() when the match is over - the writer is a daemon thread, so whatever it hasn't written yet is lost if the
+    program just exits.
+    """
+    def __init__(self, path: str, tick_interval: float, max_bytes: Optional[int] = None):
+        """
+        :param path: the file to record to. (Its folder is created, if need be.)
+        :param tick_interval: how many seconds there are between ticks (the host's send_interval)
+        :param max_bytes: once the file would grow past this size, the recording stops (what is there is kept, and is
+        still a complete recording). None for no limit.
+        """
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.full = False  # whether the recording has reached max_bytes, so nothing more is recorded.
+        self.log_file = open(path, "wb")
+        self.index_file = open(index_path_for(path), "wb")
+        self.log_file.write(file_header_struct.pack(MAGIC, tick_interval, time.time()))
+        self.pending = queue.SimpleQueue()
+        self.writer_thread = threading.Thread(target=self.write_records, daemon=True)
+        self.writer_thread.start()
+
+    def record(self, item: Tuple) -> None:
+        if not self.full:
+            self.pending.put(item)
+
+    def record_input(self, tick: int, ship_id: int, input_sequence: int, controls: int) -> None:
+        self.record((INPUT, tick, (ship_id, input_sequence, controls)))
+
+    def record_spawn(self, tick: int, entity_record: bytes) -> None:
+        self.record((SPAWN, tick, entity_record))
+
+    def record_deletions(self, tick: int, object_ids: List[int]) -> None:
+        self.record((DELETE, tick, object_ids))
+
+    def record_snapshot(self, tick: int, entity_records: List[bytes]) -> None:
+        """
+        :param entity_records: the binary records of every object in the world. (These usually come straight from
+        the host's record_cache, and are only joined together by the writer.)
+        """
+        self.record((SNAPSHOT, tick, entity_records))
+
+    def close(self) -> None:
+        """
+        finishes writing everything that has been recorded, and closes the files. Anything recorded after this is
+        ignored.
+        :return: None
+        """
+        self.pending.put(None)
+        self.writer_thread.join()
+        self.full = True
+
+    def write_records(self) -> None:
+        """
+        a loop intended for a Thread: pack and write whatever is put on the queue, flushing the files whenever the
+        queue is empty, until close() is called - or, once the file has reached max_bytes, just throw it away.
+        :return: None
+        """
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            if self.full:
+                continue
+            kind, tick, contents = item
+            if kind == INPUT:
+                payload = input_struct.pack(*contents)
+            elif kind == DELETE:
+                payload = struct.pack(f'>{len(contents)}I', *contents)
+            elif kind == SNAPSHOT:
+                payload = b"".join(contents)
+            else:
+                payload = contents
+            if self.max_bytes is not None and \
+                    self.log_file.tell() + record_header_struct.size + len(payload) > self.max_bytes:
+                self.full = True
+                print(f"{self.path} has reached {self.max_bytes} bytes, so the recording has stopped.")
+                continue
+            if kind == SNAPSHOT:
+                self.index_file.write(index_entry_struct.pack(tick, self.log_file.tell()))
+            self.log_file.write(record_header_struct.pack(kind, tick, len(payload)))
+            self.log_file.write(payload)
+            if self.pending.empty():
+                self.log_file.flush()
+                self.index_file.flush()
+        self.log_file.close()
+        self.index_file.close()
+
+
+class MatchReplay:
+    """
+    Reads a match recording. Both the log and its index are memory-mapped, so opening even a very long recording is
+    quick, and only the parts that are actually read are loaded from the disk.
+    """
+    def __init__(self, path: str):
+        self.log_file = open(path, "rb")
+        self.log = mmap.mmap(self.log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.tick_interval, self.start_time = file_header_struct.unpack_from(self.log)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a match recording.")
+        self.index_file = None
+        self.index = b""
+        index_path = index_path_for(path)
+        if os.path.exists(index_path) and os.path.getsize(index_path) >= index_entry_struct.size:
+            self.index_file = open(index_path, "rb")
+            self.index = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # (if the host stopped in the middle of writing an entry, ignore the partial one.)
+        self.num_snapshots = len(self.index) // index_entry_struct.size
+
+    def close(self) -> None:
+        self.log.close()
+        self.log_file.close()
+        if self.index_file is not None:
+            self.index.close()
+            self.index_file.close()
+
+    def snapshot_entry(self, position: int) -> Tuple[int, int]:
+        """
+        :return: the (tick, offset) of the snapshot at the given position in the index.
+        """
+        return index_entry_struct.unpack_from(self.index, position * index_entry_struct.size)
+
+    def first_tick(self) -> int:
+        return self.snapshot_entry(0)[0] if self.num_snapshots > 0 else 0
+
+    def last_tick(self) -> int:
+        return self.snapshot_entry(self.num_snapshots - 1)[0] if self.num_snapshots > 0 else 0
+
+    def seek(self, tick: int) -> int:
+        """
+        finds where to start reading to see the world as it was at the given tick, by a binary search of the index.
+        :param tick: the tick to go to
+        :return: the offset of the last snapshot at or before that tick (or of the first record, if there isn't one).
+        """
+        low, high = 0, self.num_snapshots
+        while low < high:
+            middle = (low + high) // 2
+            if self.snapshot_entry(middle)[0] <= tick:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return file_header_struct.size
+        return self.snapshot_entry(low - 1)[1]
+
+    def records(self, offset: int = None) -> Iterator[Tuple[int, int, memoryview]]:
+        """
+        reads the records in order, starting at the given offset, up to the last complete one.
+        :param offset: where to start (e.g., from seek()); defaults to the first record.
+        :return: an iterator of (kind, tick, payload) - the payload is a view into the mapped file, not a copy.
+        """
+        if offset is None:
+            offset = file_header_struct.size
+        view = memoryview(self.log)
+        end = len(self.log)
+        while offset + record_header_struct.size <= end:
+            kind, tick, length = record_header_struct.unpack_from(self.log, offset)
+            offset += record_header_struct.size
+            if offset + length > end:
+                break
+            yield kind, tick, view[offset:offset + length]
+            offset += length
+
+    def snapshots(self, from_tick: int = 0) -> Iterator[Tuple[int, memoryview]]:
+        """
+        :return: an iterator of (tick, entity records) for each snapshot, starting from the last one at or before
+        from_tick.
+        """
+        for kind, tick, payload in self.records(self.seek(from_tick)):
+            if kind == SNAPSHOT:
+                yield tick, payload
+
+    @staticmethod
+    def unpack_input(payload: memoryview) -> Tuple[int, int, int]:
+        """
+        :return: (ship id, input sequence, controls) from an INPUT record.
+        """
+        return input_struct.unpack(payload)
+
+    @staticmethod
+    def unpack_deletions(payload: memoryview) -> List[int]:
+        """
+        :return: the object ids from a DELETE record.
+        """
+        return list(struct.unpack(f'>{len(payload) // 4}I', payload))
+
+    def summary(self) -> dict:
+        """
+        counts the records of each kind, reading through the whole log once (without loading it all at once).
+        :return: a dictionary of the counts, the number of ticks and the length of the match.
+        """
+        counts = {name: 0 for name in KIND_NAMES.values()}
+        last_tick: Optional[int] = None
+        for kind, tick, payload in self.records():
+            counts[KIND_NAMES[kind]] += 1
+            last_tick = tick
+        first_tick = self.first_tick()
+        return {"records": counts, "first_tick": first_tick, "last_tick": last_tick,
+                "seconds": ((last_tick or 0) - first_tick) * self.tick_interval, "bytes": len(self.log)}
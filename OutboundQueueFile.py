@@ -0,0 +1,165 @@
+import threading
+from collections import deque
+from enum import Enum
+from typing import List, Callable
+
+from SocketMessageIOFile import MessageType, Protocol
+
+# these messages describe the whole state of (the user's part of) the world, so only the newest one is worth sending.
+LATEST_WINS_TYPES = (MessageType.WORLD_UPDATE, MessageType.WORLD_DELTA)
+
+
+class OverflowPolicy(Enum):
+    DROP = 0        # throw away new messages while the backlog is over the limit.
+    DISCONNECT = 1  # give up on the user.
+
+
+max_backlog_bytes = 256 * 1024  # how much unsent data (not counting the latest world message) a user may have queued.
+overflow_policy = OverflowPolicy.DISCONNECT
+
+
+def frame_length(frame: List[bytes]) -> int:
+    """
+    :return: the total number of bytes in all the buffers of the frame.
+    """
+    return sum(map(len, frame))
+
+
+class OutboundQueue:
+    """
+    The frames waiting to be sent to one user. The game loop and the listener threads put frames in here without ever
+    touching the socket; a separate writer (a thread, or an asyncio task) takes them out and sends them. That way, a
+    user whose connection is slow only delays its own messages.
+    World messages are "latest wins": a new one replaces one that hasn't gone out yet, and it is always sent after the
+    other queued frames, so the user never sees an older world after a newer one.
+    While the queue is held (see hold() and flush()), frames pile up without waking the writer, so that everything a
+    tick produces for the user goes out together, in one write.
+    Each frame is a list of buffers (see SocketMessageIO.build_frame_buffers), which may be shared with other users'
+    queues - so they must never be modified once they have been put in a queue.
+    """
+    def __init__(self, protocol: Protocol = Protocol.TEXT):
+        self.protocol = protocol
+        self.frames = deque()
+        self.world_frame = None
+        self.backlog_bytes = 0
+        self.in_flight_bytes = 0  # what the writer has taken, but hasn't finished sending yet.
+        self.dropped_frames = 0
+        self.closed = False
+        self.held = False
+        self.condition = threading.Condition()
+        # called (while the queue is locked) whenever there is something new to send - e.g., so an asyncio writer can
+        # be woken up. Threaded writers just wait in take_frames() instead.
+        self.on_ready: Callable[[], None] = None
+
+    def put(self, frame: List[bytes], message_type: MessageType, protocol: Protocol = None) -> bool:
+        """
+        adds a frame to the queue.
+        :param frame: the buffers to send
+        :param message_type: what type of message this frame holds
+        :param protocol: the protocol the frame was built for. If the user has switched protocols since, the frame is
+        silently thrown away, as the user couldn't read it.
+        :return: False if the backlog is over the limit and the overflow policy says to disconnect this user; True
+        otherwise.
+        """
+        with self.condition:
+            if self.closed or (protocol is not None and protocol != self.protocol):
+                return True
+            if message_type in LATEST_WINS_TYPES:
+                self.world_frame = frame
+            elif self.backlog_bytes + frame_length(frame) > max_backlog_bytes:
+                self.dropped_frames += 1
+                return overflow_policy == OverflowPolicy.DROP
+            else:
+                self.frames.append(frame)
+                self.backlog_bytes += frame_length(frame)
+            if not self.held:
+                self.condition.notify()
+                if self.on_ready is not None:
+                    self.on_ready()
+        return True
+
+    def hold(self) -> None:
+        """
+        keep the frames that are put in the queue from now on until flush() is called, rather than waking the writer
+        for each one.
+        :return: None
+        """
+        with self.condition:
+            self.held = True
+
+    def flush(self) -> None:
+        """
+        stop holding frames back, and wake the writer if there is anything to send.
+        :return: None
+        """
+        with self.condition:
+            self.held = False
+            if len(self.frames) > 0 or self.world_frame is not None:
+                self.condition.notify()
+                if self.on_ready is not None:
+                    self.on_ready()
+
+    def switch_protocol(self, reply_frame: List[bytes], protocol: Protocol) -> None:
+        """
+        queues the reply to a PROTOCOL request and switches to the new protocol, all in one step, so that no frame
+        built for the old protocol can be queued after the reply.
+        :param reply_frame: the PROTOCOL reply, built in the old protocol
+        :param protocol: the protocol to use from now on
+        :return: None
+        """
+        with self.condition:
+            self.frames.append(reply_frame)
+            self.backlog_bytes += frame_length(reply_frame)
+            self.world_frame = None
+            self.protocol = protocol
+            self.condition.notify()
+            if self.on_ready is not None:
+                self.on_ready()
+
+    def take_frames(self, block: bool = True) -> List[List[bytes]]:
+        """
+        removes everything that is waiting to be sent.
+        :param block: whether to wait until there is something to send and the queue isn't being held (or the queue
+        is closed)
+        :return: the frames to send, in order. An empty list means there was nothing to send - or, if block was True,
+        that the queue has been closed.
+        """
+        with self.condition:
+            while block and not self.closed and (self.held or (len(self.frames) == 0 and self.world_frame is None)):
+                self.condition.wait()
+            result = list(self.frames)
+            if self.world_frame is not None:
+                result.append(self.world_frame)
+            self.frames.clear()
+            self.world_frame = None
+            self.backlog_bytes = 0
+            self.in_flight_bytes = sum(map(frame_length, result))
+            return result
+
+    def finished_sending(self) -> None:
+        """
+        the writer has sent everything it last took (i.e., the socket has accepted it all).
+        :return: None
+        """
+        with self.condition:
+            self.in_flight_bytes = 0
+
+    def pending_bytes(self) -> int:
+        """
+        :return: how much is waiting to go to the user: everything in the queue, including the latest world message,
+        plus whatever the writer is still trying to send - which stays high while the connection can't keep up.
+        """
+        with self.condition:
+            world_bytes = 0 if self.world_frame is None else frame_length(self.world_frame)
+            return self.backlog_bytes + world_bytes + self.in_flight_bytes
+
+    def close(self) -> None:
+        """
+        stop accepting frames, and wake up the writer so that it can finish.
+        :return: None
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+            if self.on_ready is not None:
+                self.on_ready()
@@ -2,24 +2,45 @@ import math
 import random
 import time
 
+from WireFormatFile import pack_player
+
 angular_velocity = 1.5 * math.pi
 acceleration = 30
 max_v = 60
 max_v_squared = max_v **2
+fire_cooldown = 0.25  # the least time (in seconds) between two shots from the same ship.
+
+# where ships get the time (for the fire cooldown) and their random starting places from. A HeadlessMatch replaces these
+# with its virtual clock and a seeded Random, so that the same match plays out the same way every time.
+clock = time.time
+rng = random.Random()
 
 class PlayerShip:
+    __slots__ = ("x", "y", "vx", "vy", "bearing", "controls", "my_id", "health", "name", "last_shot_taken",
+                 "input_sequence", "input_step")
 
     def __init__(self, id:int, name:str):
-        self.x = random.randrange(800)
-        self.y = random.randrange(800)
+        self.reset(id, name)
+
+    def reset(self, id: int, name: str) -> None:
+        """
+        (re)starts this ship for a new player, in a random place. (The host reuses the ships of players who have left.)
+        :param id: the ship's unique id number
+        :param name: the name of the ship's user
+        :return: None
+        """
+        self.x = rng.randrange(800)
+        self.y = rng.randrange(800)
         self.vx = 0
         self.vy = 0
-        self.bearing = random.random() * 2 * math.pi - math.pi
+        self.bearing = rng.random() * 2 * math.pi - math.pi
         self.controls = 0
         self.my_id = id
         self.health = 100
         self.name = name
-        self.last_shot_taken = time.time()
+        self.last_shot_taken = clock()
+        self.input_sequence = 0  # the number of the last key status that was applied to this ship...
+        self.input_step = 0      # ... and the host's simulation step on which it was first applied.
 
     def update(self, delta_t: float) -> None:
         self.x += self.vx * delta_t
@@ -42,8 +63,8 @@ class PlayerShip:
             self.vy *= factor
 
     def ok_to_fire(self) -> bool:
-        now = time.time()
-        if now - self.last_shot_taken > 0.25:
+        now = clock()
+        if now - self.last_shot_taken > fire_cooldown:
             self.last_shot_taken = now
             return True
         return False
@@ -51,6 +72,19 @@ class PlayerShip:
     def __repr__(self):
         return f"id: {self.my_id}\tcontrols{format(self.controls,'#010b')}"
 
+    def public_state(self) -> tuple:
+        """
+        :return: everything that goes into this ship's public_info, so that we can tell whether it has changed.
+        """
+        return self.x, self.y, self.bearing, min(self.controls & 12, 1), self.health, self.name, self.vx, self.vy, \
+            self.input_sequence, self.input_step
+
     def public_info(self):
         thrusting = min(self.controls & 12, 1)
-        return f"PLAYER\t{self.my_id}\t{self.x}\t{self.y}\t{self.bearing}\t{thrusting}\t{self.health}\t{self.name}"
+        return f"PLAYER\t{self.my_id}\t{self.x}\t{self.y}\t{self.bearing}\t{thrusting}\t{self.health}\t{self.name}" \
+               f"\t{self.vx}\t{self.vy}\t{self.input_sequence}\t{self.input_step}"
+
+    def binary_info(self) -> bytes:
+        thrusting = min(self.controls & 12, 1)
+        return pack_player(self.my_id, self.x, self.y, self.bearing, thrusting, self.health, self.name, self.vx, self.vy,
+                           self.input_sequence, self.input_step)
@@ -0,0 +1,67 @@
+from typing import Dict, List
+
+from BulletFile import bullet_public_info
+from SocketMessageIOFile import Protocol
+from WireFormatFile import pack_bullet
+
+
+class RecordCache:
+    """
+    Remembers the encoded record (the bytes that describe it in a WORLD_UPDATE, DELETE_ITEMS or WORLD_DELTA message) of
+    each on-screen object, in each protocol. An object's records are only rebuilt when its public_state() has changed
+    since they were made, so an object that is sitting still costs a comparison per tick, rather than a string format
+    and an encode per user. Unchanged objects also keep the very same bytes object from tick to tick, which makes
+    comparing snapshots cheap.
+    """
+    def __init__(self):
+        # object id -> [public_state, text record, binary record]
+        self.entries: Dict[int, List] = {}
+
+    def record(self, object_id: int, item, protocol: Protocol) -> bytes:
+        """
+        finds the encoded record for the object, building it if the object has changed since last time.
+        :param object_id: the object's unique id number
+        :param item: the PlayerShip, Bullet, etc.
+        :param protocol: which protocol the record is for
+        :return: the bytes of the record - the public_info plus a newline for the text protocol, or the packed record
+        for the binary protocol.
+        """
+        state = item.public_state()
+        entry = self.entries.get(object_id)
+        if entry is None or entry[0] != state:
+            entry = [state, None, None]
+            self.entries[object_id] = entry
+        if protocol == Protocol.BINARY:
+            if entry[2] is None:
+                entry[2] = item.binary_info()
+            return entry[2]
+        if entry[1] is None:
+            entry[1] = f"{item.public_info()}\n".encode()
+        return entry[1]
+
+    def bullet_record(self, bullet_id: int, x: float, y: float, owner_id: int, protocol: Protocol) -> bytes:
+        """
+        the same as record(), for a bullet whose values have already been read (e.g., straight from the entity store's
+        arrays), so the bullet itself isn't needed.
+        :return: the bytes of the bullet's record.
+        """
+        state = (x, y, owner_id)
+        entry = self.entries.get(bullet_id)
+        if entry is None or entry[0] != state:
+            entry = [state, None, None]
+            self.entries[bullet_id] = entry
+        if protocol == Protocol.BINARY:
+            if entry[2] is None:
+                entry[2] = pack_bullet(bullet_id, x, y, owner_id)
+            return entry[2]
+        if entry[1] is None:
+            entry[1] = f"{bullet_public_info(bullet_id, x, y, owner_id)}\n".encode()
+        return entry[1]
+
+    def forget(self, object_id: int) -> None:
+        """
+        the object has been removed from the world, so we won't need its records again.
+        :param object_id: the object's unique id number
+        :return: None
+        """
+        self.entries.pop(object_id, None)
@@ -0,0 +1,142 @@
+import argparse
+import json
+import time
+
+from ClientGUIFile import ClientGUI
+from MatchRecordingFile import MatchReplay
+from SocketClientFile import assign_color
+from WorldDecoderFile import WorldDecoder
+
+"""
+Plays back a match that the host recorded (see MatchRecordingFile), in the same window as the client - at normal speed,
+or faster. Only the snapshots in the recording are drawn; as in the client, the objects move smoothly between them.
+The left and right arrow keys jump back and forward by jump_seconds.
+Run it with, e.g., "python ReplayFile.py recordings/match-20221001-120000-1234.swr --speed 4", or with --summary to
+just print what is in the recording.
+"""
+
+frame_rate = 60  # how many times per second the screen is redrawn.
+jump_seconds = 10.0  # how far the arrow keys move through the match.
+max_extrapolation = 0.1  # as in the client: if the next snapshot is missing, keep things moving for this long.
+
+replay = None  # the MatchReplay being shown.
+snapshot_gap = 0.1  # the time between snapshots in the recording, in match seconds. (Found when the file is opened.)
+world_decoder = WorldDecoder()
+visible_records = []
+upcoming_snapshots = None  # the iterator of (tick, payload) snapshots still to be shown.
+next_snapshot = None  # the next of those, which is not due yet.
+replay_time = 0.0  # the point in the match that we have reached, in seconds from tick 0.
+speed = 1.0
+last_frame_time = 0.0
+
+
+def open_replay(path: str) -> None:
+    """
+    opens the recording, and works out how far apart its snapshots are from the first two entries in its index.
+    :param path: the recording to show
+    :return: None
+    """
+    global replay, snapshot_gap
+    replay = MatchReplay(path)
+    if replay.num_snapshots >= 2:
+        snapshot_gap = (replay.snapshot_entry(1)[0] - replay.snapshot_entry(0)[0]) * replay.tick_interval
+
+
+def seek_to(tick: int) -> None:
+    """
+    jumps to the given tick: clears everything off the screen, and starts again from the last snapshot before it.
+    :param tick: where to go in the match
+    :return: None
+    """
+    global world_decoder, upcoming_snapshots, next_snapshot, replay_time
+    tick = max(replay.first_tick(), min(tick, replay.last_tick()))
+    for record in world_decoder.current_records():
+        client_gui.delete_item_from_world(record.kind, record.id)
+    world_decoder = WorldDecoder()
+    upcoming_snapshots = replay.snapshots(tick)
+    next_snapshot = next(upcoming_snapshots, None)
+    replay_time = tick * replay.tick_interval
+
+
+def feed_snapshots() -> None:
+    """
+    hands the decoder every snapshot up to one snapshot_gap ahead of replay_time, so that there is always one on
+    either side of the moment being drawn. Each snapshot is stamped with its time in the match, so the decoder's records
+    can be drawn at any point in it, whatever the speed.
+    :return: None
+    """
+    global next_snapshot
+    while next_snapshot is not None and next_snapshot[0] * replay.tick_interval <= replay_time + snapshot_gap:
+        tick, payload = next_snapshot
+        world_decoder.apply_update(bytes(payload), arrival_time=tick * replay.tick_interval)
+        next_snapshot = next(upcoming_snapshots, None)
+
+
+def render_frame() -> None:
+    """
+    runs on the GUI's thread, frame_rate times per second: move replay_time on by however long it has been since the
+    last frame (times the speed), and draw the world as it was then.
+    :return: None
+    """
+    global replay_time, last_frame_time
+    now = time.monotonic()
+    replay_time += (now - last_frame_time) * speed
+    last_frame_time = now
+    feed_snapshots()
+
+    visible_records.clear()
+    for record in world_decoder.current_records():
+        if record.removed_time is not None and replay_time >= record.removed_time:
+            client_gui.delete_item_from_world(record.kind, record.id)
+            world_decoder.release(record)
+        elif record.position_at(replay_time, max_extrapolation):
+            assign_color(record)
+            visible_records.append(record)
+    client_gui.update_world(visible_records)
+    client_gui.root.after(int(1000 / frame_rate), render_frame)
+
+
+def jump(seconds: float) -> None:
+    """
+    moves through the match by the given number of seconds (backwards, if negative).
+    :return: None
+    """
+    seek_to(int((replay_time + seconds) / replay.tick_interval))
+
+
+def close_replay() -> None:
+    """
+    (called by the GUI when the window closes, in place of shutting down a socket.)
+    :return: None
+    """
+    global upcoming_snapshots, next_snapshot
+    upcoming_snapshots = next_snapshot = None  # (these hold views into the mapped file, which must go before it closes.)
+    replay.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play back a recorded match.")
+    parser.add_argument("path", help="the recording (a .swr file from the host's recording_directory)")
+    parser.add_argument("--start-tick", type=int, default=0, help="where to start in the match")
+    parser.add_argument("--speed", type=float, default=1.0, help="how many times faster than real time to play it")
+    parser.add_argument("--summary", action="store_true", help="just print what is in the recording")
+    args = parser.parse_args()
+
+    open_replay(args.path)
+    if args.summary:
+        print(json.dumps(replay.summary(), indent=2))
+        replay.close()
+    else:
+        speed = args.speed
+        client_gui = ClientGUI()
+        client_gui.root.title(f"Replay - {args.path}")
+        client_gui.shut_down_socket = close_replay
+        client_gui.root.bind("<Left>", lambda event_info: jump(-jump_seconds))
+        client_gui.root.bind("<Right>", lambda event_info: jump(jump_seconds))
+        client_gui.add_to_chat(f"Replaying {args.path} at {speed}x, from tick {args.start_tick}. "
+                               f"The arrow keys jump {jump_seconds} s.")
+        seek_to(args.start_tick)
+        last_frame_time = time.monotonic()
+        client_gui.root.after(int(1000 / frame_rate), render_frame)
+        client_gui.run_loop()
+        print("Done.")
@@ -0,0 +1,144 @@
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+from EntityRecordFile import EntityRecord, PLAYER
+from PlayerShipFile import PlayerShip
+
+max_pending_steps = 500  # if the host stops answering, don't remember more than this many steps (10 s at 50 Hz).
+
+
+class ShipPredictor:
+    """
+    Runs the user's own ship on the client, with the same PlayerShip physics the host uses, so that it responds to the
+    keys right away, instead of a round trip later.
+    Every step we predict is remembered, along with the input (sequence number and key status) it used. Each PLAYER
+    record from the host says which input the host had most recently applied to the ship and on which of its steps it
+    first applied it, and each snapshot says how many steps the host had run when it was taken - so we can tell how many
+    steps the host has run with that input. When a snapshot arrives, we start again from the host's version of the ship
+    and replay just the steps that the host hasn't run yet.
+    All of this happens on the GUI's thread - except receive_authoritative(), which the listener calls.
+    """
+    def __init__(self, ship_id: int, step_interval: float = 0.02, max_steps_per_frame: int = 5):
+        self.ship_id = ship_id
+        self.step_interval = step_interval  # this should match the host's simulation_interval.
+        self.max_steps_per_frame = max_steps_per_frame
+        self.ship: PlayerShip = None  # we don't know where the ship is until the host tells us.
+        self.controls = 0
+        self.input_sequence = 0
+        self.steps_with_input = 0  # how many steps we've predicted since the input changed.
+        # (input sequence, number of the step within that input, controls) for each step the host might not have run.
+        self.pending_steps = deque()
+        # the newest state of our ship from the host, if we haven't used it yet: (x, y, bearing, vx, vy, health, name,
+        # input sequence, steps run with that input).
+        self.authoritative: Tuple = None
+        self.record = EntityRecord()  # what advance() returns, reused for every frame.
+        self.record.reset(PLAYER, ship_id)
+        self.accumulator = 0.0
+        self.last_time = None
+
+    def set_controls(self, input_sequence: int, controls: int) -> None:
+        """
+        the user has changed which keys are held (and we've sent that to the host as the given input).
+        :param input_sequence: the sequence number we sent with it
+        :param controls: an int with binary flags indicating whether left, right, up, down, fire keys are being held.
+        :return: None
+        """
+        self.input_sequence = input_sequence
+        self.controls = controls
+        self.steps_with_input = 0
+
+    def receive_authoritative(self, record: EntityRecord, host_step: Optional[int]) -> None:
+        """
+        the host has sent the real state of our ship. We just copy it out of the record (which the listener will go
+        on updating) and hold on to it until the next call to advance(), so this is safe to call from the listener
+        thread.
+        :param record: the EntityRecord for our ship, just after it was updated from the host's snapshot
+        :param host_step: how many simulation steps the host had run when it took the snapshot (None if it didn't say)
+        :return: None
+        """
+        x, y, bearing = record.latest_position()
+        steps_run = 0 if host_step is None else max(0, host_step - record.input_step)
+        self.authoritative = (x, y, bearing, record.vx, record.vy, record.health, record.name, record.input_sequence,
+                              steps_run)
+
+    def advance(self) -> Optional[EntityRecord]:
+        """
+        apply the newest state from the host (if any), then run as many steps as are due since the last call.
+        :return: an EntityRecord whose draw_x, draw_y and draw_bearing are where the ship is predicted to be now, or
+        None if we don't know yet.
+        """
+        state = self.authoritative
+        if state is not None:
+            self.authoritative = None
+            self.reconcile(state)
+        if self.ship is None:
+            return None
+
+        now = time.monotonic()
+        if self.last_time is None:
+            self.last_time = now
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = 0
+        while self.accumulator >= self.step_interval and steps < self.max_steps_per_frame:
+            self.step()
+            self.accumulator -= self.step_interval
+            steps += 1
+        if self.accumulator >= self.step_interval:  # we're too far behind; the host will put us right.
+            self.accumulator = 0.0
+        return self.describe()
+
+    def step(self) -> None:
+        """
+        run the ship forward by one step with the current controls, and remember that we did.
+        :return: None
+        """
+        self.ship.controls = self.controls
+        self.ship.update(self.step_interval)
+        self.pending_steps.append((self.input_sequence, self.steps_with_input, self.controls))
+        self.steps_with_input += 1
+        if len(self.pending_steps) > max_pending_steps:
+            self.pending_steps.popleft()
+
+    def reconcile(self, state: Tuple) -> None:
+        """
+        move the ship to where the host says it was, forget the steps the host has already run, and replay the rest.
+        :param state: our ship's state from the host, as stored by receive_authoritative()
+        :return: None
+        """
+        x, y, bearing, vx, vy, health, name, acked_sequence, steps_already_run = state
+        if self.ship is None:
+            self.ship = PlayerShip(self.ship_id, name)
+        self.ship.x = x
+        self.ship.y = y
+        self.ship.vx = vx
+        self.ship.vy = vy
+        self.ship.bearing = bearing
+        self.ship.health = health
+        self.ship.name = name
+
+        # the host has run every step of the inputs before the one it applied last (acked_sequence), and the first
+        # steps_already_run steps of that one.
+        while len(self.pending_steps) > 0 and (self.pending_steps[0][0] < acked_sequence or
+                                               (self.pending_steps[0][0] == acked_sequence and
+                                                self.pending_steps[0][1] < steps_already_run)):
+            self.pending_steps.popleft()
+
+        for sequence, step_number, controls in self.pending_steps:
+            self.ship.controls = controls
+            self.ship.update(self.step_interval)
+        self.ship.controls = self.controls
+
+    def describe(self) -> EntityRecord:
+        """
+        :return: our record for the predicted ship, updated to where it is now.
+        """
+        record = self.record
+        record.draw_x = self.ship.x
+        record.draw_y = self.ship.y
+        record.draw_bearing = self.ship.bearing
+        record.thrusting = self.controls & 12 != 0
+        record.health = self.ship.health
+        record.name = self.ship.name
+        return record
@@ -0,0 +1,70 @@
+from typing import Dict, List, Tuple
+
+keyframe_interval = 250  # send a full snapshot at least this often (in ticks), even if the client is keeping up.
+history_length = 64      # how many unacknowledged snapshots to remember before giving up and sending a keyframe.
+
+
+class SnapshotTracker:
+    """
+    Keeps track, for a single client, of the snapshots of the world that we have sent it and which of them it has
+    acknowledged, so that each new snapshot can be sent as a delta against the last one the client is known to have.
+    A snapshot is a dictionary of {object id: encoded record}; a record is whatever the client's protocol uses to
+    describe the object (an encoded public_info line, or packed bytes), so comparing two records tells us whether the
+    object changed.
+    """
+    def __init__(self):
+        self.history: Dict[int, Dict[int, bytes]] = {}
+        self.acked_tick = None
+        self.keyframe_requested = True
+        self.ticks_since_keyframe = 0
+
+    def acknowledge(self, tick: int) -> None:
+        """
+        the client has told us that it has applied the snapshot for this tick. (This only records the tick, so it is
+        safe to call from a different thread than build_delta; the older history is forgotten in build_delta.)
+        :param tick: the tick the client acknowledged
+        :return: None
+        """
+        if self.acked_tick is None or tick > self.acked_tick:
+            self.acked_tick = tick
+
+    def request_keyframe(self) -> None:
+        """
+        make the next snapshot a full one - e.g., because the client lost track of what it has.
+        :return: None
+        """
+        self.keyframe_requested = True
+
+    def build_delta(self, tick: int, snapshot: Dict[int, bytes]) -> Tuple[int, List, List[int]]:
+        """
+        records that we are about to send the client this snapshot, and works out what the client needs to be told to
+        get there from the last snapshot it acknowledged.
+        :param tick: the tick number of this snapshot
+        :param snapshot: a dictionary of {object id: record} for everything the client should see. This should not be
+        modified afterwards, as we keep hold of it.
+        :return: the tick this delta is based on (0 for a keyframe), the records that were created or changed, and
+        the ids of objects that were removed.
+        """
+        acked_tick = self.acked_tick
+        if acked_tick is not None:
+            for old_tick in [t for t in self.history if t < acked_tick]:
+                del self.history[old_tick]
+
+        base = None
+        if not self.keyframe_requested and self.ticks_since_keyframe < keyframe_interval:
+            base = self.history.get(acked_tick)
+
+        self.history[tick] = snapshot
+        if len(self.history) > history_length:
+            del self.history[min(self.history)]
+
+        if base is None:
+            self.keyframe_requested = False
+            self.ticks_since_keyframe = 0
+            return 0, list(snapshot.values()), []
+
+        self.ticks_since_keyframe += 1
+        base_record = base.get  # (looked up once, as this runs for every object in the snapshot.)
+        changed = [record for object_id, record in snapshot.items() if base_record(object_id) != record]
+        removed = [object_id for object_id in base if object_id not in snapshot]
+        return acked_tick, changed, removed
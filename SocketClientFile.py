@@ -1,14 +1,44 @@
 import random
 import socket
 import threading
+import time
 
 from ClientGUIFile import ClientGUI
+from DatagramChannelFile import DatagramChannel, read_datagram_header, datagram_header_struct
+from EntityRecordFile import EntityRecord, PLAYER
 from RepeatTimerFile import RepeatTimer
-from SocketMessageIOFile import SocketMessageIO, MessageType
+from ShipPredictorFile import ShipPredictor
+from SocketMessageIOFile import SocketMessageIO, MessageType, Protocol, DELTA_FEATURE, PREDICTION_FEATURE, \
+    DATAGRAM_FEATURE, PING_FEATURE
+from WireFormatFile import PROTOCOL_VERSION
+from WorldDecoderFile import WorldDecoder
 
 host_URL = '127.0.0.1'
 port = 3001
+use_binary_protocol = True  # ask the host to switch to the compact binary protocol when we connect.
+use_delta_snapshots = True  # ask the host to send only what has changed in the world, rather than all of it.
+use_prediction = True  # move our own ship as soon as a key is pressed, rather than waiting to hear from the host.
+use_ping = True  # answer the host's PINGs, so it can measure our link and send us less if it is struggling.
+use_datagrams = True  # ask for the world to come over UDP (and send our key status that way), beside the TCP connection.
+                      # (The host only agrees if we are using delta snapshots, too.)
+datagram_hello_interval = 0.5  # until the first datagram arrives, say hello to the host's UDP port this often.
+datagram_input_copies = 3  # each new key status goes out this many times over UDP, in case some of them are lost.
+datagram_channel = None  # once datagrams are arriving, the DatagramChannel to the host.
+prediction_interval = 0.02  # the length of each predicted step - this should match the host's simulation_interval.
+predictor = None  # the ShipPredictor for our own ship, once the host has told us which one it is.
 color_dictionary = {}
+frame_rate = 60  # how many times per second the screen is redrawn.
+playout_delay = 0.1  # we show the world as it was this many seconds ago, so we can move smoothly between snapshots...
+max_extrapolation = 0.1  # ... and if a snapshot is late, keep things moving for up to this long before waiting.
+snapshot_gap = 0.02  # how far apart the host says it is sending our snapshots. (If it slows down, we show the world
+                     # further in the past, so there is still a snapshot on either side of what we draw.)
+host_rtt = None  # the round trip time to the host, in seconds, as the host last measured it.
+world_decoder = WorldDecoder()  # holds a record for each object in the world, updated by each snapshot.
+world_message_lock = threading.Lock()  # the world can arrive over TCP and UDP at once; this handles one at a time.
+visible_records = []  # the records to draw in the current frame. (The same list is refilled for each frame.)
+heartbeat_interval = 1.0  # even if no keys change, resend the key status this often so the host knows we're here.
+input_sequence = 0  # each key status we send is numbered, so the host can ignore any that are out of date.
+last_key_status_message = "0\t0"  # the most recent "sequence-->key status" we sent.
 
 def listen_for_messages(connection: socket) -> None:
     """
@@ -33,55 +63,214 @@ def listen_for_messages(connection: socket) -> None:
             handle_world_update(message)
         elif message_type == MessageType.DELETE_ITEMS:
             handle_delete_items(message)
+        elif message_type == MessageType.WORLD_DELTA:
+            handle_world_delta(message)
+        elif message_type == MessageType.SHIP_ID:
+            handle_ship_id(message)
+        elif message_type == MessageType.DATAGRAM_SESSION:
+            handle_datagram_session(message)
+        elif message_type == MessageType.PING:
+            handle_ping(message)
 
     print("listen_for_messages is over.")
 
-def handle_delete_items(tab_delimited_world_list_string: str) -> None:
-    lines = tab_delimited_world_list_string.split("\n")
-    for line in lines:
-        if line == "":
-            continue
-        values = line.split("\t")
-        user_id = int(values[1])
-        client_gui.delete_item_from_world(values[0], user_id)
+def handle_delete_items(message) -> None:
+    """
+    The host has told us about objects that no longer exist; stop showing them. (They come off the screen once the
+    render loop catches up to the moment they went.)
+    :param message: a newline-separated list of public_info strings (text protocol) or packed entity records (binary
+    protocol) for the objects that were deleted.
+    :return: None
+    """
+    world_decoder.apply_deletions(message)
+
+
+def handle_world_update(message) -> None:
+    """
+    The host has sent the current contents of the world; update the world_decoder's records with it, to be drawn by
+    the render loop.
+    :param message: a newline-separated list of public_info strings (text protocol) or packed entity records (binary
+    protocol) for every object in the world.
+    :return: None
+    """
+    with world_message_lock:
+        world_decoder.apply_update(message)
+        hand_own_ship_to_predictor()
 
 
+def handle_world_delta(message) -> None:
+    """
+    The host has sent the changes to the world since a snapshot we already have (or, if the base tick is 0, a whole
+    new snapshot). Update the world_decoder's records with it and let the host know we have it - or, if we no longer
+    have the snapshot it is based on, ask for the whole world again.
+    :param message: the tab-delimited text (text protocol) or packed bytes (binary protocol) of a WORLD_DELTA.
+    :return: None
+    """
+    with world_message_lock:
+        tick = world_decoder.apply_delta(message)
+        if tick is not None:
+            hand_own_ship_to_predictor()
+    if tick is None:
+        manager.send_message_to_socket("", mySocket, message_type=MessageType.KEYFRAME_REQUEST)
+        return
+    send_to_host(tick, MessageType.ACK)
 
 
+def handle_ship_id(message: str) -> None:
+    """
+    The host has told us which ship is ours, so start predicting its motion.
+    :param message: the id number of our ship
+    :return: None
+    """
+    global predictor
+    new_predictor = ShipPredictor(int(message), step_interval=prediction_interval)
+    new_predictor.set_controls(input_sequence, client_gui.key_status)
+    predictor = new_predictor
 
 
+def handle_ping(message: str) -> None:
+    """
+    The host wants to measure our link: answer with its own time and ours, straight away. The PING also tells us what
+    the host has measured, and how often we should expect snapshots.
+    :param message: "sequence-->host time-->round trip time in ms (or -1)-->snapshot interval"
+    :return: None
+    """
+    global host_rtt, snapshot_gap
+    sequence, host_time, rtt_ms, interval = message.split("\t")
+    manager.send_message_to_socket(f"{sequence}\t{host_time}\t{time.time()!r}", mySocket,
+                                   message_type=MessageType.PONG)
+    if float(rtt_ms) >= 0:
+        host_rtt = float(rtt_ms) / 1000
+    snapshot_gap = float(interval)
 
-def handle_world_update(tab_delimited_world_list_string: str) -> None:
-    global world_contents
-    world_contents = []
-    lines = tab_delimited_world_list_string.split("\n")
-    for line in lines:
-        values = line.split("\t")
-        game_object = {}
-        game_object["type"] = values[0]
-        if values[0] == "":
+
+def handle_datagram_session(message: str) -> None:
+    """
+    The host has agreed to send us the world over UDP, and given us a session token for it: open a UDP socket to it
+    and start listening for datagrams.
+    :param message: "session token-->the host's UDP port"
+    :return: None
+    """
+    token, host_datagram_port = [int(value) for value in message.split("\t")]
+    datagram_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    datagram_socket.connect((host_URL, host_datagram_port))
+    datagram_socket.settimeout(datagram_hello_interval)
+    threading.Thread(target=listen_for_datagrams, args=(DatagramChannel(datagram_socket, token),), daemon=True).start()
+
+
+def listen_for_datagrams(channel: DatagramChannel) -> None:
+    """
+    a loop intended for a Thread: say hello to the host over UDP (so it knows where to send to) until the first
+    datagram arrives, and then handle the world messages that come in, skipping any that are older than one we have
+    already had.
+    :param channel: our end of the UDP session
+    :return: None
+    """
+    global datagram_channel
+    parser = SocketMessageIO(manager.protocol)
+    hello = parser.build_frame_buffers("", MessageType.DATAGRAM_SESSION)
+    buffer = bytearray(64 * 1024)
+    channel.send_frame(hello, MessageType.DATAGRAM_SESSION)
+    while keep_listening:
+        try:
+            num_bytes = channel.socket.recv_into(buffer)
+        except socket.timeout:
+            if datagram_channel is None:
+                channel.send_frame(hello, MessageType.DATAGRAM_SESSION)
+            continue
+        except OSError:  # (e.g., nobody is listening on the host's UDP port.)
+            if datagram_channel is None:
+                time.sleep(datagram_hello_interval)
+                channel.send_frame(hello, MessageType.DATAGRAM_SESSION)
+                continue
+            break
+        if num_bytes <= datagram_header_struct.size:
             continue
-        if values[0] == "PLAYER":
-            game_object["id"] = int(values[1])
-            game_object["x"] = float(values[2])
-            game_object["y"] = float(values[3])
-            game_object["bearing"] = float(values[4])
-            game_object["thrusting"] = (int(values[5]) == 1)
-            game_object["health"] = int(values[6])
-            game_object["name"] = values[7]
-            if game_object["id"] not in color_dictionary:
-                color_dictionary[game_object["id"]] = "#" + \
-                    f"{random.randrange(64, 255):02X}{random.randrange(64, 255):02X}{random.randrange(64, 255):02X}"
-            game_object["color"] = color_dictionary[game_object["id"]]
-        if values[0] == "BULLET":
-            # print(f"Bullet handled. {values=} ")
-            game_object["id"] = int(values[1])
-            game_object["x"] = float(values[2])
-            game_object["y"] = float(values[3])
-            game_object["owner_id"] = int(values[4])
-
-        world_contents.append(game_object)
-    client_gui.update_world(world_contents)
+        token, sequence = read_datagram_header(buffer)
+        if token != channel.token:
+            continue
+        with memoryview(buffer) as view:
+            message_type, message = parser.parse_message(view[datagram_header_struct.size:num_bytes])
+        if not channel.accept(sequence, message_type):
+            continue
+        if datagram_channel is None:
+            datagram_channel = channel
+            print("The world is arriving over UDP.")
+        if message_type == MessageType.WORLD_UPDATE:
+            handle_world_update(message)
+        elif message_type == MessageType.WORLD_DELTA:
+            handle_world_delta(message)
+    channel.socket.close()
+
+
+def send_to_host(message, message_type: MessageType, copies: int = 1) -> None:
+    """
+    sends a key status or ACK to the host - over UDP, once datagrams are arriving, otherwise over TCP.
+    :param message: the message to send
+    :param message_type: its type
+    :param copies: how many times to send it, if it goes over UDP
+    :return: None
+    """
+    if datagram_channel is None:
+        manager.send_message_to_socket(message, mySocket, message_type=message_type)
+        return
+    frame = manager.build_frame_buffers(message, message_type)
+    for copy in range(copies):
+        datagram_channel.send_frame(frame, message_type)
+
+
+def hand_own_ship_to_predictor() -> None:
+    """
+    if we are predicting our own ship, pass the host's latest version of it to the predictor. (The render loop draws
+    the ship where the predictor says it is, rather than from its record.)
+    :return: None
+    """
+    if predictor is None:
+        return
+    record = world_decoder.records.get(predictor.ship_id)
+    if record is not None and record.removed_time is None:
+        predictor.receive_authoritative(record, world_decoder.host_step)
+
+
+def render_frame() -> None:
+    """
+    runs on the GUI's thread, frame_rate times per second: draw the world as the snapshots say it was playout_delay
+    seconds ago, or two snapshot gaps ago if that is longer (removing anything that had gone by then), and our own ship
+    where the predictor says it is now.
+    :return: None
+    """
+    render_time = time.monotonic() - max(playout_delay, 2 * snapshot_gap)
+    own_ship_id = predictor.ship_id if predictor is not None else None
+    visible_records.clear()
+    for record in world_decoder.current_records():
+        if record.removed_time is not None and render_time >= record.removed_time:
+            client_gui.delete_item_from_world(record.kind, record.id)
+            world_decoder.release(record)
+        elif record.id != own_ship_id and record.position_at(render_time, max_extrapolation):
+            assign_color(record)
+            visible_records.append(record)
+    client_gui.update_world(visible_records)
+
+    if predictor is not None:
+        own_ship = predictor.advance()
+        if own_ship is not None:
+            assign_color(own_ship)
+            client_gui.draw_player(own_ship)
+    client_gui.root.after(int(1000 / frame_rate), render_frame)
+
+
+def assign_color(record: EntityRecord) -> None:
+    """
+    gives a player's record its color, picking a new random one the first time we see that player.
+    :param record: the record of a game object
+    :return: None
+    """
+    if record.kind == PLAYER and record.color is None:
+        if record.id not in color_dictionary:
+            color_dictionary[record.id] = "#" + \
+                f"{random.randrange(64, 255):02X}{random.randrange(64, 255):02X}{random.randrange(64, 255):02X}"
+        record.color = color_dictionary[record.id]
+
 
 def handle_user_list_update(tab_delimited_user_list_string:str) -> None:
     """
@@ -145,16 +334,54 @@ def close_socket()  -> None:
     keep_listening = False
     mySocket.close()
 
-def update_keyboard() -> None:
-    keyboard_code = client_gui.key_status
-    # print(f"{bin(keyboard_code)}")
-    manager.send_message_to_socket(keyboard_code, mySocket, message_type=MessageType.KEY_STATUS)
+def send_key_status(key_status: int) -> None:
+    """
+    the keys being held have changed, so tell the host right away, with the next sequence number.
+    :param key_status: an int with binary flags indicating whether left, right, up, down, fire keys are being held.
+    :return: None
+    """
+    global input_sequence, last_key_status_message
+    input_sequence += 1
+    last_key_status_message = f"{input_sequence}\t{key_status}"
+    # print(f"{bin(key_status)}")
+    send_to_host(last_key_status_message, MessageType.KEY_STATUS, copies=datagram_input_copies)
+    if predictor is not None:
+        predictor.set_controls(input_sequence, key_status)
+
+
+def send_heartbeat() -> None:
+    """
+    resend the latest key status (with the same sequence number, so the host won't apply it twice) to let the host
+    know that we are still here, even when no keys have changed.
+    :return: None
+    """
+    send_to_host(last_key_status_message, MessageType.KEY_STATUS)
+
+
+def negotiate_protocol(connection: socket) -> None:
+    """
+    ask the host to switch this connection to the binary protocol and/or to turn on delta snapshots, and wait for its
+    answer. Any world messages that the host sends before its answer are ignored - the first snapshot after the switch
+    will replace them anyway.
+    :param connection: the socket to the host
+    :return: None
+    """
+    requested_protocol = Protocol.BINARY if use_binary_protocol else Protocol.TEXT
+    features = ([DELTA_FEATURE] if use_delta_snapshots else []) + ([PREDICTION_FEATURE] if use_prediction else []) + \
+        ([DATAGRAM_FEATURE] if use_datagrams else []) + ([PING_FEATURE] if use_ping else [])
+    manager.send_message_to_socket("\t".join([requested_protocol.name, str(PROTOCOL_VERSION)] + features), connection,
+                                   message_type=MessageType.PROTOCOL)
+    while True:
+        message_type, message = manager.receive_message_from_socket(connection)
+        if message_type == MessageType.PROTOCOL:
+            break
+    parts = message.split("\t")
+    manager.protocol = Protocol[parts[0]]
+    print(f"Using the {manager.protocol.name} protocol, with features {parts[2:]}.")
 
 
 if __name__ == '__main__':
     global manager, user_list, client_gui, mySocket, listener_thread, keep_listening
-    global world_contents
-    world_contents = []
     client_gui = ClientGUI()
     user_list = []
     mySocket = socket.socket()
@@ -163,18 +390,23 @@ if __name__ == '__main__':
     name = client_gui.request_name()
 
     mySocket.connect((host_URL, port))
+    mySocket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # (key presses shouldn't wait to be combined.)
+    if use_binary_protocol or use_delta_snapshots or use_prediction or use_datagrams or use_ping:
+        negotiate_protocol(mySocket)
     manager.send_message_to_socket(name, mySocket)
     keep_listening = True
     listener_thread = threading.Thread(target=listen_for_messages, args=(mySocket,))
     listener_thread.start()
 
-    # telling the GUI about two methods in this class that it can call.
+    # telling the GUI about three methods in this class that it can call.
     client_gui.tell_my_client_to_send_message = send_message
     client_gui.shut_down_socket = close_socket
+    client_gui.tell_my_client_key_status_changed = send_key_status
 
-    keyboard_timer = RepeatTimer(0.1, update_keyboard)
-    keyboard_timer.start()
+    heartbeat_timer = RepeatTimer(heartbeat_interval, send_heartbeat)
+    heartbeat_timer.start()
+    client_gui.root.after(int(1000 / frame_rate), render_frame)
 
     client_gui.run_loop()
-    keyboard_timer.cancel()
+    heartbeat_timer.cancel()
     print("Done.")
\ No newline at end of file
@@ -1,32 +1,242 @@
 import math
+import os
+import select
 import socket
+import struct
 import threading
-from typing import Dict
+from typing import Dict, List, Set, Union
 from PlayerShipFile import PlayerShip
 from BulletFile import Bullet
-from RepeatTimerFile import RepeatTimer
+from DatagramChannelFile import DatagramChannel, new_session_token, read_datagram_header, datagram_header_struct
+from EntityRecordFile import PLAYER, BULLET
+from EntityStoreFile import ShipStore, BulletStore, numpy_available
+from GameSchedulerFile import GameScheduler
 import time
 
-from SocketMessageIOFile import SocketMessageIO, MessageType
+from HostStatsFile import HostStats, ClientStats, serve_stats
+from LinkMonitorFile import LinkMonitor, reduced_detail_radius
+from MatchRecordingFile import MatchRecorder
+from OutboundQueueFile import OutboundQueue, frame_length, LATEST_WINS_TYPES
+from RecordCacheFile import RecordCache
+from SocketMessageIOFile import SocketMessageIO, MessageType, Protocol, DELTA_FEATURE, PREDICTION_FEATURE, \
+    DATAGRAM_FEATURE, PING_FEATURE
+from SpatialGridFile import SpatialGrid
+from SnapshotTrackerFile import SnapshotTracker
+from WireFormatFile import PROTOCOL_VERSION, pack_world_delta_header, pack_step
+from WorldRegistryFile import WorldRegistry
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional - without it, the interest checks are done with a plain Python loop.
+    np = None
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # not on Windows - there, we can't see how full a socket's send buffer is.
+    fcntl = None
+
 port = 3001
+world_size = 800  # the world is a torus, this many pixels across in each direction.
+interest_radius = None  # users only hear about objects within this distance of their own ship. None means everything.
+                       # (This only saves much when it is small next to the world: 400 still covers 78% of it.)
+hit_distance = 8  # a bullet hits a ship if it is closer than this in both x and y.
+simulation_interval = 0.02  # the simulation always advances in steps of exactly this many seconds.
+send_interval = 0.02  # how often (in seconds) the state of the world is sent out to the users.
+use_entity_store = numpy_available  # move all the ships and bullets at once with NumPy arrays, if NumPy is installed.
+stats_port = 3002  # the stats are served (as JSON, or text at /metrics) on this port, on localhost only. None for none.
+recording_directory = None  # if set, each match is recorded to a file in this folder (see MatchRecordingFile), e.g.,
+                            # "recordings". None for no recording.
+max_recording_bytes = 256 * 1024 * 1024  # a recording stops once its file reaches this size. None for no limit.
+snapshot_every_ticks = 5  # how often a full snapshot of the world goes into the recording.
+tcp_nodelay = True  # send each user's writes straight away, rather than letting Nagle's algorithm wait to combine them
+                    # (we already send everything for a tick in one write).
+send_buffer_size = None  # the size (SO_SNDBUF, in bytes) of each user's socket send buffer. None leaves the system's.
+datagram_port = 3003  # clients that ask can get the world (and send their input) over UDP on this port. None for TCP
+                      # only.
 
-def broadcast_message_to_all(message: str, message_type=MessageType.SUBMISSION) -> None:
+def broadcast_message_to_all(message: Union[str, List[bytes]], message_type=MessageType.SUBMISSION,
+                             binary_message: List[bytes] = None, skip_delta_users: bool = False,
+                             skip_paced_users: bool = False) -> None:
     """
     sends the following message to all the users for whom I have sockets.
-    :param message: the message to send
+    :param message: the message to send - a string, or a list of already-encoded records (see describe_items)
     :param message_type: the type of message being sentm, defaults to a "SUBMISSION" - this precedes the message,
     itself.
+    :param binary_message: the packed records of the message, for users who are using the binary protocol. If None,
+    binary users get the (encoded) text message, instead.
+    :param skip_delta_users: if True, don't send this to users who receive the world as WORLD_DELTA messages (they
+    don't need WORLD_UPDATE or DELETE_ITEMS messages).
+    :param skip_paced_users: if True, don't send this to users who aren't due the world on this tick, or who get a
+    reduced one of their own (see pace_users).
     :return: None
     """
     global user_dictionary_lock, user_dictionary, broadcast_manager
     if broadcast_manager is None:
         broadcast_manager = SocketMessageIO()
 
+    # we only hold the lock long enough to find out who to send to.
     user_dictionary_lock.acquire()
-    for user_id in user_dictionary:
-        broadcast_manager.send_message_to_socket(message, user_dictionary[user_id]["connection"], message_type=message_type)
+    recipients = [user for user in user_dictionary.values()
+                  if (not skip_delta_users or user["snapshot_tracker"] is None) and
+                  (not skip_paced_users or (user["world_due"] and not user["link_monitor"].reduced_detail))]
     user_dictionary_lock.release()
 
+    # each frame is only built once per protocol, no matter how many users are listening - they all share the same
+    # buffers.
+    frames = {}
+    for user in recipients:
+        protocol = user["protocol"]
+        if protocol not in frames:
+            payload = message
+            if protocol == Protocol.BINARY and binary_message is not None:
+                payload = binary_message
+            frames[protocol] = broadcast_manager.build_frame_buffers(payload, message_type, protocol)
+        queue_frame(user, frames[protocol], message_type, protocol)
+
+
+def queue_frame(user: Dict, frame: List[bytes], message_type: MessageType, protocol: Protocol) -> None:
+    """
+    adds a frame to the user's outbound queue, to be sent by its writer. If the user has fallen too far behind (and
+    the OutboundQueue's overflow_policy says so), disconnect it.
+    :param user: the user's entry in the user_dictionary
+    :param frame: the buffers to send
+    :param message_type: the type of message in the frame
+    :param protocol: the protocol the frame was built for
+    :return: None
+    """
+    start = time.perf_counter_ns()
+    # once a user has a UDP session, the world goes out as a datagram straight away - unless it's too big for one.
+    channel = user["datagram_channel"]
+    if channel is not None and channel.address is not None and message_type in LATEST_WINS_TYPES and \
+            protocol == user["protocol"] and channel.send_frame(frame, message_type):
+        host_stats.queue_ns += time.perf_counter_ns() - start
+        return
+    accepted = user["outbox"].put(frame, message_type, protocol)
+    host_stats.queue_ns += time.perf_counter_ns() - start
+    if not accepted:
+        print(f"{user['name']} has fallen too far behind; disconnecting.")
+        disconnect_user(user)
+
+
+def disconnect_user(user: Dict) -> None:
+    """
+    stop sending to this user and shut down its connection. Its listener will notice that the connection has gone and
+    remove the user from the game.
+    :param user: the user's entry in the user_dictionary
+    :return: None
+    """
+    user["outbox"].close()
+    try:
+        user["connection"].shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # it's already gone.
+
+
+def send_to_user(connection_id: int, message: str, message_type=MessageType.SUBMISSION) -> None:
+    """
+    sends a message to just one user.
+    :param connection_id: the unique id number of the user
+    :param message: the message to send
+    :param message_type: the type of message being sent
+    :return: None
+    """
+    global broadcast_manager
+    if broadcast_manager is None:
+        broadcast_manager = SocketMessageIO()
+    user_dictionary_lock.acquire()
+    user = user_dictionary[connection_id]
+    user_dictionary_lock.release()
+    queue_frame(user, broadcast_manager.build_frame_buffers(message, message_type, user["protocol"]), message_type,
+                user["protocol"])
+
+
+def protocols_in_use(include_delta_users: bool = True) -> Set[Protocol]:
+    """
+    finds which protocols the users are speaking, so that we only build the versions of a message that someone needs.
+    :param include_delta_users: whether to count the users who receive the world as WORLD_DELTA messages.
+    :return: the set of protocols in use.
+    """
+    user_dictionary_lock.acquire()
+    result = {user_dictionary[user_id]["protocol"] for user_id in user_dictionary
+              if include_delta_users or user_dictionary[user_id]["snapshot_tracker"] is None}
+    user_dictionary_lock.release()
+    return result
+
+
+def object_id(item) -> int:
+    """
+    finds the unique id number of an on-screen object.
+    :param item: a PlayerShip, Bullet, etc.
+    :return: its id number.
+    """
+    if isinstance(item, PlayerShip):
+        return item.my_id
+    return item.bullet_id
+
+
+def kind_of(item) -> str:
+    """
+    :param item: a PlayerShip, Bullet, etc.
+    :return: which kind of object it is in the world registry: PLAYER, BULLET, etc.
+    """
+    if isinstance(item, PlayerShip):
+        return PLAYER
+    return BULLET
+
+
+def describe_item(item, protocol: Protocol) -> bytes:
+    """
+    finds the encoded record for a single on-screen object in the given protocol. These come from the record_cache, so
+    an object is only described again if it has changed since the last time.
+    :param item: the PlayerShip, Bullet, etc. to describe
+    :param protocol: which protocol the description is for
+    :return: the encoded public_info line for the text protocol, or the packed bytes for the binary protocol.
+    """
+    return record_cache.record(object_id(item), item, protocol)
+
+
+def describe_items(items: list, protocol: Protocol) -> List[bytes]:
+    """
+    builds the contents of a WORLD_UPDATE or DELETE_ITEMS message for the given objects. The records are left as a
+    list, rather than joined together, so that they can be sent straight from the record_cache.
+    :param items: the PlayerShips, Bullets, etc. to describe
+    :param protocol: which protocol the description is for
+    :return: the encoded records, one per object.
+    """
+    return [describe_item(item, protocol) for item in items]
+
+
+def describe_world(world_objects: list, protocol: Protocol) -> Dict[int, bytes]:
+    """
+    finds the encoded records of everything in the world. With the entity store, the bullets' values are read straight
+    from its arrays, all at once, rather than through each bullet's properties.
+    :param world_objects: all the objects currently in the world
+    :param protocol: which protocol the records are for
+    :return: {object id: encoded record} for every object.
+    """
+    if not use_entity_store:
+        return {object_id(item): describe_item(item, protocol) for item in world_objects}
+    snapshot = {item.my_id: describe_item(item, protocol) for item in world_objects if isinstance(item, PlayerShip)}
+    for bullet_id, x, y, owner_id in bullet_store.public_values():
+        snapshot[bullet_id] = record_cache.bullet_record(bullet_id, x, y, owner_id, protocol)
+    return snapshot
+
+
+def world_snapshot(snapshots: Dict[Protocol, Dict[int, bytes]], world_objects: list, protocol: Protocol) \
+        -> Dict[int, bytes]:
+    """
+    describe_world(), but only once per protocol per tick: the result is kept in snapshots, and shared by everything
+    that is sent (or recorded) on this tick.
+    :param snapshots: the records found so far this tick, by protocol
+    :param world_objects: all the objects currently in the world
+    :param protocol: which protocol the records are for
+    :return: {object id: encoded record} for every object.
+    """
+    if protocol not in snapshots:
+        snapshots[protocol] = describe_world(world_objects, protocol)
+    return snapshots[protocol]
+
 
 def send_user_list_to_all() -> None:
     """
@@ -66,98 +276,583 @@ def listen_to_connection(connection_to_hear: socket, connection_id: int, connect
     while True:
         try:
             message_type, message = manager.receive_message_from_socket(connection_to_hear)
-        except (ConnectionAbortedError, ConnectionResetError):
-            print(f"{name} just disconnected.")
-            user_dictionary_lock.acquire()
-            if "PlayerShip" in user_dictionary[connection_id]:
-                item_to_delete = user_dictionary[connection_id]['PlayerShip'].public_info()
-                del user_dictionary[connection_id]
-            user_dictionary_lock.release()
-            broadcast_message_to_all(f"{'-'*6} {name} has left the conversation. {'-'*6} ")
-            broadcast_message_to_all(item_to_delete, MessageType.DELETE_ITEMS)
-            send_user_list_to_all()
+        except OSError:  # e.g., ConnectionAbortedError or ConnectionResetError
+            handle_disconnect(connection_id, name)
+            connection_to_hear.close()
             return
 
         # if we got here, that means that we've received a message.
-        if message_type == MessageType.SUBMISSION:
-            if name is None:  # this must be the first message, which is just the username.
-                name = message
-                manager.send_message_to_socket(f"Welcome, {name}!", connection_to_hear)
-                user_dictionary_lock.acquire()
-                user_dictionary[connection_id]["name"] = name
-                user_dictionary[connection_id]["PlayerShip"].name = name
-                user_dictionary_lock.release()
-                broadcast_message_to_all(f"{'-'*6} {name} has joined the conversation. {'-'*6} ")
-                send_user_list_to_all()
-            else:  # it's a normal message - broadcast it to everybody.
-                broadcast_message_to_all(f"{name}: {message}")
-        elif message_type == MessageType.KEY_STATUS:
+        name = handle_message(manager, connection_id, name, message_type, message)
+
+
+def listen_for_datagrams(receiving_socket: socket) -> None:
+    """
+    a loop intended for a Thread to handle the datagrams that arrive on the host's UDP socket. Each must carry the
+    session token of a connected user; the first one from a user (its "hello") tells us where to send its datagrams.
+    Only key status and ACKs are accepted this way - anything else has to come over the user's TCP connection.
+    :param receiving_socket: the host's UDP socket (which is non-blocking, as the game loop sends from it too)
+    :return: None
+    """
+    buffer = bytearray(64 * 1024)
+    parsers = {protocol: SocketMessageIO(protocol) for protocol in Protocol}
+    while True:
+        select.select([receiving_socket], [], [])
+        try:
+            num_bytes, address = receiving_socket.recvfrom_into(buffer)
+        except BlockingIOError:
+            continue
+        except OSError:
+            return
+        if num_bytes <= datagram_header_struct.size:
+            continue
+        token, sequence = read_datagram_header(buffer)
+        user_dictionary_lock.acquire()
+        connection_id = datagram_sessions.get(token)
+        user = user_dictionary.get(connection_id)
+        user_dictionary_lock.release()
+        if user is None:  # not a session we know - or one whose user has since left.
+            continue
+        channel = user["datagram_channel"]
+        with memoryview(buffer) as view:
+            try:
+                message_type, message = parsers[user["protocol"]].parse_message(
+                    view[datagram_header_struct.size:num_bytes])
+            except (ValueError, KeyError, UnicodeDecodeError):
+                continue
+        if not channel.accept(sequence, message_type):
+            continue
+        channel.address = address  # (the first datagram tells us where the client is; if that changes, we follow.)
+        if message_type not in (MessageType.KEY_STATUS, MessageType.ACK):
+            continue
+        try:
+            handle_message(parsers[user["protocol"]], connection_id, user["name"], message_type, message)
+        except (KeyError, ValueError):
+            pass  # the user has just left, or sent us something we can't read.
+
+
+def start_datagram_listener() -> None:
+    """
+    if datagram_port is set, open the host's UDP socket and start a thread listening to it.
+    :return: None
+    """
+    global datagram_socket
+    if datagram_port is None:
+        return
+    datagram_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    datagram_socket.bind(('', datagram_port))
+    datagram_socket.setblocking(False)
+    threading.Thread(target=listen_for_datagrams, args=(datagram_socket,), daemon=True).start()
+    print(f"Listening for datagrams on port {datagram_port}.")
+
+
+def write_to_connection(connection: socket, outbox: OutboundQueue, stats: ClientStats = None) -> None:
+    """
+    a loop intended for a Thread to send whatever is put into the user's outbound queue, until the queue is closed or
+    the socket fails. Only this thread ever sends to the socket, so if the user's connection is slow, only this thread
+    waits for it.
+    :param connection: the socket to send to
+    :param outbox: the user's outbound queue
+    :param stats: the user's ClientStats, to count what we send (and how long the socket keeps us waiting) in
+    :return: None
+    """
+    sending_manager = SocketMessageIO()
+    while True:
+        frames = outbox.take_frames()
+        if len(frames) == 0:  # the queue has been closed.
+            break
+        try:
+            # everything that has piled up goes out in one vectored write, straight from the (shared) buffers.
+            start = time.perf_counter_ns()
+            sending_manager.send_buffers_to_socket([buffer for frame in frames for buffer in frame], connection)
+        except OSError:
+            break
+        outbox.finished_sending()
+        if stats is not None:
+            stats.count_sent(len(frames), sum(frame_length(frame) for frame in frames),
+                             time.perf_counter_ns() - start)
+    # make sure the listener notices, if it hasn't already.
+    outbox.close()
+    try:
+        connection.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def tune_socket(connection: socket) -> None:
+    """
+    applies tcp_nodelay and send_buffer_size to a user's newly accepted socket.
+    :param connection: the socket (or anything else with setsockopt(), e.g., an asyncio transport's socket)
+    :return: None
+    """
+    try:
+        if tcp_nodelay:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if send_buffer_size is not None:
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer_size)
+    except OSError as error:
+        print(f"Couldn't tune the socket: {error}")
+
+
+def unsent_bytes(connection: socket) -> int:
+    """
+    finds out how much of what we have written to a user's socket hasn't reached the user yet - when the connection
+    can't keep up, this is where the data piles up, as the operating system's send buffer can hold megabytes.
+    :param connection: the socket (or anything else with fileno(), e.g., a StreamConnection - anything without one,
+    like the benchmark's stand-in connections, has nothing unsent)
+    :return: the number of bytes in the socket's send buffer that the user hasn't acknowledged, or 0 if the system
+    won't tell us.
+    """
+    fileno = getattr(connection, "fileno", None)
+    if fcntl is None or not hasattr(termios, "TIOCOUTQ") or fileno is None:
+        return 0
+    try:
+        return struct.unpack("i", fcntl.ioctl(fileno(), termios.TIOCOUTQ, bytes(4)))[0]
+    except (OSError, ValueError):
+        return 0
+
+
+def start_user(connection: socket, address: str = None) -> int:
+    """
+    a new connection has arrived: add it to the game, and start a thread that will continuously listen for
+    communication from it, and another that will send it whatever we put in its outbound queue.
+    :param connection: the socket for this user
+    :param address: the address of the socket (not currently used)
+    :return: the id number of the new user.
+    """
+    tune_socket(connection)
+    connection_id = add_user(connection)
+    user_dictionary_lock.acquire()
+    outbox = user_dictionary[connection_id]["outbox"]
+    stats = user_dictionary[connection_id]["stats"]
+    user_dictionary_lock.release()
+    writerThread = threading.Thread(target=write_to_connection, args=(connection, outbox, stats))
+    writerThread.start()
+    connectionThread = threading.Thread(target=listen_to_connection, args=(connection, connection_id, address))
+    connectionThread.start()
+    return connection_id
+
+
+def add_user(connection) -> int:
+    """
+    a new connection has arrived; give it a unique id number, a ship and an outbound queue, and add it to the
+    user_dictionary. (The caller is responsible for starting something to send what goes into the queue.)
+    :param connection: the socket for this user (or anything else with a shutdown() method)
+    :return: the id number of the new user.
+    """
+    new_id = world.allocate_id(world_tick)
+    user_dictionary_lock.acquire()
+    user_dictionary[new_id] = {"name": "unknown",
+                               "connection": connection,
+                               "outbox": OutboundQueue(),
+                               "protocol": Protocol.TEXT,
+                               "snapshot_tracker": None,
+                               "datagram_channel": None,
+                               "visible_records": {},
+                               "link_monitor": LinkMonitor(),
+                               "world_due": True,
+                               "stats": ClientStats(),
+                               "PlayerShip": make_ship(new_id, "Unknown")}
+    user_dictionary[new_id]["PlayerShip"].input_step = simulation_steps
+    world.add(PLAYER, new_id, user_dictionary[new_id]["PlayerShip"])
+    if match_recorder is not None:
+        match_recorder.record_spawn(world_tick, user_dictionary[new_id]["PlayerShip"].binary_info())
+    user_dictionary_lock.release()
+    return new_id
+
+
+def handle_message(manager: SocketMessageIO, connection_id: int, name: str, message_type: MessageType, message) -> str:
+    """
+    respond to a single message that has arrived from one of the users.
+    :param manager: the SocketMessageIO that is reading from this connection
+    :param connection_id: the unique id number of this user
+    :param name: the user's name, or None if it hasn't told us yet
+    :param message_type: the type of message that arrived
+    :param message: the body of the message
+    :return: the user's name - which will have just been set, if this was the first SUBMISSION.
+    """
+    user_dictionary_lock.acquire()
+    user_dictionary[connection_id]["stats"].count_received(message_type)
+    user_dictionary_lock.release()
+    if message_type == MessageType.PROTOCOL:
+        negotiate_protocol(manager, connection_id, message)
+    elif message_type == MessageType.SUBMISSION:
+        if name is None:  # this must be the first message, which is just the username.
+            name = message
+            send_to_user(connection_id, f"Welcome, {name}!")
+            user_dictionary_lock.acquire()
+            user_dictionary[connection_id]["name"] = name
+            user_dictionary[connection_id]["PlayerShip"].name = name
+            user_dictionary_lock.release()
+            broadcast_message_to_all(f"{'-'*6} {name} has joined the conversation. {'-'*6} ")
+            send_user_list_to_all()
+        else:  # it's a normal message - broadcast it to everybody.
+            broadcast_message_to_all(f"{name}: {message}")
+    elif message_type == MessageType.KEY_STATUS:
+        if "\t" in message:  # "sequence-->key status"
+            sequence, new_controls = [int(value) for value in message.split("\t")]
+            update_ship_controls(connection_id, new_controls, sequence)
+        else:  # (older clients just send the key status, several times a second.)
             update_ship_controls(connection_id, int(message))
+    elif message_type == MessageType.ACK:
+        acknowledge_snapshot(connection_id, int(message))
+    elif message_type == MessageType.KEYFRAME_REQUEST:
+        request_keyframe(connection_id)
+    elif message_type == MessageType.PONG:
+        user_dictionary_lock.acquire()
+        monitor = user_dictionary[connection_id]["link_monitor"]
+        user_dictionary_lock.release()
+        monitor.handle_pong(message, time.monotonic(), time.time())
+    return name
+
+
+def handle_disconnect(connection_id: int, name: str) -> None:
+    """
+    the user's connection has gone away; remove it from the game and let everybody else know.
+    :param connection_id: the unique id number of this user
+    :param name: the user's name (or None, if it never told us)
+    :return: None
+    """
+    print(f"{name} just disconnected.")
+    items_to_delete_now = []
+    user_dictionary_lock.acquire()
+    if "PlayerShip" in user_dictionary[connection_id]:
+        items_to_delete_now.append(user_dictionary[connection_id]['PlayerShip'])
+    user_dictionary[connection_id]["outbox"].close()
+    if use_entity_store:
+        ship_store.remove(user_dictionary[connection_id]["PlayerShip"])
+    if user_dictionary[connection_id]["datagram_channel"] is not None:
+        del datagram_sessions[user_dictionary[connection_id]["datagram_channel"].token]
+    world.remove(PLAYER, connection_id)
+    # (the ship is only released once the game loop has finished sending the world it was in.)
+    departed_ships.append(user_dictionary[connection_id]["PlayerShip"])
+    del user_dictionary[connection_id]
+    user_dictionary_lock.release()
+    broadcast_message_to_all(f"{'-'*6} {name} has left the conversation. {'-'*6} ")
+    if len(items_to_delete_now) > 0:
+        broadcast_message_to_all(describe_items(items_to_delete_now, Protocol.TEXT), MessageType.DELETE_ITEMS,
+                                 binary_message=describe_items(items_to_delete_now, Protocol.BINARY),
+                                 skip_delta_users=True)
+        record_cache.forget(connection_id)
+        if match_recorder is not None:
+            match_recorder.record_deletions(world_tick, [connection_id])
+    send_user_list_to_all()
+
 
-def update_ship_controls(id: int, new_controls: int) -> None:
+def negotiate_protocol(manager: SocketMessageIO, connection_id: int, request: str) -> None:
     """
-    We've just received a message from one of the users with an update to which keys they have pressed.
+    The client has sent a tab-delimited "protocol-->version-->feature-->feature..." message asking to switch protocols
+    and/or turn on optional features (e.g., "BINARY-->2-->DELTA-->PREDICT"). If we speak that version of the binary
+    protocol, switch to it; otherwise, stay with the text protocol. Reply in the same format with what we actually
+    agreed to. The reply itself is always sent in the text protocol, so the client can read it before it switches.
+    If the client wants to predict the motion of its own ship, it is then told which ship that is, in a SHIP_ID
+    message.
+    :param manager: the SocketMessageIO that is reading from this connection
+    :param connection_id: the unique id number of this user
+    :param request: the body of the PROTOCOL message the client sent
+    :return: None
+    """
+    parts = request.split("\t")
+    protocol = Protocol.TEXT
+    if parts[0] == Protocol.BINARY.name and len(parts) > 1 and parts[1] == str(PROTOCOL_VERSION):
+        protocol = Protocol.BINARY
+    # (the world only goes over UDP as deltas: a WORLD_DELTA has a tick, so the client can tell whether one that was
+    # too big for a datagram, and came over TCP, is older or newer than the ones arriving over UDP.)
+    features = [feature for feature in parts[2:] if feature in (DELTA_FEATURE, PREDICTION_FEATURE, PING_FEATURE) or
+                (feature == DATAGRAM_FEATURE and datagram_socket is not None and DELTA_FEATURE in parts[2:])]
+
+    reply = manager.build_frame_buffers("\t".join([protocol.name, str(PROTOCOL_VERSION)] + features),
+                                        message_type=MessageType.PROTOCOL)
+    user_dictionary_lock.acquire()
+    # the outbound queue makes sure that no frames built for the old protocol can go out after the reply.
+    user_dictionary[connection_id]["outbox"].switch_protocol(reply, protocol)
+    manager.protocol = protocol
+    user_dictionary[connection_id]["protocol"] = protocol
+    if DELTA_FEATURE in features:
+        user_dictionary[connection_id]["snapshot_tracker"] = SnapshotTracker()
+    user_dictionary[connection_id]["link_monitor"].pinging = PING_FEATURE in features
+    user_dictionary_lock.release()
+    if PREDICTION_FEATURE in features:
+        send_to_user(connection_id, str(connection_id), MessageType.SHIP_ID)
+    if DATAGRAM_FEATURE in features:
+        # the world keeps coming over TCP until the client's first datagram tells us where to send it.
+        token = new_session_token()
+        user_dictionary_lock.acquire()
+        user_dictionary[connection_id]["datagram_channel"] = DatagramChannel(datagram_socket, token)
+        datagram_sessions[token] = connection_id
+        user_dictionary_lock.release()
+        send_to_user(connection_id, f"{token}\t{datagram_port}", MessageType.DATAGRAM_SESSION)
+
+
+def acknowledge_snapshot(id: int, tick: int) -> None:
+    """
+    The user has told us that it has applied the world snapshot for the given tick, so future WORLD_DELTAs can be
+    based on it.
+    :param id: which user this is
+    :param tick: the tick the user acknowledged
+    :return: None
+    """
+    user_dictionary_lock.acquire()
+    tracker = user_dictionary[id]["snapshot_tracker"]
+    user_dictionary_lock.release()
+    if tracker is not None:
+        tracker.acknowledge(tick)
+
+
+def request_keyframe(id: int) -> None:
+    """
+    The user has lost track of the world (e.g., it got a WORLD_DELTA based on a snapshot it doesn't have), so send it
+    a full snapshot next time.
+    :param id: which user this is
+    :return: None
+    """
+    user_dictionary_lock.acquire()
+    if user_dictionary[id]["snapshot_tracker"] is not None:
+        user_dictionary[id]["snapshot_tracker"].request_keyframe()
+    user_dictionary_lock.release()
+
+
+def update_ship_controls(id: int, new_controls: int, sequence: int = None) -> None:
+    """
+    We've just received a message from one of the users with an update to which keys they have pressed. If it is
+    numbered, it is only applied if it is newer than the last one we applied - anything else is a repeat (e.g., a
+    heartbeat) or out of date. The ship remembers the number, so that the user can tell which of its inputs have been
+    applied (see PlayerShip.input_sequence).
     :param id: which user this is
     :param new_controls: an int with binary flags indicating whether left, right, up, down, fire keys are being held.
+    :param sequence: the number the user gave this key status, or None if it didn't number it.
     :return: None
     """
     user_dictionary_lock.acquire()
-    user_dictionary[id]["PlayerShip"].controls = new_controls
+    ship = user_dictionary[id]["PlayerShip"]
+    if sequence is None or sequence > ship.input_sequence:
+        if match_recorder is not None and (sequence is not None or new_controls != ship.controls):
+            match_recorder.record_input(world_tick, id, sequence or 0, new_controls)
+        if sequence is not None:
+            ship.input_sequence = sequence
+            ship.input_step = simulation_steps
+        ship.controls = new_controls
     user_dictionary_lock.release()
 
 def game_loop_step() -> None:
     """
-    perform one iteration of the game loop. Update the locations and states of all the player ships and other items.
+    perform one iteration of the game loop, based on how much time has passed since the last one: update the
+    locations and states of all the player ships and other items, then send the new state of the world to the users.
+    (When the host is running, the GameScheduler does this instead, with fixed-length steps.)
     :return: None
     """
-    global last_update, items_to_delete
-    items_to_delete = [] # we're restarting the list of things to delete afresh.
+    global last_update
 
     # calculate the amount of time it has been since the last update.
     now = time.time()
     delta_t = now - last_update
+    last_update = now
+
+    simulation_step(delta_t)
+    send_step()
+
 
-    # do updates etc. for each type of object
+def simulation_step(delta_t: float) -> None:
+    """
+    advance the world by the given amount of time. Any items that are deleted are remembered until the next send_step.
+    :param delta_t: the time (in seconds) to advance by.
+    :return: None
+    """
+    # do updates etc. for each type of object, timing each one.
+    start = time.perf_counter_ns()
     manage_step_for_users(delta_t)
+    start = host_stats.record_phase("user_step", start)
     manage_step_for_bullets(delta_t)
+    start = host_stats.record_phase("bullet_step", start)
     check_for_bullet_player_collisions()
+    host_stats.record_phase("collisions", start)
 
-    last_update = now
 
-    # send revised contents of the world to all users.
-    send_world_update_to_all_users()
-    # send notification of any items that were deleted.
-    send_items_to_delete_to_all_users()
+def send_step() -> None:
+    """
+    send the current state of the world, and any items that have been deleted since the last send, to the users.
+    Each user's queue is held until we've finished, so all of its messages for this tick go out in a single write.
+    :return: None
+    """
+    user_dictionary_lock.acquire()
+    outboxes = [user["outbox"] for user in user_dictionary.values()]
+    user_dictionary_lock.release()
+    for outbox in outboxes:
+        outbox.hold()
+    try:
+        pace_users()
+        # send revised contents of the world to all users. (Building the messages and putting them in the users'
+        # queues are interleaved, so we time the queueing separately and take it off.)
+        start = time.perf_counter_ns()
+        queue_ns_before = host_stats.queue_ns
+        send_world_update_to_all_users()
+        end = time.perf_counter_ns()
+        queue_ns = host_stats.queue_ns - queue_ns_before
+        host_stats.add("world_build", end - start - queue_ns)
+        host_stats.add("broadcast", queue_ns)
+        # send notification of any items that were deleted.
+        send_items_to_delete_to_all_users()
+        host_stats.record_phase("delete_broadcast", end)
+    finally:
+        for outbox in outboxes:
+            outbox.flush()
+    ping_users()
+    if match_recorder is not None and len(items_to_delete) > 0:
+        match_recorder.record_deletions(world_tick, [object_id(item) for item in items_to_delete])
+    release_deleted_items()
+
+
+def pace_users() -> None:
+    """
+    for each user: change how often it is sent the world, if its link calls for it (see LinkMonitor), and decide
+    whether it is due the world on this tick. How far behind a user is counts everything we have for it that it hasn't
+    received: its outbound queue (world included), whatever its writer is busy with, and its socket's send buffer.
+    :return: None
+    """
+    now = time.monotonic()
+    user_dictionary_lock.acquire()
+    users = list(user_dictionary.values())
+    user_dictionary_lock.release()
+    for user in users:
+        monitor = user["link_monitor"]
+        monitor.adapt(user["outbox"].pending_bytes() + unsent_bytes(user["connection"]), now)
+        user["world_due"] = monitor.take_turn()
+
+
+def ping_users() -> None:
+    """
+    pings each user that is due a PING (see LinkMonitor). This is done once the tick's messages have been let go to the
+    users' writers, so that the time the game loop takes to build them isn't counted in the round trip.
+    :return: None
+    """
+    global broadcast_manager
+    if broadcast_manager is None:
+        broadcast_manager = SocketMessageIO()
+    now = time.monotonic()
+    user_dictionary_lock.acquire()
+    users = list(user_dictionary.values())
+    user_dictionary_lock.release()
+    for user in users:
+        monitor = user["link_monitor"]
+        if monitor.ping_due(now):
+            protocol = user["protocol"]
+            queue_frame(user, broadcast_manager.build_frame_buffers(monitor.build_ping(now, send_interval),
+                                                                    MessageType.PING, protocol),
+                        MessageType.PING, protocol)
+
+
+def detail_radius(user: Dict) -> Union[float, None]:
+    """
+    :param user: the user's entry in the user_dictionary
+    :return: how far from its ship the user should hear about objects: interest_radius - or, if its link is struggling,
+    no further than reduced_detail_radius. None means everything.
+    """
+    if not user["link_monitor"].reduced_detail:
+        return interest_radius
+    if interest_radius is None:
+        return reduced_detail_radius
+    return min(interest_radius, reduced_detail_radius)
+
+
+def release_deleted_items() -> None:
+    """
+    the objects that were removed from the world since the last send (and the ships of users who have left) have been
+    described for the last time, so forget their records, and let the world registry reuse them and their ids.
+    :return: None
+    """
+    global items_to_delete
+    for item in items_to_delete:
+        record_cache.forget(object_id(item))
+        world.release(kind_of(item), object_id(item), item, world_tick)
+    items_to_delete = []  # we're restarting the list of things to delete afresh.
+    user_dictionary_lock.acquire()
+    for ship in departed_ships:
+        world.release(PLAYER, ship.my_id, ship, world_tick)
+    departed_ships.clear()
+    user_dictionary_lock.release()
 
 
 def check_for_bullet_player_collisions() -> None:
     """
     detects whether any bullets have interacted with users. (There is no self-harm - you can't shoot yourself.)
+    The bullets are sorted into bullet_grid first, so each ship only has to look at the bullets in the grid cells
+    around it - including those just across the edge of the world.
     :return: None
     """
+    if use_entity_store:
+        bullet_grid.rebuild(bullet_store.x[:bullet_store.count], bullet_store.y[:bullet_store.count])
+    else:
+        bullets = world.entities_of_kind(BULLET)
+        bullet_grid.rebuild([b.x for b in bullets], [b.y for b in bullets])
+
     user_dictionary_lock.acquire()
+    if use_entity_store:
+        check_for_hits_in_store([user["PlayerShip"] for user in user_dictionary.values() if "PlayerShip" in user])
+        user_dictionary_lock.release()
+        return
     for user_id in user_dictionary:
-        for b in bullet_list:
-            if "PlayerShip" in user_dictionary[user_id]:
-                if user_dictionary[user_id]["PlayerShip"].my_id != b.owner_id:
-                    if math.fabs(user_dictionary[user_id]["PlayerShip"].x - b.x) < 8 and math.fabs(user_dictionary[user_id]["PlayerShip"].y - b.y) < 8:
-                        user_dictionary[user_id]["PlayerShip"].health -= 10
-                        b.lifetime = -1 # this will kill the bullet on the next cycle.
+        if "PlayerShip" not in user_dictionary[user_id]:
+            continue
+        ship = user_dictionary[user_id]["PlayerShip"]
+        for index in bullet_grid.candidates_near(ship.x, ship.y, hit_distance):
+            b = bullets[index]
+            if ship.my_id != b.owner_id:
+                if bullet_grid.toroidal_offset(ship.x, b.x) < hit_distance and \
+                        bullet_grid.toroidal_offset(ship.y, b.y) < hit_distance:
+                    ship.health -= 10
+                    b.lifetime = -1  # this will kill the bullet on the next cycle.
 
     user_dictionary_lock.release()
 
+def check_for_hits_in_store(ships: List[PlayerShip]) -> None:
+    """
+    the entity store's version of the collision test: the candidate bullets from bullet_grid, for every ship, are
+    gathered into one list of (ship, bullet) pairs, and all of the pairs are checked at once, straight from the store's
+    arrays.
+    :param ships: the ships to check
+    :return: None
+    """
+    candidate_cells = []
+    pair_ships = []
+    for index, ship in enumerate(ships):
+        cells = bullet_grid.cells_near(ship.x, ship.y, hit_distance)
+        candidate_cells.extend(cells)
+        pair_ships.append(np.full(sum(map(len, cells)), index, dtype=np.int64))
+    if len(candidate_cells) == 0:
+        return
+    candidates = np.concatenate(candidate_cells)
+    pair_ships = np.concatenate(pair_ships)
+    ship_xs = np.array([ship.x for ship in ships], dtype=np.float64)[pair_ships]
+    ship_ys = np.array([ship.y for ship in ships], dtype=np.float64)[pair_ships]
+    ship_ids = np.array([ship.my_id for ship in ships], dtype=np.int64)[pair_ships]
+    dx = np.abs(bullet_store.x[candidates] - ship_xs)
+    dy = np.abs(bullet_store.y[candidates] - ship_ys)
+    np.minimum(dx, world_size - dx, out=dx)
+    np.minimum(dy, world_size - dy, out=dy)
+    hit = (bullet_store.owner_id[candidates] != ship_ids) & (dx < hit_distance) & (dy < hit_distance)
+    if not hit.any():
+        return
+    for index, count in enumerate(np.bincount(pair_ships[hit], minlength=len(ships)).tolist()):
+        if count > 0:
+            ships[index].health -= 10 * count
+    bullet_store.lifetime[candidates[hit]] = -1  # this will kill the bullets on the next cycle.
+
+
 def send_items_to_delete_to_all_users():
     """
     inform all client users which items they will need to remove from their GUI views.
     :return: None
     """
-    # construct a single string with all the objects' public infos.
-    deletable_items_descriptions = ""
-    for item in items_to_delete:
-        deletable_items_descriptions += item + "\n"
-    # send that string (if any)to all the users with the prefix MessageType.DELETE_ITEMS.
+    # send the description of the objects (if any) to all the users with the prefix MessageType.DELETE_ITEMS.
+    # (users who get WORLD_DELTAs find out about deletions from those, instead.)
     if len(items_to_delete) > 0:
-        broadcast_message_to_all(deletable_items_descriptions, MessageType.DELETE_ITEMS)
+        protocols = protocols_in_use(include_delta_users=False)
+        if len(protocols) == 0:
+            return
+        binary_message = None
+        if Protocol.BINARY in protocols:
+            binary_message = describe_items(items_to_delete, Protocol.BINARY)
+        broadcast_message_to_all(describe_items(items_to_delete, Protocol.TEXT), MessageType.DELETE_ITEMS,
+                                 binary_message=binary_message, skip_delta_users=True)
 
 
 def manage_step_for_bullets(delta_t) -> None:
@@ -167,15 +862,20 @@ def manage_step_for_bullets(delta_t) -> None:
     :param delta_t: the time expired (in seconds) since the last step.
     :return: None
     """
-    bullets_to_remove = []
-    for b in bullet_list:
-        b.update(delta_t)
-        if b.has_expired():
-            bullets_to_remove.append(b)
+    if use_entity_store:
+        bullet_store.update(delta_t)
+        bullets_to_remove = bullet_store.expired_bullets()
+    else:
+        bullets_to_remove = []
+        for b in world.entities_of_kind(BULLET):
+            b.update(delta_t)
+            if b.has_expired():
+                bullets_to_remove.append(b)
     for b in bullets_to_remove:
-        bullet_list.remove(b)
-        non_user_objects.remove(b)
-        items_to_delete.append(b.public_info())
+        world.remove(BULLET, b.bullet_id)
+        items_to_delete.append(b)
+        if use_entity_store:
+            bullet_store.remove(b)
 
 
 def manage_step_for_users(delta_t) -> None:
@@ -184,15 +884,52 @@ def manage_step_for_users(delta_t) -> None:
     :param delta_t: the time expired (in seconds) since the last step.
     :return: None
     """
+    global simulation_steps
     user_dictionary_lock.acquire()
-    for user_id in user_dictionary:
-        if "PlayerShip" in user_dictionary[user_id]:
-            user_dictionary[user_id]["PlayerShip"].update(delta_t)
-            if user_dictionary[user_id]["PlayerShip"].controls & 16 == 16:
-                handle_fire(user_dictionary[user_id]["PlayerShip"])
+    if use_entity_store:
+        ship_store.update(delta_t)
+        for ship in ship_store.firing_ships():
+            handle_fire(ship)
+    else:
+        for user_id in user_dictionary:
+            if "PlayerShip" in user_dictionary[user_id]:
+                user_dictionary[user_id]["PlayerShip"].update(delta_t)
+                if user_dictionary[user_id]["PlayerShip"].controls & 16 == 16:
+                    handle_fire(user_dictionary[user_id]["PlayerShip"])
+    # (counted with the lock held, so that update_ship_controls always sees the ships and the count agree.)
+    simulation_steps += 1
+    user_dictionary_lock.release()
 
 
-    user_dictionary_lock.release()
+def make_ship(id: int, name: str) -> PlayerShip:
+    """
+    creates a new ship - in the entity store, if we're using one - reusing the ship of a player who has left, if there
+    is one.
+    :param id: the ship's unique id number
+    :param name: the name of the ship's user
+    :return: the new ship.
+    """
+    ship = world.reuse(PLAYER)
+    if ship is not None:
+        ship.reset(id, name)
+        return ship
+    if use_entity_store:
+        return ship_store.add_ship(id, name)
+    return PlayerShip(id, name)
+
+
+def make_bullet(x: float, y: float, vx: float, vy: float, owner_id: int, bullet_id: int, lifetime: float) -> Bullet:
+    """
+    creates a new bullet - in the entity store, if we're using one - reusing one that has expired, if there is one.
+    :return: the new bullet.
+    """
+    bullet = world.reuse(BULLET)
+    if bullet is not None:
+        bullet.reset(x, y, vx, vy, owner_id, bullet_id, lifetime)
+        return bullet
+    if use_entity_store:
+        return bullet_store.add_bullet(x, y, vx, vy, owner_id, bullet_id, lifetime)
+    return Bullet(x, y, vx, vy, owner_id, bullet_id, lifetime)
 
 
 def handle_fire(user:PlayerShip) -> None:
@@ -202,60 +939,306 @@ def handle_fire(user:PlayerShip) -> None:
     :param user: which user is trying to fire.
     :return:  None
     """
-    global latest_id
     if user.ok_to_fire():
         muzzle_velocity = 85
-        latest_id += 1
-        bullet = Bullet(x=user.x,
-                        y=user.y,
-                        vx=user.vx+muzzle_velocity*math.cos(user.bearing),
-                        vy=user.vy+muzzle_velocity*math.sin(user.bearing),
-                        owner_id=user.my_id,
-                        bullet_id=latest_id,
-                        lifetime=3.25
-                        )
-        bullet_list.append(bullet)
-        non_user_objects.append(bullet)
+        bullet_id = world.allocate_id(world_tick)
+        bullet = make_bullet(x=user.x,
+                             y=user.y,
+                             vx=user.vx+muzzle_velocity*math.cos(user.bearing),
+                             vy=user.vy+muzzle_velocity*math.sin(user.bearing),
+                             owner_id=user.my_id,
+                             bullet_id=bullet_id,
+                             lifetime=3.25
+                             )
+        world.add(BULLET, bullet_id, bullet)
+        if match_recorder is not None:
+            match_recorder.record_spawn(world_tick, bullet.binary_info())
 
 def send_world_update_to_all_users() -> None:
     """
-    send a message with a list of the public info of all on-screen objects that should be drawn on-screen.
+    send a message with a list of the public info of all on-screen objects that should be drawn on-screen. Users who
+    asked for deltas get a WORLD_DELTA with just what changed since the last snapshot they acknowledged; everybody else
+    gets a WORLD_UPDATE. If interest_radius is set, each user only hears about the objects near its own ship. Users
+    whose links are struggling are only sent the world every few ticks, and in less detail (see pace_users).
     :return: None
     """
-    message = ""
+    global world_tick
+    world_tick += 1
+    world_objects = world.all_entities()
+    snapshots = {}
+    if match_recorder is not None and world_tick % snapshot_every_ticks == 0:
+        match_recorder.record_snapshot(world_tick,
+                                       list(world_snapshot(snapshots, world_objects, Protocol.BINARY).values()))
+
+    send_world_to_each_user(world_objects, snapshots)
+
+    # without interest management, everybody else gets the same WORLD_UPDATE, so build it once and broadcast it.
+    if interest_radius is not None:
+        return
+    protocols = protocols_in_use(include_delta_users=False)
+    if len(protocols) == 0:
+        return
+    binary_message = None
+    if Protocol.BINARY in protocols:
+        binary_message = [step_record(Protocol.BINARY)] + \
+            list(world_snapshot(snapshots, world_objects, Protocol.BINARY).values())
+    # (if nobody is using the text protocol, don't bother building it.)
+    text_message = binary_message
+    if Protocol.TEXT in protocols:
+        text_message = [step_record(Protocol.TEXT)] + \
+            list(world_snapshot(snapshots, world_objects, Protocol.TEXT).values())
+    broadcast_message_to_all(text_message, MessageType.WORLD_UPDATE, binary_message=binary_message,
+                             skip_delta_users=True, skip_paced_users=True)
+
+
+def step_record(protocol: Protocol) -> bytes:
+    """
+    :param protocol: the protocol of the world message it is for
+    :return: the STEP record that starts each world message (see WireFormatFile), saying how many simulation steps
+    have been run. It is kept out of the snapshots, so the records SnapshotTracker compares only change when an object
+    does.
+    """
+    if protocol == Protocol.BINARY:
+        return pack_step(simulation_steps)
+    return f"STEP\t{simulation_steps}\n".encode()
+
+
+def object_positions(world_objects: list) -> tuple:
+    """
+    reads the id and position of every object once, so that ids_of_interest doesn't have to go back to the objects
+    themselves for every user. (With the entity store, the bullets' positions are just its arrays.)
+    :param world_objects: all the objects currently in the world
+    :return: (ids, xs, ys) - as NumPy arrays, if NumPy is installed, otherwise as lists.
+    """
+    if use_entity_store:
+        ships = [item for item in world_objects if isinstance(item, PlayerShip)]
+        n = bullet_store.count
+        return np.array([ship.my_id for ship in ships] + [view.bullet_id for view in bullet_store.views],
+                        dtype=np.int64), \
+            np.concatenate([np.array([ship.x for ship in ships], dtype=np.float64), bullet_store.x[:n]]), \
+            np.concatenate([np.array([ship.y for ship in ships], dtype=np.float64), bullet_store.y[:n]])
+    ids = [object_id(item) for item in world_objects]
+    xs = [item.x for item in world_objects]
+    ys = [item.y for item in world_objects]
+    if np is None:
+        return ids, xs, ys
+    return np.array(ids, dtype=np.int64), np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64)
+
+
+def ids_of_interest(viewer: PlayerShip, positions: tuple, radius: float) -> list:
+    """
+    finds the objects that are within the given distance of the viewer's ship, measuring the shortest way around the
+    torus. With NumPy, every object is checked at once.
+    :param viewer: the ship of the user we are sending to
+    :param positions: the ids and positions of all the objects currently in the world (from object_positions)
+    :param radius: how far the user can see (see detail_radius), or None for everything
+    :return: the ids of the objects this user should hear about.
+    """
+    ids, xs, ys = positions
+    if radius is None:
+        return list(ids) if np is None else ids.tolist()
+    radius_squared = radius ** 2
+    viewer_x, viewer_y = viewer.x, viewer.y
+    if np is not None:
+        dx = np.abs(xs - viewer_x)
+        dy = np.abs(ys - viewer_y)
+        np.minimum(dx, world_size - dx, out=dx)
+        np.minimum(dy, world_size - dy, out=dy)
+        return ids[dx * dx + dy * dy <= radius_squared].tolist()
+    result = []
+    for index in range(len(ids)):
+        dx = math.fabs(xs[index] - viewer_x)
+        dy = math.fabs(ys[index] - viewer_y)
+        dx = min(dx, world_size - dx)
+        dy = min(dy, world_size - dy)
+        if dx * dx + dy * dy <= radius_squared:
+            result.append(ids[index])
+    return result
+
+
+def send_world_to_each_user(world_objects: list, snapshots: Dict[Protocol, Dict[int, bytes]]) -> None:
+    """
+    send each user the part of the world it needs, if that is different from what everybody else gets:
+        - users who asked for deltas get a WORLD_DELTA describing the objects that have been created, changed or
+          removed (or have come into or gone out of range) since the last snapshot it acknowledged - or everything in
+          range, if it is due a keyframe.
+        - if interest_radius is set (or a user is getting less detail - see detail_radius), other users get a
+          WORLD_UPDATE with just the objects in range, and a DELETE_ITEMS for the ones that have gone out of range
+          since last time.
+    Users who aren't due the world on this tick (see pace_users) get nothing.
+    :param world_objects: all the objects currently in the world.
+    :param snapshots: the records found so far this tick, by protocol (see world_snapshot)
+    :return: None
+    """
+    global broadcast_manager
+    if broadcast_manager is None:
+        broadcast_manager = SocketMessageIO()
+
+    # we only hold the lock long enough to find out who to send to.
     user_dictionary_lock.acquire()
-    for user_id in user_dictionary:
-        if "PlayerShip" in user_dictionary[user_id]:
-            message += f"{user_dictionary[user_id]['PlayerShip'].public_info()}\n"
+    recipients = list(user_dictionary.values())
     user_dictionary_lock.release()
-    for obj in non_user_objects:
-        message += f"{obj.public_info()}\n"
-        # print(f"Sending: {obj.public_info=}")
-    broadcast_message_to_all(message, MessageType.WORLD_UPDATE)
 
-if __name__ == '__main__':
-    global user_dictionary, user_dictionary_lock, latest_id, broadcast_manager, last_update
-    global bullet_list, non_user_objects
-    # initialize lists of objects that the game needs to track.
-    bullet_list= []
-    non_user_objects = []
-
-    # this is a variable we'll initialize later, when we first need it.
-    broadcast_manager = None
-
-    # each on-screen object (players, bullets, asteroids, etc.) has a unique id number. This keeps track of the most
-    # recently assigned one so that we can be sure to give the _next_ number to the next item we create.
-    latest_id = 0
-
-    # the user_dictionary is a dictionary of dictionaries of all the connected user's names & connections, keyed on
-    # unique id numbers.
-    # for example, user_dictionary might be {1: {"name":"Steve", "connection": some_socket_connection1},
-    #                                        3: {"name":"Milo", "connection": some_socket_connection2},
-    #                                        4: {"name":"Opus", "connection": some_socket_connection3}}
-    user_dictionary: Dict[int, Dict] = {}
-    user_dictionary_lock = threading.Lock()  # this is used to lock user_dictionary, as it might be used by multiple
-                                             # threads.
+    # the records are looked up at most once per protocol and shared by all the users that speak it. The frames only
+    # point at these records, rather than copying them. (Likewise, the positions are only read once.)
+    positions = None
+    for user in recipients:
+        if not user["world_due"]:
+            continue
+        tracker = user["snapshot_tracker"]
+        radius = detail_radius(user)
+        if tracker is None and radius is None:
+            user["visible_records"] = None  # (it gets the broadcast WORLD_UPDATE, with everything in it.)
+            continue
+        protocol = user["protocol"]
+        records = world_snapshot(snapshots, world_objects, protocol)
+        if radius is None:
+            snapshot = records
+        else:
+            if positions is None:
+                positions = object_positions(world_objects)
+            snapshot = {visible_id: records[visible_id]
+                        for visible_id in ids_of_interest(user["PlayerShip"], positions, radius)}
+
+        if tracker is not None:
+            base_tick, changed, removed = tracker.build_delta(world_tick, snapshot)
+            if protocol == Protocol.BINARY:
+                header = pack_world_delta_header(world_tick, base_tick, removed)
+            else:
+                header = "".join([f"{world_tick}\t{base_tick}\n"] +
+                                 [f"REMOVE\t{removed_id}\n" for removed_id in removed]).encode()
+            queue_frame(user, broadcast_manager.build_frame_buffers([header, step_record(protocol)] + changed,
+                                                                    MessageType.WORLD_DELTA, protocol),
+                        MessageType.WORLD_DELTA, protocol)
+            continue
+
+        queue_frame(user, broadcast_manager.build_frame_buffers([step_record(protocol)] + list(snapshot.values()),
+                                                                MessageType.WORLD_UPDATE, protocol),
+                    MessageType.WORLD_UPDATE, protocol)
+        # (a user that was getting the broadcast has been sent everything.)
+        previous = user["visible_records"] if user["visible_records"] is not None else records
+        out_of_range = [record for visible_id, record in previous.items() if visible_id not in snapshot]
+        if len(out_of_range) > 0:
+            queue_frame(user, broadcast_manager.build_frame_buffers(out_of_range, MessageType.DELETE_ITEMS, protocol),
+                        MessageType.DELETE_ITEMS, protocol)
+        user["visible_records"] = snapshot
+
 
+def gather_stats(scheduler: GameScheduler = None) -> Dict:
+    """
+    collects the game loop's phase timings and every user's counters, for the stats server. This only holds the
+    user_dictionary_lock long enough to list the users, so the game doesn't have to wait for it.
+    :param scheduler: the GameScheduler running the game loop, if its overrun counts should be included
+    :return: the stats, as a dictionary.
+    """
+    stats = host_stats.summary()
+    if scheduler is not None:
+        stats["scheduler"] = {"overruns": scheduler.total_overruns, "dropped_steps": scheduler.total_dropped_steps}
+    user_dictionary_lock.acquire()
+    users = list(user_dictionary.items())
+    user_dictionary_lock.release()
+    stats["clients"] = []
+    for user_id, user in users:
+        client = {"id": user_id, "name": user["name"], "protocol": user["protocol"].name,
+                  "delta": user["snapshot_tracker"] is not None, "pending_bytes": user["outbox"].pending_bytes(),
+                  "unsent_bytes": unsent_bytes(user["connection"]),
+                  "dropped_frames": user["outbox"].dropped_frames}
+        client.update(user["stats"].summary())
+        client["link"] = user["link_monitor"].summary()
+        if user["datagram_channel"] is not None:
+            client["datagrams"] = user["datagram_channel"].summary()
+        stats["clients"].append(client)
+    return stats
+
+
+def start_recording() -> None:
+    """
+    if recording_directory is set, start recording this match to a new file in it, named after the time it started.
+    :return: None
+    """
+    global match_recorder
+    if recording_directory is None:
+        return
+    path = os.path.join(recording_directory, time.strftime("match-%Y%m%d-%H%M%S") + f"-{os.getpid()}.swr")
+    match_recorder = MatchRecorder(path, send_interval, max_recording_bytes)
+    print(f"Recording this match to {path}.")
+
+
+def stop_recording() -> None:
+    """
+    if the match is being recorded, finish writing the recording and close it. (Call this on the way out - otherwise,
+    whatever the recorder hasn't written yet is lost.)
+    :return: None
+    """
+    if match_recorder is not None:
+        match_recorder.close()
+
+
+def start_stats_server(scheduler: GameScheduler = None) -> None:
+    """
+    if stats_port is set, start serving gather_stats() on it.
+    :param scheduler: the GameScheduler running the game loop
+    :return: None
+    """
+    if stats_port is None:
+        return
+    serve_stats(lambda: gather_stats(scheduler), stats_port)
+    print(f"Stats are at http://127.0.0.1:{stats_port}/ (and /metrics).")
+
+
+# everything in the world - the players' ships, the bullets, etc. - by id number. (This also hands out the id numbers.)
+world = WorldRegistry()
+
+# the ships of users who have disconnected since the last send, which can be reused after it.
+departed_ships = []
+
+# the host's UDP socket (if datagram_port is set), shared by every user's DatagramChannel, and which user each session
+# token belongs to.
+datagram_socket = None
+datagram_sessions: Dict[int, int] = {}
+
+# if we're using them, these hold the positions, velocities, etc. of all the ships and bullets in NumPy arrays.
+ship_store = ShipStore() if use_entity_store else None
+bullet_store = BulletStore() if use_entity_store else None
+
+# the bullets are sorted into this grid each tick, so that we can quickly find the ones near each ship.
+bullet_grid = SpatialGrid(cell_size=2 * hit_distance, world_size=world_size)
+
+# the encoded records of the on-screen objects, so that each one is only re-encoded when it changes.
+record_cache = RecordCache()
+
+# if we are recording the match, the MatchRecorder writing it.
+match_recorder = None
+
+# how long each phase of the game loop takes (each user's own counters are in its "stats" entry).
+host_stats = HostStats()
+
+# this is a variable we'll initialize later, when we first need it.
+broadcast_manager = None
+
+# every snapshot of the world we send out is numbered, so that users can tell us which ones they have received.
+world_tick = 0
+
+# how many simulation steps have been run. (Each ship remembers the step on which its latest input was applied, and
+# each snapshot says which step it was taken after, so users can tell how many steps their ship has run since.)
+simulation_steps = 0
+
+# the time of the most recent game loop step.
+last_update = time.time()
+
+# the objects that have been removed from the world since the last time we sent it out.
+items_to_delete = []
+
+# the user_dictionary is a dictionary of dictionaries of all the connected user's names & connections, keyed on
+# unique id numbers.
+# for example, user_dictionary might be {1: {"name":"Steve", "connection": some_socket_connection1},
+#                                        3: {"name":"Milo", "connection": some_socket_connection2},
+#                                        4: {"name":"Opus", "connection": some_socket_connection3}}
+user_dictionary: Dict[int, Dict] = {}
+user_dictionary_lock = threading.Lock()  # this is used to lock user_dictionary, as it might be used by multiple
+                                         # threads.
+
+if __name__ == '__main__':
     # Start the process of listening for users
     mySocket = socket.socket()
 
@@ -263,22 +1246,18 @@ if __name__ == '__main__':
     mySocket.listen(5)
     print("Socket is listening.")
 
-    last_update = time.time()
-    game_loop_timer = RepeatTimer(0.02, game_loop_step)
-    game_loop_timer.start()
-
-    while True:
-        connection, address = mySocket.accept()  # wait to receive a new socket connection.
-        # print(f"Got connection from {address}")
-
-        # start a new thread that will continuously listen for communication from this socket connection.
-        latest_id += 1
-        connectionThread = threading.Thread(target=listen_to_connection, args=(connection, latest_id, address))
-
-        user_dictionary_lock.acquire()
-        user_dictionary[latest_id] = {"name": "unknown",
-                                      "connection": connection,
-                                      "PlayerShip": PlayerShip(latest_id, "Unknown")}
+    game_loop_scheduler = GameScheduler(simulation_step, send_step, simulation_interval=simulation_interval,
+                                        send_interval=send_interval)
+    start_recording()
+    game_loop_scheduler.start()
+    start_stats_server(game_loop_scheduler)
+    start_datagram_listener()
 
-        user_dictionary_lock.release()
-        connectionThread.start()
+    try:
+        while True:
+            connection, address = mySocket.accept()  # wait to receive a new socket connection.
+            # print(f"Got connection from {address}")
+            start_user(connection, address)
+    finally:
+        game_loop_scheduler.cancel()
+        stop_recording()
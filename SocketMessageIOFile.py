@@ -1,7 +1,8 @@
 import socket
 import struct
+import threading
 from enum import Enum
-from typing import Tuple
+from typing import List, Tuple, Union
 
 
 class MessageType(Enum):
@@ -10,58 +11,203 @@ class MessageType(Enum):
     KEY_STATUS = 3
     WORLD_UPDATE = 4
     DELETE_ITEMS = 5
+    PROTOCOL = 6
+    WORLD_DELTA = 7
+    ACK = 8
+    KEYFRAME_REQUEST = 9
+    SHIP_ID = 10
+    DATAGRAM_SESSION = 11
+    PING = 12
+    PONG = 13
+
+
+# optional features that a client can ask for in its PROTOCOL message.
+DELTA_FEATURE = "DELTA"
+PREDICTION_FEATURE = "PREDICT"  # the host tells the client which ship is its own (in a SHIP_ID message).
+DATAGRAM_FEATURE = "UDP"  # world deltas (and the client's input) go over UDP - see DatagramChannelFile. Needs DELTA.
+PING_FEATURE = "PING"  # the client answers the host's PINGs, so the host can measure the link - see LinkMonitorFile.
+
+
+class Protocol(Enum):
+    TEXT = 0    # "MessageType.WORLD_UPDATE\t..." - the original, human-readable format.
+    BINARY = 1  # a one-byte message type, followed by the payload. Entity records are struct-packed (see WireFormatFile)
+
+
+# in the binary protocol, these message types carry packed entity records, rather than text.
+BINARY_PAYLOAD_TYPES = (MessageType.WORLD_UPDATE, MessageType.DELETE_ITEMS, MessageType.WORLD_DELTA)
+
+# how much the receive buffer can hold at first; it grows if a message doesn't fit.
+receive_buffer_size = 64 * 1024
+
+# the most buffers we hand to a single sendmsg() call - operating systems limit this (IOV_MAX is 1024 on Linux/macOS).
+max_buffers_per_send = 1024
 
 
 class SocketMessageIO:
     """
     A utility class that makes it easy to send and receive messages from a socket in the format of a packed length of
     the message, followed by the message.
+    Every connection starts out using the text protocol; once the host and client have agreed (via a PROTOCOL message)
+    to switch, set the protocol attribute to Protocol.BINARY.
+    The same PROTOCOL message can also ask for optional features, such as DELTA (world snapshots sent as WORLD_DELTA
+    messages relative to the last snapshot the client acknowledged with an ACK).
     """
-    def receive_message_from_socket(self, connection: socket) -> Tuple[MessageType, str]:
+    def __init__(self, protocol: Protocol = Protocol.TEXT):
+        self.protocol = protocol
+        # the bytes we have read from the socket, but not yet handed out, are receive_buffer[buffer_start:buffer_end].
+        # (The buffer is only made when we first receive something, as many managers only ever send.)
+        self.receive_buffer: bytearray = None
+        self.buffer_start = 0
+        self.buffer_end = 0
+        # several threads may send through the same manager (e.g., the GUI, a timer and the listener in the client), so
+        # only one of them writes a message to the socket at a time.
+        self.send_lock = threading.Lock()
+
+    def receive_message_from_socket(self, connection: socket) -> Tuple[MessageType, Union[str, bytes]]:
         """
         Waits until the socket provides a message in the form of a packed length of the message and the message itself.
-        The message could conceivably be quite long, so it will do multiple reads of the socket until all the data
-        arrives before returning the message.
+        Whatever the socket has is read straight into this manager's receive buffer, as much as fits in one go, so a
+        single read may bring in several messages (or only part of one). Complete messages are handed out one per call,
+        and the socket is only read again once the buffer doesn't hold a whole message. Each message is only decoded
+        once all of its bytes have arrived.
         :param connection: the socket that it is listening to
-        :return: a string containing the content of the message that was sent.
+        :return: the type of the message and a string containing the content of the message that was sent. (In the
+        binary protocol, WORLD_UPDATE and DELETE_ITEMS messages return the packed bytes, instead.)
         Throws a ConnectionAbortedError exception if this socket has been discontinued.
         """
+        if self.receive_buffer is None:
+            self.receive_buffer = bytearray(receive_buffer_size)
+        while True:
+            if self.buffer_start == self.buffer_end:  # everything has been handed out, so start again at the front.
+                self.buffer_start = self.buffer_end = 0
+            available = self.buffer_end - self.buffer_start
+            if available >= 4:
+                message_length = struct.unpack_from('>I', self.receive_buffer, self.buffer_start)[0]
+                if available >= 4 + message_length:
+                    message_start = self.buffer_start + 4
+                    self.buffer_start = message_start + message_length
+                    with memoryview(self.receive_buffer) as view:
+                        return self.parse_message(view[message_start:self.buffer_start])
+                self.make_room_for(4 + message_length)
+            else:
+                self.make_room_for(4)
+
+            with memoryview(self.receive_buffer) as view:
+                num_received = connection.recv_into(view[self.buffer_end:])
+            if num_received == 0:
+                print("no data - disconnected?")
+                raise ConnectionAbortedError("Disconnected.")
+            self.buffer_end += num_received
+
+    def make_room_for(self, num_bytes: int) -> None:
+        """
+        makes sure that a message of num_bytes bytes (counting from the start of the unread data) will fit in the
+        receive buffer - moving the unread data to the front of the buffer, and growing the buffer if that isn't enough.
+        :param num_bytes: the size of the message we're waiting for
+        :return: None
+        """
+        if self.buffer_start + num_bytes <= len(self.receive_buffer):
+            return
+        unread = self.buffer_end - self.buffer_start
+        if num_bytes > len(self.receive_buffer):
+            new_buffer = bytearray(max(num_bytes, 2 * len(self.receive_buffer)))
+            new_buffer[:unread] = self.receive_buffer[self.buffer_start:self.buffer_end]
+            self.receive_buffer = new_buffer
+        else:
+            self.receive_buffer[:unread] = self.receive_buffer[self.buffer_start:self.buffer_end]
+        self.buffer_start = 0
+        self.buffer_end = unread
 
-        message_length_str = connection.recv(4)
-        if message_length_str == b'':
-            print("no data - disconnected?")
-            raise ConnectionAbortedError("Disconnected.")
-        message_length = struct.unpack('>I', message_length_str)[0]
-        received_length = 0
-        message = ""
-        # we're going to ask to receive data from the socket, but it may arrive in separate sections of data. For
-        # instance, we might be expecting a message of length 512, but it could come in two "chunks" of 200 and 312.
-        # Moreover, we're only asking for data from the socket up to size 1024, so a longer message might require
-        # several reads of the socket.
-        # But the goal is to get the entire message.
-        while received_length < message_length:
-            request_length = min(1024, message_length-received_length)
-            chunk_o_data = connection.recv(request_length).decode()
-            message += chunk_o_data
-            received_length += len(chunk_o_data)
+    def parse_message(self, data: Union[bytes, memoryview]) -> Tuple[MessageType, Union[str, bytes]]:
+        """
+        splits a complete message (everything after the packed length) into its type and its body, according to this
+        manager's protocol. This is also for callers that do their own reading, e.g., from an asyncio stream.
+        :param data: the bytes of the message (or a memoryview of them - the body is copied out, so the caller can
+        reuse the memory afterwards)
+        :return: the type of the message and its body - bytes for messages that carry entity records in the binary
+        protocol, otherwise a string.
+        """
+        if self.protocol == Protocol.BINARY:
+            message_type = MessageType(data[0])
+            if message_type in BINARY_PAYLOAD_TYPES:
+                return message_type, bytes(data[1:])
+            return message_type, str(data[1:], "utf-8")
 
+        message = str(data, "utf-8")
         first_tab_loc = message.find("\t")
+        return MessageType[message[12:first_tab_loc]], message[first_tab_loc+1:]
 
-        message_type = MessageType[message[12:first_tab_loc]]  # Note: the 12 clears the "MessageType." from the front
-        #                                                              of the string....
-        output_message = message[first_tab_loc+1:]  # the rest of the string from after the initial tab.
-        return message_type, output_message
+    def build_frame(self, message: Union[str, bytes], message_type=MessageType.SUBMISSION,
+                    protocol: Protocol = None) -> bytes:
+        """
+        Constructs the bytes that will go over the socket for this message: the packed length of the message followed
+        by the message. This lets the caller build a frame once and send it to several sockets.
+        :param message: the message to send - usually a string, or (in the binary protocol) already-packed bytes.
+        :param message_type: the type of message to send out
+        :param protocol: which format to use; defaults to this manager's protocol.
+        :return: the bytes to send.
+        """
+        return b"".join(self.build_frame_buffers(message, message_type, protocol))
 
-    def send_message_to_socket(self, message: str, connection: socket, message_type = MessageType.SUBMISSION) -> None:
+    def build_frame_buffers(self, message: Union[str, bytes, List[bytes]], message_type=MessageType.SUBMISSION,
+                            protocol: Protocol = None) -> List[bytes]:
+        """
+        The same as build_frame, but the frame is left in pieces - a header with the packed length and type, followed
+        by the pieces of the message - so that a message made of many already-encoded records never has to be copied
+        into one big block. The pieces can be sent together with send_buffers_to_socket().
+        :param message: the message to send - a string, bytes, or a list of already-encoded pieces.
+        :param message_type: the type of message to send out
+        :param protocol: which format to use; defaults to this manager's protocol.
+        :return: the list of buffers that make up the frame.
+        """
+        if protocol is None:
+            protocol = self.protocol
+        if isinstance(message, list):
+            pieces = message
+        elif isinstance(message, bytes):
+            pieces = [message]
+        else:
+            pieces = [str(message).encode()]
+        payload_length = sum(map(len, pieces))
+
+        if protocol == Protocol.BINARY:
+            return [struct.pack('>IB', payload_length + 1, message_type.value)] + pieces
+
+        prefix = f"{message_type}\t".encode()
+        return [struct.pack('>I', len(prefix) + payload_length) + prefix] + pieces
+
+    def send_message_to_socket(self, message: Union[str, bytes], connection: socket,
+                               message_type=MessageType.SUBMISSION) -> None:
         """
         Sends the given message to the given socket in the format of the packed length of the message, followed by
         the encoded message, itself.
         :param message: the message to send
         :param connection: the socket to send it to
         :param message_type: the type of message to send out
-        :return: None.
+        :return: None
         """
+        frame = self.build_frame(message, message_type)
+        with self.send_lock:
+            connection.sendall(frame)
 
-        compound_message = f"{message_type}\t{message}"
-        connection.sendall(struct.pack('>I', len(compound_message)))
-        connection.sendall(compound_message.encode())
+    def send_buffers_to_socket(self, buffers: List[bytes], connection: socket) -> None:
+        """
+        Sends all of the given buffers, in order, with as few system calls as possible - each sendmsg() hands the
+        operating system up to max_buffers_per_send buffers at once, without joining them together first.
+        :param buffers: the bytes to send (e.g., the pieces of one or more frames from build_frame_buffers)
+        :param connection: the socket to send them to
+        :return: None
+        """
+        if not hasattr(connection, "sendmsg"):  # (e.g., on Windows.)
+            connection.sendall(b"".join(buffers))
+            return
+        views = [memoryview(buffer) for buffer in buffers if len(buffer) > 0]
+        first = 0
+        while first < len(views):
+            sent = connection.sendmsg(views[first:first + max_buffers_per_send])
+            # skip past whatever was sent; if it stopped partway through a buffer, send the rest of it next time.
+            while first < len(views) and sent >= len(views[first]):
+                sent -= len(views[first])
+                first += 1
+            if sent > 0:
+                views[first] = views[first][sent:]
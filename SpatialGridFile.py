@@ -0,0 +1,91 @@
+import math
+from typing import Dict, List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional - without it, the grid is built with a plain Python loop.
+    np = None
+
+
+class SpatialGrid:
+    """
+    A uniform grid laid over the (toroidal) world, so that we can find the objects near a point without looking at
+    every object. Each cell holds the indices of the objects whose positions fall inside it; the grid wraps around at
+    the edges of the world, just like the objects do.
+    Rebuild it whenever the objects have moved (e.g., once per tick), then ask it for the candidates near a point.
+    """
+    def __init__(self, cell_size: float = 16, world_size: float = 800):
+        self.cells_across = max(1, int(world_size // cell_size))
+        self.cell_size = world_size / self.cells_across
+        self.world_size = world_size
+        self.cells: Dict[int, Sequence[int]] = {}
+
+    def cell_key(self, column: int, row: int) -> int:
+        return (column % self.cells_across) * self.cells_across + (row % self.cells_across)
+
+    def rebuild(self, xs: Sequence[float], ys: Sequence[float]) -> None:
+        """
+        sorts the objects into cells, replacing whatever was in the grid before.
+        :param xs: the x coordinate of each object
+        :param ys: the y coordinate of each object (in the same order)
+        :return: None
+        """
+        if np is not None and isinstance(xs, np.ndarray):
+            self.rebuild_from_arrays(xs, ys)
+            return
+        self.cells = {}
+        for index in range(len(xs)):
+            key = self.cell_key(int(xs[index] // self.cell_size), int(ys[index] // self.cell_size))
+            if key in self.cells:
+                self.cells[key].append(index)
+            else:
+                self.cells[key] = [index]
+
+    def rebuild_from_arrays(self, xs, ys) -> None:
+        """
+        the same as rebuild(), but for NumPy arrays: the cell of every object is found at once, and the objects are
+        sorted by cell so that each cell is just a slice of the sorted indices.
+        """
+        columns = (xs // self.cell_size).astype(np.int64) % self.cells_across
+        rows = (ys // self.cell_size).astype(np.int64) % self.cells_across
+        keys = columns * self.cells_across + rows
+        order = np.argsort(keys, kind="stable")
+        occupied_keys, starts = np.unique(keys[order], return_index=True)
+        ends = list(starts[1:]) + [len(order)]
+        self.cells = {int(key): order[start:end] for key, start, end in zip(occupied_keys, starts, ends)}
+
+    def candidates_near(self, x: float, y: float, reach: float) -> List[int]:
+        """
+        finds the objects that might be within reach of (x, y) in each direction - i.e., those in any cell that
+        overlaps that square, allowing for the wrap-around. The caller still needs to check the actual distances.
+        :param x: the x coordinate of the point
+        :param y: the y coordinate of the point
+        :param reach: how far from the point to look, in each direction
+        :return: the indices of the candidate objects.
+        """
+        result = []
+        for cell in self.cells_near(x, y, reach):
+            result.extend(cell)
+        return result
+
+    def cells_near(self, x: float, y: float, reach: float) -> List[Sequence[int]]:
+        """
+        the same as candidates_near(), but the candidates are left in their cells - which, for a grid built from NumPy
+        arrays, are arrays that can be joined with np.concatenate, rather than one at a time.
+        :return: the contents of each occupied cell that overlaps the square.
+        """
+        first_column = math.floor((x - reach) / self.cell_size)
+        last_column = math.floor((x + reach) / self.cell_size)
+        first_row = math.floor((y - reach) / self.cell_size)
+        last_row = math.floor((y + reach) / self.cell_size)
+        # (on a very small grid, the square might cover the same cell twice, so make sure we only look once.)
+        keys = {self.cell_key(column, row) for column in range(first_column, last_column + 1)
+                for row in range(first_row, last_row + 1)}
+        return [self.cells[key] for key in keys if key in self.cells]
+
+    def toroidal_offset(self, a: float, b: float) -> float:
+        """
+        :return: the distance between two coordinates along one axis, going whichever way around the world is shorter.
+        """
+        offset = math.fabs(a - b)
+        return min(offset, self.world_size - offset)
@@ -0,0 +1,133 @@
+import struct
+from typing import List, Dict, Tuple
+
+"""
+The binary layout of the entity records that travel in WORLD_UPDATE and DELETE_ITEMS messages when the host and client
+have agreed to use the binary protocol. (The text protocol just uses each object's public_info() string.)
+
+Every record starts with a one-byte tag that says what kind of object follows:
+    PLAYER: tag, id, x, y, bearing, thrusting, health, vx, vy, input sequence, input step, length of name -- followed
+            by the utf-8 bytes of the name. (The input sequence is the number of the last key status the host applied
+            to this ship, and the input step is the host's simulation step on which it was first applied.)
+    BULLET: tag, id, x, y, owner_id
+    STEP:   tag, step -- how many simulation steps the host had run when it took this snapshot. Every WORLD_UPDATE and
+            WORLD_DELTA starts with one, so that a client can tell how many steps a ship has run with its latest input
+            (step - input step) without that count being in the ship's record, which would then change on every tick.
+
+A WORLD_DELTA message starts with a header (tick, base tick, number of removed objects), then the ids of the removed
+objects, then the records of the objects that were created or changed.
+"""
+
+PROTOCOL_VERSION = 3
+
+PLAYER_TAG = 1
+BULLET_TAG = 2
+STEP_TAG = 3
+
+player_struct = struct.Struct('>BIfffBhffIIB')
+bullet_struct = struct.Struct('>BIffI')
+step_struct = struct.Struct('>BI')
+delta_header_struct = struct.Struct('>IIH')
+
+
+def pack_player(my_id: int, x: float, y: float, bearing: float, thrusting: int, health: int, name: str, vx: float,
+                vy: float, input_sequence: int, input_step: int) -> bytes:
+    """
+    builds the binary record for a single player.
+    :return: the packed bytes for this player, including its name.
+    """
+    name_bytes = name.encode()
+    if len(name_bytes) > 255:  # the length has to fit in a byte - cut it short, but not in the middle of a character.
+        name_bytes = name_bytes[:255].decode(errors="ignore").encode()
+    health = max(-32768, min(32767, health))  # it goes in a signed 16-bit number; a ship that far gone is dead anyway.
+    return player_struct.pack(PLAYER_TAG, my_id, x, y, bearing, thrusting, health, vx, vy, input_sequence, input_step,
+                              len(name_bytes)) + name_bytes
+
+
+def pack_bullet(bullet_id: int, x: float, y: float, owner_id: int) -> bytes:
+    """
+    builds the binary record for a single bullet.
+    :return: the packed bytes for this bullet.
+    """
+    return bullet_struct.pack(BULLET_TAG, bullet_id, x, y, owner_id)
+
+
+def pack_step(step: int) -> bytes:
+    """
+    builds the STEP record that goes at the start of each world message.
+    :param step: how many simulation steps the host has run
+    :return: the packed bytes.
+    """
+    return step_struct.pack(STEP_TAG, step)
+
+
+def unpack_entity_records(payload: bytes) -> List[Dict]:
+    """
+    converts a run of binary entity records back into the same dictionaries that the client builds from the text
+    protocol, so that the rest of the client doesn't have to care which protocol was used.
+    :param payload: the concatenated records, as received from the socket.
+    :return: a list of dictionaries, one per record.
+    """
+    records = []
+    offset = 0
+    while offset < len(payload):
+        tag = payload[offset]
+        if tag == PLAYER_TAG:
+            _, my_id, x, y, bearing, thrusting, health, vx, vy, input_sequence, input_step, name_length = \
+                player_struct.unpack_from(payload, offset)
+            offset += player_struct.size
+            name = payload[offset:offset + name_length].decode()
+            offset += name_length
+            records.append({"type": "PLAYER", "id": my_id, "x": x, "y": y, "bearing": bearing,
+                            "thrusting": thrusting == 1, "health": health, "name": name, "vx": vx, "vy": vy,
+                            "input_sequence": input_sequence, "input_step": input_step})
+        elif tag == BULLET_TAG:
+            _, bullet_id, x, y, owner_id = bullet_struct.unpack_from(payload, offset)
+            offset += bullet_struct.size
+            records.append({"type": "BULLET", "id": bullet_id, "x": x, "y": y, "owner_id": owner_id})
+        elif tag == STEP_TAG:
+            _, step = step_struct.unpack_from(payload, offset)
+            offset += step_struct.size
+            records.append({"type": "STEP", "step": step})
+        else:
+            raise ValueError(f"Unknown entity record tag {tag} at offset {offset}.")
+    return records
+
+
+def pack_world_delta(tick: int, base_tick: int, changed_records: List[bytes], removed_ids: List[int]) -> bytes:
+    """
+    builds the payload of a binary WORLD_DELTA message.
+    :param tick: the tick this snapshot describes
+    :param base_tick: the tick of the snapshot this delta applies to, or 0 if this is a keyframe
+    :param changed_records: the packed records of the objects that were created or changed
+    :param removed_ids: the ids of the objects that were removed
+    :return: the packed payload.
+    """
+    return pack_world_delta_header(tick, base_tick, removed_ids) + b"".join(changed_records)
+
+
+def pack_world_delta_header(tick: int, base_tick: int, removed_ids: List[int]) -> bytes:
+    """
+    builds the part of a binary WORLD_DELTA payload that comes before the changed records, for callers that send the
+    records as separate buffers.
+    :param tick: the tick this snapshot describes
+    :param base_tick: the tick of the snapshot this delta applies to, or 0 if this is a keyframe
+    :param removed_ids: the ids of the objects that were removed
+    :return: the packed header and removed ids.
+    """
+    return delta_header_struct.pack(tick, base_tick, len(removed_ids)) + \
+        struct.pack(f'>{len(removed_ids)}I', *removed_ids)
+
+
+def unpack_world_delta(payload: bytes) -> Tuple[int, int, List[int], List[Dict]]:
+    """
+    the reverse of pack_world_delta.
+    :param payload: the payload of a binary WORLD_DELTA message
+    :return: the tick, the base tick (0 for a keyframe), the ids of removed objects and the dictionaries of the
+    created or changed objects.
+    """
+    tick, base_tick, num_removed = delta_header_struct.unpack_from(payload)
+    offset = delta_header_struct.size
+    removed_ids = list(struct.unpack_from(f'>{num_removed}I', payload, offset))
+    offset += 4 * num_removed
+    return tick, base_tick, removed_ids, unpack_entity_records(payload[offset:])
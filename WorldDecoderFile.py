@@ -0,0 +1,277 @@
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from EntityRecordFile import EntityRecord, PLAYER, BULLET
+from WireFormatFile import PLAYER_TAG, BULLET_TAG, STEP_TAG, player_struct, bullet_struct, step_struct, \
+    delta_header_struct
+
+max_free_records = 1024  # don't keep more than this many unused records waiting to be reused.
+
+
+class WorldDecoder:
+    """
+    Turns the WORLD_UPDATE, WORLD_DELTA and DELETE_ITEMS messages from the host (in either protocol) into the
+    client's EntityRecords. Each message is parsed straight into the records of the objects it describes: the numbers
+    are converted once, here, and written into the same record the object had last time, so a steady stream of
+    snapshots doesn't build any new dictionaries or records - only an object we haven't seen before needs one, and that
+    comes from the pool of records left behind by objects that have gone.
+    An object that has gone isn't forgotten right away: its record is marked with the time it went, and the render
+    loop (which shows the world a little in the past) releases it once it has reached that time.
+    The apply_... methods are called by the listener threads (the world can arrive over TCP and UDP at once);
+    current_records() and release() by the GUI's thread. Everything is done with the lock held.
+    A delta snapshot that arrives after a newer one (e.g., one that was too big for a datagram, and came the slow way
+    over TCP) is ignored.
+    """
+    def __init__(self):
+        self.records: Dict[int, EntityRecord] = {}  # every object we are showing (or about to stop showing), by id.
+        self.free_records: List[EntityRecord] = []
+        self.current_ids: Set[int] = set()  # the objects in the most recent snapshot.
+        self.decoded_ids: Set[int] = set()  # the objects in the message being decoded. (Reused for each message.)
+        # for delta snapshots: where each object was (x, y, bearing) in each recent snapshot, by tick and id.
+        self.tick_positions: Dict[int, Dict[int, Tuple[float, float, float]]] = {}
+        self.latest_tick = 0  # the newest delta snapshot we have applied.
+        self.host_step = None  # how many simulation steps the host had run when it took the newest snapshot we applied.
+        self.lock = threading.Lock()
+
+    def apply_update(self, message: Union[str, bytes], arrival_time: float = None) -> None:
+        """
+        the host has sent the whole world, so update the records of the objects in it, and mark any others as gone.
+        :param message: the body of the WORLD_UPDATE message - public_info lines (text) or packed records (binary).
+        :param arrival_time: when it arrived (by time.monotonic()); defaults to now.
+        :return: None
+        """
+        if arrival_time is None:
+            arrival_time = time.monotonic()
+        with self.lock:
+            decoded_ids = self.decoded_ids
+            decoded_ids.clear()
+            if isinstance(message, bytes):
+                self.decode_binary_records(message, 0, arrival_time, decoded_ids)
+            else:
+                self.decode_text_records(message.split("\n"), 0, arrival_time, decoded_ids)
+            self.mark_gone(self.current_ids.difference(decoded_ids), arrival_time)
+            # swap the two sets, so the old one is reused for the next message.
+            self.current_ids, self.decoded_ids = decoded_ids, self.current_ids
+
+    def apply_delta(self, message: Union[str, bytes], arrival_time: float = None) -> Optional[int]:
+        """
+        the host has sent the changes to the world since a snapshot we already have (or, if the base tick is 0, a whole
+        new snapshot), so update the records of the objects that changed, and mark the ones that were removed as gone.
+        :param message: the body of the WORLD_DELTA message
+        :param arrival_time: when it arrived (by time.monotonic()); defaults to now.
+        :return: the tick of the new snapshot, to acknowledge to the host - or None if we no longer have the snapshot
+        the delta is based on, in which case nothing has changed and we need to ask for a keyframe. (If we have already
+        applied a newer snapshot, this one is ignored, and the newer one's tick is returned - acknowledging it again
+        does no harm.)
+        """
+        if arrival_time is None:
+            arrival_time = time.monotonic()
+        if isinstance(message, bytes):
+            tick, base_tick, num_removed = delta_header_struct.unpack_from(message)
+            offset = delta_header_struct.size
+            removed_ids = struct.unpack_from(f'>{num_removed}I', message, offset)
+            offset += 4 * num_removed
+            lines = None
+        else:
+            lines = message.split("\n")
+            tick, base_tick = [int(value) for value in lines[0].split("\t")]
+            offset = 1
+            removed_ids = []
+            while offset < len(lines) and lines[offset].startswith("REMOVE\t"):
+                removed_ids.append(int(lines[offset][7:]))
+                offset += 1
+
+        with self.lock:
+            if tick <= self.latest_tick:
+                return self.latest_tick
+            if base_tick == 0:
+                positions = {}
+            elif base_tick in self.tick_positions:
+                positions = dict(self.tick_positions[base_tick])
+            else:
+                return None
+            for object_id in removed_ids:
+                positions.pop(object_id, None)
+
+            decoded_ids = self.decoded_ids
+            decoded_ids.clear()
+            if lines is None:
+                self.decode_binary_records(message, offset, arrival_time, decoded_ids)
+            else:
+                self.decode_text_records(lines, offset, arrival_time, decoded_ids)
+            # the objects that haven't changed are where they were in the base snapshot - which needn't be where we
+            # last saw them, if the base is older than the newest snapshot we've had. (So an object that a newer
+            # snapshot removed may even have come back.)
+            for object_id, position in positions.items():
+                record = self.records.get(object_id)
+                if record is not None and object_id not in decoded_ids:
+                    record.removed_time = None
+                    record.add_sample(arrival_time, *position)
+            for object_id in decoded_ids:
+                positions[object_id] = self.records[object_id].latest_position()
+            snapshot_ids = set(positions)
+            self.mark_gone(self.current_ids.difference(snapshot_ids), arrival_time)
+            self.current_ids = snapshot_ids
+
+            # the host will never base a delta on anything older than the snapshot it just used.
+            self.tick_positions[tick] = positions
+            for old_tick in [t for t in self.tick_positions if t < base_tick]:
+                del self.tick_positions[old_tick]
+            self.latest_tick = tick
+        return tick
+
+    def apply_deletions(self, message: Union[str, bytes], arrival_time: float = None) -> None:
+        """
+        the host has told us that some objects no longer exist, so mark them as gone.
+        :param message: the body of the DELETE_ITEMS message - public_info lines (text) or packed records (binary).
+        :param arrival_time: when it arrived (by time.monotonic()); defaults to now.
+        :return: None
+        """
+        if arrival_time is None:
+            arrival_time = time.monotonic()
+        removed_ids = []
+        if isinstance(message, bytes):
+            offset = 0
+            while offset < len(message):
+                tag = message[offset]
+                removed_ids.append(struct.unpack_from('>I', message, offset + 1)[0])
+                if tag == PLAYER_TAG:
+                    offset += player_struct.size + message[offset + player_struct.size - 1]
+                elif tag == BULLET_TAG:
+                    offset += bullet_struct.size
+                else:
+                    raise ValueError(f"Unknown entity record tag {tag} at offset {offset}.")
+        else:
+            for line in message.split("\n"):
+                if line != "":
+                    removed_ids.append(int(line.split("\t")[1]))
+        with self.lock:
+            self.mark_gone(removed_ids, arrival_time)
+            self.current_ids.difference_update(removed_ids)
+
+    def current_records(self) -> List[EntityRecord]:
+        """
+        :return: the records of every object that is being shown, or is about to stop being shown.
+        """
+        with self.lock:
+            return list(self.records.values())
+
+    def release(self, record: EntityRecord) -> None:
+        """
+        the render loop has finished with the record of an object that has gone, so put it back in the pool - unless
+        the object has come back in the meantime.
+        :param record: the record to release
+        :return: None
+        """
+        with self.lock:
+            if record.removed_time is None or self.records.get(record.id) is not record:
+                return
+            del self.records[record.id]
+            if len(self.free_records) < max_free_records:
+                self.free_records.append(record)
+
+    def mark_gone(self, object_ids, removal_time: float) -> None:
+        """
+        note the time that these objects left the world. (Call this with the lock held.)
+        :param object_ids: the ids of the objects that have gone
+        :param removal_time: when they went (by time.monotonic())
+        :return: None
+        """
+        for object_id in object_ids:
+            record = self.records.get(object_id)
+            if record is not None and record.removed_time is None:
+                record.removed_time = removal_time
+
+    def record_for(self, kind: str, object_id: int) -> EntityRecord:
+        """
+        finds the record for this object, starting a new one (preferably from the pool) if we don't have one, or if the
+        object went away and has come back. (Call this with the lock held.)
+        :param kind: PLAYER or BULLET
+        :param object_id: the object's unique id number
+        :return: the object's record.
+        """
+        record = self.records.get(object_id)
+        if record is None:
+            record = self.free_records.pop() if len(self.free_records) > 0 else EntityRecord()
+            record.reset(kind, object_id)
+            self.records[object_id] = record
+        elif record.removed_time is not None:
+            # (where it was before it left has nothing to do with where it is now.)
+            record.reset(kind, object_id)
+        return record
+
+    def decode_binary_records(self, payload: bytes, offset: int, arrival_time: float, decoded_ids: Set[int]) -> None:
+        """
+        updates the records of the objects described by a run of binary entity records. (Call this with the lock held.)
+        :param payload: the message containing the records
+        :param offset: where the records start in the payload
+        :param arrival_time: when the message arrived
+        :param decoded_ids: the id of each object decoded is added to this set
+        :return: None
+        """
+        end = len(payload)
+        while offset < end:
+            tag = payload[offset]
+            if tag == PLAYER_TAG:
+                _, object_id, x, y, bearing, thrusting, health, vx, vy, input_sequence, input_step, name_length = \
+                    player_struct.unpack_from(payload, offset)
+                offset += player_struct.size
+                record = self.record_for(PLAYER, object_id)
+                record.thrusting = thrusting == 1
+                record.health = health
+                record.vx = vx
+                record.vy = vy
+                record.input_sequence = input_sequence
+                record.input_step = input_step
+                record.name = str(payload[offset:offset + name_length], "utf-8")
+                offset += name_length
+            elif tag == BULLET_TAG:
+                _, object_id, x, y, owner_id = bullet_struct.unpack_from(payload, offset)
+                offset += bullet_struct.size
+                record = self.record_for(BULLET, object_id)
+                record.owner_id = owner_id
+                bearing = 0.0
+            elif tag == STEP_TAG:
+                self.host_step = step_struct.unpack_from(payload, offset)[1]
+                offset += step_struct.size
+                continue
+            else:
+                raise ValueError(f"Unknown entity record tag {tag} at offset {offset}.")
+            record.add_sample(arrival_time, x, y, bearing)
+            decoded_ids.add(object_id)
+
+    def decode_text_records(self, lines: List[str], start: int, arrival_time: float, decoded_ids: Set[int]) -> None:
+        """
+        updates the records of the objects described by public_info lines. (Call this with the lock held.)
+        :param lines: the lines of the message
+        :param start: the index of the first line that holds a record
+        :param arrival_time: when the message arrived
+        :param decoded_ids: the id of each object decoded is added to this set
+        :return: None
+        """
+        for index in range(start, len(lines)):
+            values = lines[index].split("\t")
+            if values[0] == "PLAYER":
+                object_id = int(values[1])
+                record = self.record_for(PLAYER, object_id)
+                record.thrusting = values[5] == "1"
+                record.health = int(values[6])
+                record.name = values[7]
+                if len(values) > 8:  # (older hosts don't send these.)
+                    record.vx = float(values[8])
+                    record.vy = float(values[9])
+                    record.input_sequence = int(values[10])
+                    record.input_step = int(values[11])
+                record.add_sample(arrival_time, float(values[2]), float(values[3]), float(values[4]))
+            elif values[0] == "BULLET":
+                object_id = int(values[1])
+                record = self.record_for(BULLET, object_id)
+                record.owner_id = int(values[4])
+                record.add_sample(arrival_time, float(values[2]), float(values[3]), 0.0)
+            else:
+                if values[0] == "STEP":
+                    self.host_step = int(values[1])
+                continue
+            decoded_ids.add(object_id)
@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+"""
+The host's registry of everything in the world, keyed by id number: adding or removing an object is a dictionary
+operation, however many there are, and each kind of object (PLAYER, BULLET...) can be gone through on its own.
+It also hands out the id numbers. When an object leaves the world, its id goes into a queue to be reused - but only
+after id_reuse_ticks, by when no user can still have a snapshot (or a delta based on one) that mentions the old object.
+And the object itself is kept in a pool, so the next object of that kind can be made by resetting it, rather than by
+allocating a new one - a long firefight doesn't leave thousands of dead bullets behind for the garbage collector.
+"""
+
+id_reuse_ticks = 300  # an id is only reused this many ticks after its object left. (More than SnapshotTracker's
+                      # history_length, so no delta can be based on a snapshot that had the old object in it.)
+max_pooled = 1024  # keep up to this many spare objects of each kind for reuse.
+
+
+class WorldRegistry:
+    """
+    Every method takes the registry's own lock, so objects can be added and removed from any thread; what the
+    ..._of_kind() and all_entities() methods return is a copy, which is safe to go through while that happens.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entities: Dict[int, object] = {}
+        self.entities_by_kind: Dict[str, Dict[int, object]] = {}
+        self.latest_id = 0
+        self.released_ids: Deque[Tuple[int, int]] = deque()  # (tick it was released, id), oldest first.
+        self.pools: Dict[str, List] = {}
+
+    def allocate_id(self, tick: int) -> int:
+        """
+        finds an id number for a new object - the oldest released one, if it has been long enough since it was
+        released, or else a brand new one.
+        :param tick: the current world tick
+        :return: the id number.
+        """
+        with self.lock:
+            if len(self.released_ids) > 0 and tick - self.released_ids[0][0] >= id_reuse_ticks:
+                return self.released_ids.popleft()[1]
+            self.latest_id += 1
+            return self.latest_id
+
+    def add(self, kind: str, object_id: int, item) -> None:
+        """
+        puts an object into the world.
+        :param kind: PLAYER, BULLET, etc.
+        :param object_id: the object's id number (from allocate_id)
+        :param item: the object
+        :return: None
+        """
+        with self.lock:
+            self.entities[object_id] = item
+            if kind not in self.entities_by_kind:
+                self.entities_by_kind[kind] = {}
+            self.entities_by_kind[kind][object_id] = item
+
+    def remove(self, kind: str, object_id: int) -> None:
+        """
+        takes an object out of the world. (Its id and the object itself aren't reused until release() is called, as
+        the object is usually still needed to tell the users that it has gone.)
+        :param kind: PLAYER, BULLET, etc.
+        :param object_id: the object's id number
+        :return: None
+        """
+        with self.lock:
+            self.entities.pop(object_id, None)
+            self.entities_by_kind[kind].pop(object_id, None)
+
+    def release(self, kind: str, object_id: int, item, tick: int) -> None:
+        """
+        an object that has been removed is no longer needed at all, so its id can be reused (after id_reuse_ticks), and
+        the object itself can be reset for a new one of the same kind.
+        :param kind: PLAYER, BULLET, etc.
+        :param object_id: the object's id number
+        :param item: the object
+        :param tick: the current world tick
+        :return: None
+        """
+        with self.lock:
+            self.released_ids.append((tick, object_id))
+            if kind not in self.pools:
+                self.pools[kind] = []
+            if len(self.pools[kind]) < max_pooled:
+                self.pools[kind].append(item)
+
+    def reuse(self, kind: str) -> Optional[object]:
+        """
+        :param kind: PLAYER, BULLET, etc.
+        :return: a released object of that kind, for the caller to reset - or None if there aren't any.
+        """
+        with self.lock:
+            pool = self.pools.get(kind)
+            return pool.pop() if pool else None
+
+    def entities_of_kind(self, kind: str) -> List:
+        """
+        :return: a list of the objects of one kind, in the order they were added.
+        """
+        with self.lock:
+            return list(self.entities_by_kind.get(kind, {}).values())
+
+    def count_of_kind(self, kind: str) -> int:
+        with self.lock:
+            return len(self.entities_by_kind.get(kind, {}))
+
+    def all_entities(self) -> List:
+        """
+        :return: a list of every object in the world, in the order they were added.
+        """
+        with self.lock:
+            return list(self.entities.values())
@@ -0,0 +1,79 @@
+import socket
+import unittest
+
+from DatagramChannelFile import DatagramChannel, read_datagram_header
+from SocketMessageIOFile import SocketMessageIO, MessageType, Protocol
+
+
+class TestAccept(unittest.TestCase):
+    def test_world_messages_in_order(self):
+        channel = DatagramChannel(None, 1)
+        self.assertTrue(all(channel.accept(sequence, MessageType.WORLD_DELTA) for sequence in range(1, 6)))
+        self.assertEqual((5, 0, 0), (channel.received, channel.lost, channel.stale))
+
+    def test_gap_counts_as_lost(self):
+        channel = DatagramChannel(None, 1)
+        channel.accept(1, MessageType.WORLD_DELTA)
+        self.assertTrue(channel.accept(5, MessageType.WORLD_DELTA))
+        self.assertEqual(3, channel.lost)
+
+    def test_late_world_message_is_stale(self):
+        channel = DatagramChannel(None, 1)
+        channel.accept(1, MessageType.WORLD_DELTA)
+        channel.accept(3, MessageType.WORLD_DELTA)
+        self.assertFalse(channel.accept(2, MessageType.WORLD_DELTA))
+        self.assertEqual((1, 0), (channel.stale, channel.lost))  # (it wasn't lost after all.)
+        self.assertFalse(channel.accept(3, MessageType.WORLD_DELTA))  # (a duplicate.)
+        self.assertEqual(2, channel.stale)
+
+    def test_late_input_is_still_delivered(self):
+        channel = DatagramChannel(None, 1)
+        channel.accept(2, MessageType.KEY_STATUS)
+        self.assertTrue(channel.accept(1, MessageType.KEY_STATUS))
+        self.assertEqual(0, channel.stale)
+
+    def test_each_type_is_numbered_separately(self):
+        channel = DatagramChannel(None, 1)
+        channel.accept(1, MessageType.WORLD_DELTA)
+        channel.accept(2, MessageType.WORLD_DELTA)
+        self.assertTrue(channel.accept(1, MessageType.ACK))
+        self.assertTrue(channel.accept(3, MessageType.WORLD_DELTA))
+        self.assertEqual((0, 0), (channel.lost, channel.stale))
+
+
+class TestSendFrame(unittest.TestCase):
+    def setUp(self):
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(("127.0.0.1", 0))
+        self.receiver.settimeout(1)
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.channel = DatagramChannel(self.sender, 1234, self.receiver.getsockname())
+        self.manager = SocketMessageIO(Protocol.BINARY)
+
+    def tearDown(self):
+        self.receiver.close()
+        self.sender.close()
+
+    def receive(self):
+        data = self.receiver.recv(65536)
+        token, sequence = read_datagram_header(data)
+        return token, sequence, self.manager.parse_message(data[12:])
+
+    def test_datagram_holds_one_message_without_its_length(self):
+        frame = self.manager.build_frame_buffers([b"abc", b"def"], MessageType.WORLD_DELTA)
+        self.assertTrue(self.channel.send_frame(frame, MessageType.WORLD_DELTA))
+        self.assertEqual((1234, 1, (MessageType.WORLD_DELTA, b"abcdef")), self.receive())
+
+    def test_sequences_per_message_type(self):
+        for message_type in (MessageType.WORLD_DELTA, MessageType.SUBMISSION, MessageType.WORLD_DELTA):
+            self.channel.send_frame(self.manager.build_frame_buffers("x", message_type), message_type)
+        self.assertEqual([1, 1, 2], [self.receive()[1] for _ in range(3)])
+
+    def test_too_big_goes_over_tcp(self):
+        frame = self.manager.build_frame_buffers(b"x" * 70000, MessageType.WORLD_DELTA)
+        self.assertFalse(self.channel.send_frame(frame, MessageType.WORLD_DELTA))
+        self.assertEqual((1, 0), (self.channel.too_big, self.channel.sent))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import EntityRecordFile
+from EntityRecordFile import EntityRecord, PLAYER
+
+
+def record_with_samples(*samples) -> EntityRecord:
+    record = EntityRecord()
+    record.reset(PLAYER, 1)
+    for sample in samples:
+        record.add_sample(*sample)
+    return record
+
+
+class TestInterpolation(unittest.TestCase):
+    def test_between_two_samples(self):
+        record = record_with_samples((1.0, 100.0, 200.0, 0.0), (2.0, 110.0, 220.0, 1.0))
+        self.assertTrue(record.position_at(1.25, 0.1))
+        self.assertAlmostEqual(102.5, record.draw_x)
+        self.assertAlmostEqual(205.0, record.draw_y)
+        self.assertAlmostEqual(0.25, record.draw_bearing)
+
+    def test_not_drawn_before_it_arrives(self):
+        record = record_with_samples((1.0, 100.0, 200.0, 0.0))
+        self.assertFalse(record.position_at(0.5, 0.1))
+        self.assertFalse(EntityRecord().position_at(1.0, 0.1))
+
+    def test_wraps_the_short_way_round(self):
+        record = record_with_samples((1.0, 795.0, 5.0, 0.0), (2.0, 5.0, 795.0, 0.0))
+        record.position_at(1.5, 0.1)
+        self.assertAlmostEqual(0.0, record.draw_x % 800)
+        self.assertAlmostEqual(0.0, record.draw_y % 800)
+        record.position_at(1.25, 0.1)
+        self.assertAlmostEqual(797.5, record.draw_x)
+        self.assertAlmostEqual(2.5, record.draw_y)
+
+    def test_extrapolation_is_limited(self):
+        record = record_with_samples((1.0, 100.0, 100.0, 0.0), (2.0, 110.0, 100.0, 0.0))
+        record.position_at(2.05, 0.1)
+        self.assertAlmostEqual(110.5, record.draw_x)
+        record.position_at(5.0, 0.1)
+        self.assertAlmostEqual(111.0, record.draw_x)
+
+    def test_one_sample_stays_put(self):
+        record = record_with_samples((1.0, 100.0, 100.0, 0.0))
+        self.assertTrue(record.position_at(3.0, 0.1))
+        self.assertEqual((100.0, 100.0), (record.draw_x, record.draw_y))
+
+    def test_ring_keeps_the_newest_samples(self):
+        count = EntityRecordFile.samples_per_record
+        record = record_with_samples(*[(float(t), float(t), 0.0, 0.0) for t in range(count + 5)])
+        self.assertEqual(count, record.sample_count)
+        self.assertEqual((count + 4.0, 0.0, 0.0), record.latest_position())
+        # older than anything left in the ring: shown at the oldest sample we still have.
+        self.assertTrue(record.position_at(0.5, 0.1))
+        self.assertEqual(5.0, record.draw_x)
+
+    def test_reset_forgets_the_samples(self):
+        record = record_with_samples((1.0, 100.0, 100.0, 0.0))
+        record.reset(PLAYER, 2)
+        self.assertIsNone(record.latest_position())
+
+
+if __name__ == '__main__':
+    unittest.main()
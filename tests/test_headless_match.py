@@ -0,0 +1,35 @@
+import unittest
+
+import PlayerShipFile
+import SocketHostFile as host
+from HeadlessMatchFile import HeadlessMatch, play, random_inputs
+
+
+class TestHeadlessMatch(unittest.TestCase):
+    def test_same_seed_same_result(self):
+        for use_entity_store in [False, True]:
+            with self.subTest(use_entity_store=use_entity_store):
+                digests = []
+                for run in range(2):
+                    with HeadlessMatch(7, use_entity_store) as match:
+                        ship_ids = [match.add_ship(f"bot{index}") for index in range(4)]
+                        match.run(100, random_inputs(3, ship_ids, 100))
+                        digests.append(match.state_digest())
+                self.assertEqual(digests[0], digests[1])
+
+    def test_different_seed_different_result(self):
+        self.assertNotEqual(play(1, 4, 50)[0], play(2, 4, 50)[0])
+
+    def test_clock_and_random_are_put_back(self):
+        clock, rng, use_entity_store = PlayerShipFile.clock, PlayerShipFile.rng, host.use_entity_store
+        with self.assertRaises(RuntimeError):
+            with HeadlessMatch(7, not use_entity_store):
+                self.assertIsNot(clock, PlayerShipFile.clock)
+                raise RuntimeError("the match went wrong")
+        self.assertIs(clock, PlayerShipFile.clock)
+        self.assertIs(rng, PlayerShipFile.rng)
+        self.assertEqual(use_entity_store, host.use_entity_store)
+
+
+if __name__ == '__main__':
+    unittest.main()
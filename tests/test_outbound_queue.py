@@ -0,0 +1,95 @@
+import threading
+import unittest
+from unittest import mock
+
+import OutboundQueueFile
+from OutboundQueueFile import OutboundQueue, OverflowPolicy
+from SocketMessageIOFile import MessageType, Protocol
+
+
+def frame(size: int, fill: bytes = b"x") -> list:
+    return [fill * size]
+
+
+class TestOutboundQueue(unittest.TestCase):
+    def test_frames_come_out_in_order(self):
+        queue = OutboundQueue()
+        for fill in (b"a", b"b", b"c"):
+            queue.put(frame(1, fill), MessageType.SUBMISSION)
+        self.assertEqual([[b"a"], [b"b"], [b"c"]], queue.take_frames(block=False))
+        self.assertEqual([], queue.take_frames(block=False))
+
+    def test_latest_world_wins_and_goes_last(self):
+        queue = OutboundQueue()
+        queue.put(frame(1, b"1"), MessageType.WORLD_UPDATE)
+        queue.put(frame(1, b"c"), MessageType.SUBMISSION)
+        queue.put(frame(1, b"2"), MessageType.WORLD_DELTA)
+        self.assertEqual([[b"c"], [b"2"]], queue.take_frames(block=False))
+
+    def test_world_frames_dont_count_towards_the_backlog_limit(self):
+        queue = OutboundQueue()
+        for _ in range(10):
+            self.assertTrue(queue.put(frame(OutboundQueueFile.max_backlog_bytes), MessageType.WORLD_UPDATE))
+        self.assertEqual(0, queue.dropped_frames)
+
+    def test_disconnects_when_the_backlog_is_full(self):
+        queue = OutboundQueue()
+        with mock.patch.object(OutboundQueueFile, "max_backlog_bytes", 100):
+            self.assertTrue(queue.put(frame(60), MessageType.SUBMISSION))
+            self.assertFalse(queue.put(frame(60), MessageType.SUBMISSION))
+            self.assertEqual(1, queue.dropped_frames)
+            queue.take_frames(block=False)
+            self.assertTrue(queue.put(frame(60), MessageType.SUBMISSION))
+
+    def test_drop_policy_keeps_the_user(self):
+        queue = OutboundQueue()
+        with mock.patch.object(OutboundQueueFile, "max_backlog_bytes", 100), \
+                mock.patch.object(OutboundQueueFile, "overflow_policy", OverflowPolicy.DROP):
+            queue.put(frame(60), MessageType.SUBMISSION)
+            self.assertTrue(queue.put(frame(60), MessageType.SUBMISSION))
+        self.assertEqual(1, queue.dropped_frames)
+        self.assertEqual(1, len(queue.take_frames(block=False)))
+
+    def test_frames_for_the_old_protocol_are_thrown_away(self):
+        queue = OutboundQueue()
+        queue.switch_protocol(frame(1, b"r"), Protocol.BINARY)
+        queue.put(frame(1, b"t"), MessageType.SUBMISSION, Protocol.TEXT)
+        queue.put(frame(1, b"b"), MessageType.SUBMISSION, Protocol.BINARY)
+        self.assertEqual([[b"r"], [b"b"]], queue.take_frames(block=False))
+
+    def test_pending_bytes(self):
+        queue = OutboundQueue()
+        queue.put(frame(10), MessageType.SUBMISSION)
+        queue.put(frame(30), MessageType.WORLD_UPDATE)
+        self.assertEqual(40, queue.pending_bytes())
+        queue.take_frames(block=False)
+        self.assertEqual(40, queue.pending_bytes())  # (the writer hasn't finished sending them yet.)
+        queue.finished_sending()
+        self.assertEqual(0, queue.pending_bytes())
+
+    def test_writer_waits_while_held(self):
+        queue = OutboundQueue()
+        taken = []
+        queue.hold()
+        writer = threading.Thread(target=lambda: taken.append(queue.take_frames()))
+        writer.start()
+        queue.put(frame(1, b"a"), MessageType.SUBMISSION)
+        queue.put(frame(1, b"w"), MessageType.WORLD_UPDATE)
+        writer.join(0.1)
+        self.assertEqual([], taken)
+        queue.flush()
+        writer.join(1)
+        self.assertEqual([[[b"a"], [b"w"]]], taken)
+
+    def test_close_wakes_the_writer(self):
+        queue = OutboundQueue()
+        taken = []
+        writer = threading.Thread(target=lambda: taken.append(queue.take_frames()))
+        writer.start()
+        queue.close()
+        writer.join(1)
+        self.assertEqual([[]], taken)
+
+
+if __name__ == '__main__':
+    unittest.main()
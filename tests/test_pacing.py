@@ -0,0 +1,27 @@
+import unittest
+
+import SocketHostFile as host
+from BenchmarkFile import build_world, BenchmarkConnection
+
+
+class TestPacing(unittest.TestCase):
+    def test_unsent_bytes_of_a_stand_in_connection(self):
+        self.assertEqual(0, host.unsent_bytes(BenchmarkConnection()))
+
+    def test_pace_users_with_stand_in_connections(self):
+        build_world(4, 10)
+        host.pace_users()
+        self.assertTrue(all(user["world_due"] for user in host.user_dictionary.values()))
+
+    def test_send_step_with_stand_in_connections(self):
+        build_world(4, 10)
+        for user in host.user_dictionary.values():
+            user["link_monitor"].pinging = True
+        host.send_step()
+        for user in host.user_dictionary.values():
+            self.assertEqual(1, user["link_monitor"].pings_sent)
+            self.assertGreater(user["outbox"].pending_bytes(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+import SnapshotTrackerFile
+from SnapshotTrackerFile import SnapshotTracker
+
+
+class TestSnapshotTracker(unittest.TestCase):
+    def test_first_snapshot_is_a_keyframe(self):
+        tracker = SnapshotTracker()
+        self.assertEqual((0, [b"a", b"b"], []), tracker.build_delta(1, {1: b"a", 2: b"b"}))
+
+    def test_keyframes_until_acknowledged(self):
+        tracker = SnapshotTracker()
+        tracker.build_delta(1, {1: b"a"})
+        self.assertEqual(0, tracker.build_delta(2, {1: b"a"})[0])
+
+    def test_delta_against_the_acknowledged_snapshot(self):
+        tracker = SnapshotTracker()
+        tracker.build_delta(1, {1: b"a", 2: b"b", 3: b"c"})
+        tracker.acknowledge(1)
+        base_tick, changed, removed = tracker.build_delta(2, {1: b"a", 2: b"B", 4: b"d"})
+        self.assertEqual(1, base_tick)
+        self.assertEqual([b"B", b"d"], changed)
+        self.assertEqual([3], removed)
+
+    def test_delta_is_based_on_the_last_ack_not_the_last_send(self):
+        tracker = SnapshotTracker()
+        tracker.build_delta(1, {1: b"a"})
+        tracker.acknowledge(1)
+        tracker.build_delta(2, {1: b"b"})  # never acknowledged - e.g., it was lost.
+        base_tick, changed, removed = tracker.build_delta(3, {1: b"b"})
+        self.assertEqual((1, [b"b"], []), (base_tick, changed, removed))
+
+    def test_older_ack_is_ignored(self):
+        tracker = SnapshotTracker()
+        for tick in range(1, 4):
+            tracker.build_delta(tick, {1: bytes([tick])})
+        tracker.acknowledge(3)
+        tracker.acknowledge(2)
+        self.assertEqual(3, tracker.build_delta(4, {1: b"x"})[0])
+
+    def test_keyframe_request(self):
+        tracker = SnapshotTracker()
+        tracker.build_delta(1, {1: b"a"})
+        tracker.acknowledge(1)
+        tracker.request_keyframe()
+        self.assertEqual((0, [b"a"], []), tracker.build_delta(2, {1: b"a"}))
+        tracker.acknowledge(2)
+        self.assertEqual((2, [], []), tracker.build_delta(3, {1: b"a"}))
+
+    def test_keyframe_when_the_ack_is_too_old(self):
+        tracker = SnapshotTracker()
+        tracker.build_delta(1, {1: b"a"})
+        tracker.acknowledge(1)
+        for tick in range(2, SnapshotTrackerFile.history_length + 3):
+            tracker.build_delta(tick, {1: b"a"})
+        self.assertEqual(0, tracker.build_delta(SnapshotTrackerFile.history_length + 3, {1: b"a"})[0])
+
+    def test_keyframe_every_keyframe_interval(self):
+        tracker = SnapshotTracker()
+        base_ticks = []
+        for tick in range(1, SnapshotTrackerFile.keyframe_interval + 3):
+            base_ticks.append(tracker.build_delta(tick, {1: b"a"})[0])
+            tracker.acknowledge(tick)
+        self.assertEqual(0, base_ticks[0])
+        self.assertNotIn(0, base_ticks[1:SnapshotTrackerFile.keyframe_interval + 1])
+        self.assertEqual(0, base_ticks[SnapshotTrackerFile.keyframe_interval + 1])
+
+    def test_history_before_the_ack_is_forgotten(self):
+        tracker = SnapshotTracker()
+        for tick in range(1, 6):
+            tracker.build_delta(tick, {1: b"a"})
+        tracker.acknowledge(4)
+        tracker.build_delta(6, {1: b"a"})
+        self.assertEqual([4, 5, 6], sorted(tracker.history))
+
+
+if __name__ == '__main__':
+    unittest.main()
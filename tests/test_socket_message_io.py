@@ -0,0 +1,75 @@
+import socket
+import threading
+import unittest
+from unittest import mock
+
+import SocketMessageIOFile
+from SocketMessageIOFile import SocketMessageIO, MessageType, Protocol
+
+
+class TestReceiving(unittest.TestCase):
+    def setUp(self):
+        self.sending_end, self.receiving_end = socket.socketpair()
+        self.receiving_end.settimeout(1)
+
+    def tearDown(self):
+        self.sending_end.close()
+        self.receiving_end.close()
+
+    def test_several_messages_in_one_read(self):
+        manager = SocketMessageIO()
+        self.sending_end.sendall(b"".join(manager.build_frame(f"message {number}") for number in range(5)))
+        for number in range(5):
+            self.assertEqual((MessageType.SUBMISSION, f"message {number}"),
+                             manager.receive_message_from_socket(self.receiving_end))
+
+    def test_message_split_across_reads(self):
+        manager = SocketMessageIO(Protocol.BINARY)
+        frame = manager.build_frame(b"\x01" * 1000, MessageType.WORLD_UPDATE)
+
+        def send_slowly():
+            for start in range(0, len(frame), 7):
+                self.sending_end.sendall(frame[start:start + 7])
+
+        sender = threading.Thread(target=send_slowly)
+        sender.start()
+        self.assertEqual((MessageType.WORLD_UPDATE, b"\x01" * 1000),
+                         manager.receive_message_from_socket(self.receiving_end))
+        sender.join()
+
+    def test_message_bigger_than_the_buffer(self):
+        with mock.patch.object(SocketMessageIOFile, "receive_buffer_size", 64):
+            manager = SocketMessageIO()
+            message = "x" * 10000
+            sender = threading.Thread(target=lambda: self.sending_end.sendall(
+                manager.build_frame("short") + manager.build_frame(message) + manager.build_frame("after")))
+            sender.start()
+            self.assertEqual("short", manager.receive_message_from_socket(self.receiving_end)[1])
+            self.assertEqual(message, manager.receive_message_from_socket(self.receiving_end)[1])
+            self.assertEqual("after", manager.receive_message_from_socket(self.receiving_end)[1])
+            sender.join()
+
+    def test_received_bytes_dont_change_when_the_buffer_is_reused(self):
+        manager = SocketMessageIO(Protocol.BINARY)
+        self.sending_end.sendall(manager.build_frame(b"first", MessageType.WORLD_UPDATE) +
+                                 manager.build_frame(b"other", MessageType.WORLD_UPDATE))
+        first = manager.receive_message_from_socket(self.receiving_end)[1]
+        manager.receive_message_from_socket(self.receiving_end)
+        self.assertEqual(b"first", first)
+
+    def test_disconnect(self):
+        self.sending_end.close()
+        with self.assertRaises(ConnectionAbortedError):
+            SocketMessageIO().receive_message_from_socket(self.receiving_end)
+
+    def test_send_buffers_to_socket(self):
+        manager = SocketMessageIO()
+        buffers = manager.build_frame_buffers([b"a", b"b", b"c"]) + manager.build_frame_buffers("second")
+        with mock.patch.object(SocketMessageIOFile, "max_buffers_per_send", 2):
+            manager.send_buffers_to_socket(buffers, self.sending_end)
+        self.assertEqual("abc", manager.receive_message_from_socket(self.receiving_end)[1])
+        self.assertEqual("second", manager.receive_message_from_socket(self.receiving_end)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import random
+import unittest
+
+from SpatialGridFile import SpatialGrid, np
+
+
+class TestSpatialGrid(unittest.TestCase):
+    def build(self, xs, ys, use_arrays: bool = False) -> SpatialGrid:
+        grid = SpatialGrid(cell_size=16, world_size=800)
+        if use_arrays:
+            grid.rebuild(np.array(xs, dtype=float), np.array(ys, dtype=float))
+        else:
+            grid.rebuild(xs, ys)
+        return grid
+
+    def check_both_ways(self, test) -> None:
+        with self.subTest(arrays=False):
+            test(False)
+        if np is not None:
+            with self.subTest(arrays=True):
+                test(True)
+
+    def test_finds_nearby_objects(self):
+        def test(use_arrays):
+            grid = self.build([100.0, 105.0, 400.0], [100.0, 98.0, 400.0], use_arrays)
+            self.assertEqual([0, 1], sorted(int(i) for i in grid.candidates_near(102, 100, 8)))
+        self.check_both_ways(test)
+
+    def test_wraps_around_the_edges(self):
+        def test(use_arrays):
+            grid = self.build([798.0, 3.0, 400.0], [2.0, 797.0, 400.0], use_arrays)
+            # (0, 0) is next to every corner of the world.
+            self.assertEqual([0, 1], sorted(int(i) for i in grid.candidates_near(0, 0, 8)))
+            self.assertEqual([0, 1], sorted(int(i) for i in grid.candidates_near(799, 799, 8)))
+        self.check_both_ways(test)
+
+    def test_never_misses_an_object_in_reach(self):
+        def test(use_arrays):
+            rng = random.Random(3)
+            xs = [rng.uniform(0, 800) for _ in range(500)]
+            ys = [rng.uniform(0, 800) for _ in range(500)]
+            grid = self.build(xs, ys, use_arrays)
+            for _ in range(100):
+                x, y = rng.uniform(0, 800), rng.uniform(0, 800)
+                in_reach = {index for index in range(len(xs))
+                            if grid.toroidal_offset(x, xs[index]) < 20 and grid.toroidal_offset(y, ys[index]) < 20}
+                self.assertTrue(in_reach.issubset(int(i) for i in grid.candidates_near(x, y, 20)))
+        self.check_both_ways(test)
+
+    def test_no_duplicates_when_the_reach_covers_the_world(self):
+        grid = SpatialGrid(cell_size=16, world_size=32)
+        grid.rebuild([1.0, 20.0], [1.0, 20.0])
+        self.assertEqual([0, 1], sorted(grid.candidates_near(5, 5, 100)))
+
+    def test_toroidal_offset(self):
+        grid = SpatialGrid(world_size=800)
+        self.assertEqual(10, grid.toroidal_offset(795, 5))
+        self.assertEqual(300, grid.toroidal_offset(100, 400))
+
+    def test_rebuild_replaces_the_old_contents(self):
+        grid = self.build([100.0], [100.0])
+        grid.rebuild([500.0], [500.0])
+        self.assertEqual([], grid.candidates_near(100, 100, 8))
+        self.assertEqual([0], grid.candidates_near(500, 500, 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
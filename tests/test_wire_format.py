@@ -0,0 +1,103 @@
+import unittest
+
+from SocketMessageIOFile import SocketMessageIO, MessageType, Protocol
+from WireFormatFile import pack_player, pack_bullet, pack_step, pack_world_delta, unpack_entity_records, \
+    unpack_world_delta, PLAYER_TAG
+
+
+def player_values(name: str = "Steve") -> dict:
+    return {"my_id": 7, "x": 12.5, "y": 790.25, "bearing": 1.5, "thrusting": 1, "health": 85, "name": name,
+            "vx": -3.0, "vy": 0.5, "input_sequence": 4000000000, "input_step": 3}
+
+
+class TestEntityRecords(unittest.TestCase):
+    def test_player_round_trip(self):
+        values = player_values()
+        [record] = unpack_entity_records(pack_player(**values))
+        self.assertEqual({"type": "PLAYER", "id": 7, "x": 12.5, "y": 790.25, "bearing": 1.5, "thrusting": True,
+                          "health": 85, "name": "Steve", "vx": -3.0, "vy": 0.5, "input_sequence": 4000000000,
+                          "input_step": 3}, record)
+
+    def test_bullet_round_trip(self):
+        [record] = unpack_entity_records(pack_bullet(9, 100.0, 200.0, 7))
+        self.assertEqual({"type": "BULLET", "id": 9, "x": 100.0, "y": 200.0, "owner_id": 7}, record)
+
+    def test_step_round_trip(self):
+        self.assertEqual([{"type": "STEP", "step": 123456}], unpack_entity_records(pack_step(123456)))
+
+    def test_run_of_records(self):
+        payload = pack_step(5) + pack_bullet(1, 0.0, 0.0, 2) + pack_player(**player_values("Milo")) + \
+            pack_bullet(3, 5.0, 6.0, 7)
+        records = unpack_entity_records(payload)
+        self.assertEqual(["STEP", "BULLET", "PLAYER", "BULLET"], [record["type"] for record in records])
+        self.assertEqual([1, 7, 3], [record["id"] for record in records[1:]])
+        self.assertEqual("Milo", records[2]["name"])
+
+    def test_long_name_is_cut_on_a_character_boundary(self):
+        for name in ["é" * 200, "a" + "€" * 100, "x" * 300]:
+            packed = pack_player(**player_values(name))
+            [record] = unpack_entity_records(packed)
+            self.assertLessEqual(len(record["name"].encode()), 255)
+            self.assertTrue(name.startswith(record["name"]))
+            self.assertGreater(len(record["name"].encode()), 250)
+
+    def test_health_out_of_range_is_clamped(self):
+        for health, expected in [(-40000, -32768), (40000, 32767), (-5, -5)]:
+            values = player_values()
+            values["health"] = health
+            [record] = unpack_entity_records(pack_player(**values))
+            self.assertEqual(expected, record["health"])
+
+    def test_unknown_tag(self):
+        with self.assertRaises(ValueError):
+            unpack_entity_records(bytes([PLAYER_TAG + 100, 0, 0, 0, 1]))
+
+    def test_world_delta_round_trip(self):
+        changed = [pack_player(**player_values()), pack_bullet(9, 1.0, 2.0, 7)]
+        tick, base_tick, removed_ids, records = unpack_world_delta(pack_world_delta(120, 117, changed, [3, 4, 5]))
+        self.assertEqual((120, 117, [3, 4, 5]), (tick, base_tick, removed_ids))
+        self.assertEqual([7, 9], [record["id"] for record in records])
+
+    def test_keyframe_with_nothing_removed(self):
+        tick, base_tick, removed_ids, records = unpack_world_delta(pack_world_delta(1, 0, [], []))
+        self.assertEqual((1, 0, [], []), (tick, base_tick, removed_ids, records))
+
+
+class TestFraming(unittest.TestCase):
+    def strip_length(self, frame: bytes) -> bytes:
+        self.assertEqual(len(frame) - 4, int.from_bytes(frame[:4], "big"))
+        return frame[4:]
+
+    def test_text_round_trip(self):
+        manager = SocketMessageIO()
+        frame = manager.build_frame("hello\tthere", MessageType.USER_LIST)
+        self.assertEqual((MessageType.USER_LIST, "hello\tthere"), manager.parse_message(self.strip_length(frame)))
+
+    def test_binary_round_trip(self):
+        manager = SocketMessageIO(Protocol.BINARY)
+        frame = manager.build_frame("a chat message", MessageType.SUBMISSION)
+        self.assertEqual((MessageType.SUBMISSION, "a chat message"), manager.parse_message(self.strip_length(frame)))
+
+    def test_binary_payload_stays_bytes(self):
+        manager = SocketMessageIO(Protocol.BINARY)
+        payload = pack_bullet(9, 1.0, 2.0, 7)
+        frame = manager.build_frame(payload, MessageType.WORLD_UPDATE)
+        self.assertEqual((MessageType.WORLD_UPDATE, payload), manager.parse_message(self.strip_length(frame)))
+
+    def test_buffers_match_the_joined_frame(self):
+        manager = SocketMessageIO()
+        for protocol in Protocol:
+            pieces = [b"first\n", b"second\n", b"third"]
+            buffers = manager.build_frame_buffers(pieces, MessageType.WORLD_UPDATE, protocol)
+            self.assertEqual(manager.build_frame(b"".join(pieces), MessageType.WORLD_UPDATE, protocol),
+                             b"".join(buffers))
+
+    def test_protocol_argument_overrides_the_manager(self):
+        text_manager = SocketMessageIO()
+        frame = text_manager.build_frame("hi", MessageType.PING, Protocol.BINARY)
+        self.assertEqual((MessageType.PING, "hi"),
+                         SocketMessageIO(Protocol.BINARY).parse_message(self.strip_length(frame)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from BulletFile import bullet_public_info
+from WireFormatFile import pack_bullet, pack_world_delta
+from WorldDecoderFile import WorldDecoder
+
+
+def delta(tick: int, base_tick: int, bullets: dict, removed_ids=()) -> bytes:
+    return pack_world_delta(tick, base_tick, [pack_bullet(bullet_id, x, 0.0, 1) for bullet_id, x in bullets.items()],
+                            list(removed_ids))
+
+
+class TestWorldDecoder(unittest.TestCase):
+    def positions(self, decoder: WorldDecoder) -> dict:
+        return {record.id: record.latest_position()[0] for record in decoder.current_records()
+                if record.removed_time is None}
+
+    def test_keyframe_then_delta(self):
+        decoder = WorldDecoder()
+        self.assertEqual(1, decoder.apply_delta(delta(1, 0, {1: 10.0, 2: 20.0}), 1.0))
+        self.assertEqual(2, decoder.apply_delta(delta(2, 1, {2: 25.0, 3: 30.0}, [1]), 2.0))
+        self.assertEqual({2: 25.0, 3: 30.0}, self.positions(decoder))
+
+    def test_unchanged_objects_stay_put(self):
+        decoder = WorldDecoder()
+        decoder.apply_delta(delta(1, 0, {1: 10.0}), 1.0)
+        decoder.apply_delta(delta(2, 1, {}), 2.0)
+        self.assertEqual({1: 10.0}, self.positions(decoder))
+
+    def test_unknown_base_asks_for_a_keyframe(self):
+        decoder = WorldDecoder()
+        decoder.apply_delta(delta(1, 0, {1: 10.0}), 1.0)
+        self.assertIsNone(decoder.apply_delta(delta(5, 4, {1: 50.0}), 2.0))
+        self.assertEqual({1: 10.0}, self.positions(decoder))
+
+    def test_older_snapshot_is_ignored(self):
+        decoder = WorldDecoder()
+        decoder.apply_delta(delta(1, 0, {1: 10.0}), 1.0)
+        decoder.apply_delta(delta(3, 1, {1: 30.0}), 2.0)
+        # tick 2 arrives late (e.g., it was too big for a datagram, and came over TCP).
+        self.assertEqual(3, decoder.apply_delta(delta(2, 1, {1: 20.0}), 3.0))
+        self.assertEqual({1: 30.0}, self.positions(decoder))
+
+    def test_unchanged_objects_go_back_to_the_base(self):
+        decoder = WorldDecoder()
+        decoder.apply_delta(delta(1, 0, {1: 10.0, 2: 20.0}), 1.0)
+        decoder.apply_delta(delta(2, 1, {1: 15.0}), 2.0)
+        # the host hasn't heard that we have tick 2, so tick 3 is based on tick 1 again: object 1 is back where it
+        # was then.
+        self.assertEqual(3, decoder.apply_delta(delta(3, 1, {2: 30.0}), 3.0))
+        self.assertEqual({1: 10.0, 2: 30.0}, self.positions(decoder))
+
+    def test_object_removed_by_a_newer_snapshot_comes_back(self):
+        decoder = WorldDecoder()
+        decoder.apply_delta(delta(1, 0, {1: 10.0, 2: 20.0}), 1.0)
+        decoder.apply_delta(delta(2, 1, {}, [2]), 2.0)
+        self.assertEqual({1: 10.0}, self.positions(decoder))
+        decoder.apply_delta(delta(3, 1, {1: 12.0}), 3.0)
+        self.assertEqual({1: 12.0, 2: 20.0}, self.positions(decoder))
+        # and a delta based on that one still knows where everything was.
+        decoder.apply_delta(delta(4, 3, {}), 4.0)
+        self.assertEqual({1: 12.0, 2: 20.0}, self.positions(decoder))
+
+    def test_text_delta(self):
+        decoder = WorldDecoder()
+        decoder.apply_delta(f"1\t0\n{bullet_public_info(1, 10.0, 20.0, 5)}", 1.0)
+        decoder.apply_delta(f"2\t1\nREMOVE\t1\n{bullet_public_info(2, 30.0, 40.0, 5)}", 2.0)
+        self.assertEqual({2: 30.0}, self.positions(decoder))
+
+
+if __name__ == '__main__':
+    unittest.main()
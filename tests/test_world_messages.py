@@ -0,0 +1,50 @@
+import unittest
+
+import SocketHostFile as host
+from BenchmarkFile import build_world
+from SnapshotTrackerFile import SnapshotTracker
+from SocketMessageIOFile import SocketMessageIO, Protocol
+from WireFormatFile import unpack_world_delta
+from WorldDecoderFile import WorldDecoder
+
+
+class TestWorldMessages(unittest.TestCase):
+    def setUp(self):
+        build_world(2, 0)
+        self.user_id, self.user = next(iter(host.user_dictionary.items()))
+        self.user["protocol"] = self.user["outbox"].protocol = Protocol.BINARY
+        self.user["snapshot_tracker"] = SnapshotTracker()
+        for user in host.user_dictionary.values():
+            ship = user["PlayerShip"]
+            ship.controls, ship.vx, ship.vy = 0, 0, 0
+
+    def take_delta(self):
+        [frame] = self.user["outbox"].take_frames(block=False)
+        payload = SocketMessageIO(Protocol.BINARY).parse_message(b"".join(frame)[4:])[1]
+        return payload, unpack_world_delta(payload)
+
+    def test_idle_ships_are_left_out_of_deltas(self):
+        host.send_step()
+        tick = self.take_delta()[1][0]
+        host.acknowledge_snapshot(self.user_id, tick)
+        for _ in range(3):
+            host.simulation_step(host.simulation_interval)
+        host.send_step()
+        _, (_, base_tick, removed_ids, records) = self.take_delta()
+        self.assertEqual(tick, base_tick)
+        self.assertEqual([{"type": "STEP", "step": 3}], records)
+
+    def test_client_can_tell_how_many_steps_have_run_with_an_input(self):
+        host.update_ship_controls(self.user_id, 0, 7)
+        for _ in range(4):
+            host.simulation_step(host.simulation_interval)
+        host.send_step()
+        decoder = WorldDecoder()
+        decoder.apply_delta(self.take_delta()[0], 1.0)
+        record = decoder.records[self.user_id]
+        self.assertEqual(7, record.input_sequence)
+        self.assertEqual(4, decoder.host_step - record.input_step)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+
+import WorldRegistryFile
+from EntityRecordFile import PLAYER, BULLET
+from SnapshotTrackerFile import history_length
+from WorldRegistryFile import WorldRegistry
+
+
+class TestWorldRegistry(unittest.TestCase):
+    def test_new_ids_count_up(self):
+        registry = WorldRegistry()
+        self.assertEqual([1, 2, 3], [registry.allocate_id(0) for _ in range(3)])
+
+    def test_released_id_waits_before_reuse(self):
+        registry = WorldRegistry()
+        first = registry.allocate_id(0)
+        registry.add(BULLET, first, "bullet")
+        registry.remove(BULLET, first)
+        registry.release(BULLET, first, "bullet", 10)
+        self.assertNotEqual(first, registry.allocate_id(10 + WorldRegistryFile.id_reuse_ticks - 1))
+        self.assertEqual(first, registry.allocate_id(10 + WorldRegistryFile.id_reuse_ticks))
+
+    def test_ids_are_reused_oldest_first(self):
+        registry = WorldRegistry()
+        ids = [registry.allocate_id(0) for _ in range(3)]
+        for tick, object_id in enumerate(reversed(ids)):
+            registry.release(BULLET, object_id, None, tick)
+        later = 10 + WorldRegistryFile.id_reuse_ticks
+        self.assertEqual(list(reversed(ids)), [registry.allocate_id(later) for _ in range(3)])
+
+    def test_reuse_time_outlasts_the_snapshot_history(self):
+        self.assertGreater(WorldRegistryFile.id_reuse_ticks, history_length)
+
+    def test_kinds_are_kept_apart(self):
+        registry = WorldRegistry()
+        registry.add(PLAYER, 1, "ship")
+        registry.add(BULLET, 2, "bullet 2")
+        registry.add(BULLET, 3, "bullet 3")
+        self.assertEqual(["bullet 2", "bullet 3"], registry.entities_of_kind(BULLET))
+        self.assertEqual(1, registry.count_of_kind(PLAYER))
+        registry.remove(BULLET, 2)
+        self.assertEqual(["ship", "bullet 3"], registry.all_entities())
+
+    def test_pool_of_released_objects(self):
+        registry = WorldRegistry()
+        self.assertIsNone(registry.reuse(BULLET))
+        registry.release(BULLET, 1, "old bullet", 0)
+        self.assertIsNone(registry.reuse(PLAYER))
+        self.assertEqual("old bullet", registry.reuse(BULLET))
+        self.assertIsNone(registry.reuse(BULLET))
+
+    def test_pool_is_bounded(self):
+        registry = WorldRegistry()
+        with mock.patch.object(WorldRegistryFile, "max_pooled", 2):
+            for object_id in range(1, 5):
+                registry.release(BULLET, object_id, f"bullet {object_id}", 0)
+        self.assertEqual(2, len(registry.pools[BULLET]))
+
+
+if __name__ == '__main__':
+    unittest.main()